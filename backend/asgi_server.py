@@ -0,0 +1,411 @@
+'''
+Asyncio entry point serving the same API as server.py.
+
+Database access goes through async_database_module, so a request waiting on
+MySQL or Stripe does not hold a thread. Run it with an ASGI server, e.g.
+
+    hypercorn asgi_server:app --bind 127.0.0.1:5000
+'''
+import asyncio
+import functools
+import json
+from quart import Quart, request, jsonify, make_response
+from quart_cors import cors
+import security as sc
+import async_database_module as adm
+import catalog_cache as cc
+import rcm_model as rcm
+import payments
+from connection_pool import PoolTimeoutError
+import configparser
+import os
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+ORDER_PAGE_SIZE = config.getint('orders', 'page_size', fallback=50)
+MAX_ORDER_PAGE_SIZE = config.getint('orders', 'max_page_size', fallback=200)
+CATEGORY_PAGE_SIZE = config.getint('category_pages', 'page_size', fallback=20)
+MAX_CATEGORY_PAGE_SIZE = config.getint('category_pages', 'max_page_size', fallback=100)
+MAX_RELATED_BATCH_KEYS = config.getint('recommendation', 'max_batch_keys', fallback=100)
+MAX_RELATED_K = config.getint('recommendation', 'max_k', fallback=50)
+
+SEARCH_LIMIT = config.getint('search', 'limit', fallback=5)
+MAX_SEARCH_LIMIT = config.getint('search', 'max_limit', fallback=50)
+AUTOCOMPLETE_LIMIT = config.getint('search', 'autocomplete_limit', fallback=8)
+CATALOG_CACHE_CONTROL = config.get('http_cache', 'catalog_cache_control', fallback='public, max-age=60, must-revalidate')
+
+RCM_RELOAD_INTERVAL = config.getfloat('recommendation', 'reload_interval', fallback=0)
+
+
+app = cors(Quart(__name__), expose_headers=['ETag'])
+
+
+@app.before_serving
+async def startup():
+    # Build the search structures before the first request instead of during it
+    await adm.get_search_index()
+    await adm.get_autocomplete_index()
+    if RCM_RELOAD_INTERVAL > 0:
+        rcm.start_asset_watcher(RCM_RELOAD_INTERVAL)
+
+
+@app.after_serving
+async def shutdown():
+    await adm.close_pool()
+
+
+@app.errorhandler(sc.HashingBusyError)
+async def hashing_busy(error):
+    return jsonify({'error': str(error)}), 429, {'Retry-After': '1'}
+
+
+@app.errorhandler(PoolTimeoutError)
+async def pool_timeout(error):
+    return jsonify({'error': 'Service busy, try again later.'}), 503, {'Retry-After': '1'}
+
+
+def require_auth(view):
+    '''
+    Async version of server.require_auth: call the view with the userKey of
+    the Authorization token, or reject the request.
+    '''
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({"error": "Authorization header missing"}), 401
+        userKey = sc.decode_jwt_token(token=auth_header)
+        if userKey is None:
+            return jsonify({"error": "Session expired"}), 404
+        return await view(userKey, *args, **kwargs)
+    return wrapper
+
+
+def catalog_conditional(view):
+    '''
+    Async version of server.catalog_conditional: add an ETag derived from the
+    response body and answer 304 Not Modified when the client copy is current.
+    '''
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        response = await make_response(await view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        etag = cc.catalog_etag(await response.get_data())
+
+        if request.if_none_match.contains_weak(etag):
+            response = await make_response('', 304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = CATALOG_CACHE_CONTROL
+        return response
+    return wrapper
+
+
+@app.route('/users/check_user', methods=['POST'])
+async def check_register():
+    data = await request.get_json()
+    contact_info = data.get('userId')
+
+    if not contact_info:
+        return jsonify({'error': 'Missing email or phone'}), 400
+
+    user_exists = await adm.is_registered(contact_info)
+
+    return jsonify({'result': user_exists}), 200
+
+
+@app.route('/users/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+    contact_info = data.get('userId')
+    password = data.get('password')
+    if not contact_info or not password:
+        return jsonify({'error': 'Missing email or password'}), 400
+
+    user = await adm.get_user_for_login(contact_info)
+
+    if not await asyncio.wrap_future(sc.check_password_future(user, password)):
+        return jsonify({'error': 'Invalid credentials'}), 401
+
+    token = sc.create_jwt_token(user['_key'])
+
+    return jsonify({'token': token}), 200
+
+
+@app.route('/users/signup', methods=['POST'])
+async def sign_up():
+    data = await request.get_json()
+    username = data.get('username')
+    contact_info = data.get('userId')
+    password = data.get('password')
+
+    if not username or not contact_info or not password:
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    if await adm.create_user(username, contact_info, password):
+        return jsonify({'message': 'User created successfully'}), 201
+    return jsonify({'error': 'Failed to create user'}), 400
+
+
+@app.route('/users/get-current-user', methods=['GET'])
+@require_auth
+async def getCurrentUser(userKey):
+    user = await adm.get_user_by_key(userKey)
+
+    if user is not None:
+        return jsonify({'result': user}), 200
+
+    return jsonify({'error': 'User not found'}), 404
+
+
+@app.route('/products/get-product-from-keys')
+@catalog_conditional
+async def get_product_by_keys():
+    productKeys: list = [int(key) for key in request.args.get('key').split(',')]
+
+    if not productKeys:
+        return jsonify({"error": "productKeys are required"}), 400
+
+    products: list = await cc.get_product_from_key_async(productKeys)
+
+    return jsonify({'result': products}), 200
+
+
+@app.route('/products/get-products-from-category')
+@catalog_conditional
+async def get_products_by_category():
+    category = request.args.get('category')
+
+    if not category:
+        return jsonify({"error": "Category parameter is required"}), 400
+
+    paged = any(name in request.args for name in ('sort', 'pageSize', 'cursor', 'hydrate'))
+    if paged:
+        sort = request.args.get('sort', 'newest')
+        page_size = max(1, min(request.args.get('pageSize', CATEGORY_PAGE_SIZE, type=int), MAX_CATEGORY_PAGE_SIZE))
+        try:
+            page = await cc.get_category_page_async(category, sort, page_size, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = page['productKeys']
+        if request.args.get('hydrate', 'false').lower() in ('1', 'true', 'yes'):
+            result = await cc.get_product_from_key_async(result)
+        return jsonify({'result': result, 'nextCursor': page['nextCursor']}), 200
+
+    productKeys = await cc.get_product_of_category_async(category)
+
+    if productKeys:
+        return jsonify({'result': productKeys}), 200
+    return jsonify({"error": "Products not found for the given category"}), 404
+
+
+@app.route('/products/get-all-categories')
+@catalog_conditional
+async def get_all_categories():
+    category_data_list = await cc.get_categories_async()
+
+    if category_data_list:
+        return jsonify({'result': category_data_list}), 200
+    return jsonify({"error": "Categories not found"}), 404
+
+
+@app.route('/products/search-product')
+async def search_product():
+    search_term = request.args.get('searchTerm')
+    if not search_term:
+        return jsonify({"error": "Search term parameter is required"}), 400
+
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    product_data_list: list = await adm.search_products_by_name(search_term, limit)
+
+    if product_data_list:
+        return jsonify({'result': product_data_list}), 200
+    return jsonify({"error": "Product not found"}), 404
+
+
+@app.route('/products/autocomplete')
+async def autocomplete_product():
+    prefix = request.args.get('prefix')
+    if not prefix or not prefix.strip():
+        return jsonify({"error": "Prefix parameter is required"}), 400
+
+    limit = max(1, min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), AUTOCOMPLETE_LIMIT))
+    return jsonify({'result': await adm.autocomplete_products(prefix, limit)}), 200
+
+
+@app.route('/users/add-to-cart', methods=['POST'])
+@require_auth
+async def addToCart(userKey):
+    data = await request.get_json()
+    cartItems = data['cartItems']
+
+    if await adm.add_to_cart(cartItems, userKey):
+        return jsonify({"result": "Successfully add to your cart"}), 200
+    return jsonify({"error": "Failure adding to your cart"}), 400
+
+
+@app.route('/users/remove-from-cart', methods=['DELETE'])
+@require_auth
+async def removeFromCart(userKey):
+    data = await request.get_json()
+    cartItems: list = data['cartItems']
+
+    if await adm.remove_from_cart(cartItems, userKey):
+        return jsonify({"result": "Successfully remove from your cart"}), 200
+    return jsonify({"error": "Failure removing from your cart"}), 400
+
+
+@app.route('/users/change-no-of-product-in-cart', methods=['PUT'])
+@require_auth
+async def changeNoOfProductInCart(userKey):
+    data = await request.get_json()
+
+    if await adm.change_no_of_product_in_cart(data, userKey):
+        return jsonify({"result": "Successfully change number of product in your cart"}), 200
+    return jsonify({"error": "Failure changing number of product in your cart"}), 400
+
+
+@app.route('/users/get-cart-items', methods=['GET'])
+@require_auth
+async def getCartItems(userKey):
+    cart = await adm.get_cart_of_user(userKey)
+    if cart:
+        return jsonify({"result": cart}), 200
+
+    return jsonify({"error": "Cart items not found"}), 404
+
+
+@app.route('/orders/place-order', methods=['POST'])
+@require_auth
+async def placeOrder(userKey):
+    orders = await request.get_json()
+
+    placeOrder = await adm.place_order(orders, userKey)
+    if placeOrder["result"]:
+        # Cached product documents carry the stock that was just taken
+        await cc.invalidate_products_async(placeOrder.get("productKeys", []), reindex=False)
+        return jsonify({"result": "Successfully place order"}), 200
+    if placeOrder.get("failures"):
+        return jsonify({"result": placeOrder["message"], "failures": placeOrder["failures"]}), 409
+    return jsonify({"result": placeOrder["message"]}), 400
+
+
+@app.route('/users/get-all-orders', methods=['GET'])
+@require_auth
+async def getAllOrders(userKey):
+    # Without pageSize or cursor the whole history is returned, unpaged, as
+    # clients that predate paging expect
+    paged = any(name in request.args for name in ('pageSize', 'cursor'))
+    pageSize = None
+    if paged:
+        pageSize = request.args.get('pageSize', ORDER_PAGE_SIZE, type=int)
+        pageSize = max(1, min(pageSize, MAX_ORDER_PAGE_SIZE))
+    stage = request.args.get('stage')
+    try:
+        if stage:
+            page = await adm.get_orders_by_stage(stage, pageSize, request.args.get('cursor'), userKey=userKey)
+        else:
+            page = await adm.get_orders_page(userKey, pageSize, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    orderCombinedModel = [
+        {
+            "orderModel": {
+                "_key": order["_key"],
+                "orderedDate": order["orderedDate"],
+                "userId": userKey,
+                "productDetails": {
+                    "productKey": order["productKey"],
+                    "noOfItems": order["noOfItems"],
+                    "variationQuantity": order["variationQuantity"]
+                },
+                "paidPrice": order["paidPrice"],
+                "paymentStatus": order["paymentStatus"],
+                "deliveryStages": order["deliveryStages"],
+                "deliveryAddress": order["deliveryAddress"]
+            },
+            "productDetails": order["productDetails"]
+        }
+        for order in page["orders"]
+    ]
+
+    if not paged:
+        return jsonify({"result": orderCombinedModel}), 200
+    return jsonify({"result": orderCombinedModel, "nextCursor": page["nextCursor"]}), 200
+
+
+@app.route('/products/get-related-products', methods=['GET'])
+async def getRelatedProducts():
+    productKey: int = int(request.args.get('productKey'))
+    # First use of a batch decompresses or pages in a similarity matrix: keep it off the loop
+    relatedProductKeys: list = await asyncio.to_thread(rcm.get_recommendations, productKey)
+    return jsonify({"result": relatedProductKeys}), 200
+
+
+@app.route('/products/get-related-products-batch', methods=['GET'])
+async def getRelatedProductsBatch():
+    keys = request.args.get('productKeys')
+    if not keys:
+        return jsonify({"error": "productKeys are required"}), 400
+    try:
+        productKeys: list = [int(key) for key in keys.split(',')]
+    except ValueError:
+        return jsonify({"error": "productKeys must be integers"}), 400
+    if len(productKeys) > MAX_RELATED_BATCH_KEYS:
+        return jsonify({"error": f"At most {MAX_RELATED_BATCH_KEYS} productKeys per request"}), 400
+    k = max(1, min(request.args.get('k', 10, type=int), MAX_RELATED_K))
+
+    related: dict = await asyncio.to_thread(rcm.get_recommendations_batch, productKeys, k)
+
+    if request.args.get('hydrate', 'false').lower() == 'true':
+        allKeys = list(dict.fromkeys(key for relatedKeys in related.values() for key in relatedKeys))
+        documents = {product['productDetails']['_key']: product
+                     for product in await cc.get_product_from_key_async(allKeys)}
+        related = {
+            productKey: [documents[key] for key in relatedKeys if key in documents]
+            for productKey, relatedKeys in related.items()
+        }
+
+    return jsonify({"result": {str(key): value for key, value in related.items()}}), 200
+
+
+@app.route('/users/payment', methods=['POST'])
+async def create_payment_intent():
+    try:
+        body = json.loads((await request.get_json())['body'])
+        amount = body['amount']
+        currency = body['currency']
+        auth_header = request.headers.get('Authorization')
+        userKey = sc.decode_jwt_token(token=auth_header) if auth_header else None
+        key, clientKey = payments.idempotency_key(body, userKey, request.headers.get('Idempotency-Key'))
+
+        payment_intent = await payments.create_payment_intent_async(amount, currency, key)
+
+        if payment_intent['status'] != 'succeeded':
+            result = {
+                'message': "Confirm payment please",
+                'client_secret': payment_intent['client_secret'],
+            }
+        else:
+            result = {'message': "Payment Completed Successfully"}
+        if clientKey:
+            # Sent back as Idempotency-Key on a retry of the same checkout
+            result['idempotencyKey'] = clientKey
+        return jsonify(result), 200
+
+    except payments.PaymentBusyError as e:
+        return jsonify({'error': str(e)}), 503
+    except payments.PaymentTimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        print(f'error: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1')
@@ -17,6 +17,9 @@ CREATE TABLE users (
   gst TEXT
 );
 
+-- Login and sign-up look users up by email
+CREATE INDEX idx_users_email ON users (emailId(191));
+
 -- Create the 'products' table
 CREATE TABLE products (
   _key INT AUTO_INCREMENT PRIMARY KEY,
@@ -40,6 +43,7 @@ CREATE TABLE cart_items (
   productKey INT NOT NULL,
   noOfItems INT NOT NULL,
   variationQuantity INT NOT NULL,
+  UNIQUE KEY uq_cart_items_line (userKey, productKey, variationQuantity), -- One row per cart line, target of upserts
   FOREIGN KEY (userKey) REFERENCES users(_key),
   FOREIGN KEY (productKey) REFERENCES products(_key)
 );
@@ -52,23 +56,49 @@ CREATE TABLE orders (
   orderedDate BIGINT,
   paidPrice FLOAT,
   paymentStatus INT,
-  deliveryStages TEXT,
+  deliveryStages TEXT, -- Comma-separated stages of orders placed before order_delivery_stages
+  currentStage VARCHAR(64), -- Last row of order_delivery_stages
   deliveryAddress TEXT,
   noOfItems INT NOT NULL,
   variationQuantity INT NOT NULL,
+  checkoutToken CHAR(32), -- Shared by the lines of one checkout, to read their keys back
+  checkoutLine SMALLINT, -- Position of the line in its checkout
   FOREIGN KEY (userKey) REFERENCES users(_key),
   FOREIGN KEY (productKey) REFERENCES products(_key)
 );
 
+-- Order history is paged newest first per user
+CREATE INDEX idx_orders_user_date ON orders (userKey, orderedDate, _key);
+-- Order tracking lists orders by current stage, newest first
+CREATE INDEX idx_orders_stage_date ON orders (currentStage, orderedDate, _key);
+-- The orders of one checkout are read back by token after their single INSERT
+CREATE UNIQUE INDEX uq_orders_checkout ON orders (checkoutToken, checkoutLine);
+
+-- Create the 'order_delivery_stages' table (stages an order went through, in order)
+CREATE TABLE order_delivery_stages (
+  orderKey INT NOT NULL,
+  position SMALLINT NOT NULL,
+  stage VARCHAR(64) NOT NULL,
+  PRIMARY KEY (orderKey, position),
+  FOREIGN KEY (orderKey) REFERENCES orders(_key)
+);
+
 -- Create the 'product_categories' table (many-to-many relationship table)
 CREATE TABLE product_categories (
   productKey INT NOT NULL,
   categoryKey INT NOT NULL,
+  productRating DOUBLE NOT NULL DEFAULT 0, -- Copy of products.productRating for sorting
+  minPrice DOUBLE NOT NULL DEFAULT 0, -- Lowest variations.offerPrice for sorting
   PRIMARY KEY (productKey, categoryKey), -- Composite primary key
   FOREIGN KEY (productKey) REFERENCES products(_key),
   FOREIGN KEY (categoryKey) REFERENCES categories(_key)
 );
 
+-- Category pages are read in sort order within one category
+CREATE INDEX idx_product_categories_newest ON product_categories (categoryKey, productKey);
+CREATE INDEX idx_product_categories_rating ON product_categories (categoryKey, productRating, productKey);
+CREATE INDEX idx_product_categories_price ON product_categories (categoryKey, minPrice, productKey);
+
 
 -- Create the 'reviews' table
 CREATE TABLE reviews (
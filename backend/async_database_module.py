@@ -0,0 +1,432 @@
+import asyncio
+import configparser
+import contextlib
+import os
+import database_module as dm
+import security as sc
+from connection_pool import PoolTimeoutError
+
+try:
+    import aiomysql
+except ImportError:  # Only needed by asgi_server
+    aiomysql = None
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+POOL_TIMEOUT = config.getfloat('pool', 'timeout', fallback=10.0)
+
+_pool = None
+_pool_lock = None
+
+
+async def get_pool():
+    """Return the aiomysql pool of this event loop, creating it on first use."""
+    global _pool, _pool_lock
+    if aiomysql is None:
+        raise RuntimeError("The aiomysql package is required for the async database module.")
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(
+                    host=config.get('database', 'host'),
+                    port=config.getint('database', 'port'),
+                    user=config.get('database', 'user'),
+                    password=config.get('database', 'password'),
+                    db=config.get('database', 'database'),
+                    minsize=1,
+                    maxsize=config.getint('pool', 'size', fallback=10),
+                    # Recycle idle sockets before the server's wait_timeout closes them
+                    pool_recycle=config.getint('pool', 'recycle', fallback=3600),
+                    autocommit=False
+                )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        pool.close()
+        await pool.wait_closed()
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {}
+    return {'size': _pool.size, 'free': _pool.freesize, 'max_size': _pool.maxsize}
+
+
+@contextlib.asynccontextmanager
+async def connection():
+    """
+    Check a connection out of the pool, waiting up to [pool] timeout seconds.
+
+    Raises:
+        PoolTimeoutError: If every connection stays checked out until the deadline.
+    """
+    pool = await get_pool()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError as e:
+        raise PoolTimeoutError(f"No connection available within {POOL_TIMEOUT} seconds.") from e
+    try:
+        yield conn
+    finally:
+        # With autocommit off even a plain SELECT leaves a transaction open, and
+        # the pool closes a connection released inside one instead of reusing
+        # it: end it first, as connection_pool does for the sync module
+        try:
+            if conn.get_transaction_status():
+                await conn.rollback()
+        except Exception:
+            conn.close()
+        pool.release(conn)
+
+
+async def _fetchall(sql, params=None) -> list:
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, params)
+            return list(await cursor.fetchall())
+
+
+async def _fetch_user(cursor, userKey):
+    await cursor.execute(dm._USER_SQL, (userKey,))
+    user_data = await cursor.fetchone()
+
+    if not user_data:
+        return None
+
+    await cursor.execute(dm._USER_ORDER_KEYS_SQL, (userKey,))
+    orders_data = await cursor.fetchall()
+    await cursor.execute(dm._USER_CART_SQL, (userKey,))
+    cart_items_data = await cursor.fetchall()
+    return dm._user_document(user_data, orders_data, cart_items_data)
+
+
+async def get_user_by_key(userKey):
+    # Outside the try: a pool timeout must reach the app's 503 handler
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                return await _fetch_user(cursor, userKey)
+        except Exception:
+            return None
+
+
+async def get_cart_of_user(userKey):
+    """Async equivalent of database_module.get_cart_of_user."""
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                user = await _fetch_user(cursor, userKey)
+                if user is None:
+                    return None
+
+                documents = await _fetch_product_documents(cursor, [item["productKey"] for item in user["cartItems"]])
+        except Exception:
+            return None
+    cartModels = [
+        {
+            "cartItemDetails": item,
+            "productDetails": documents[item["productKey"]]["productDetails"]
+        }
+        for item in user["cartItems"]
+        if item["productKey"] in documents
+    ]
+    return {
+        "userDetails": user,
+        "cartModels": cartModels
+    }
+
+
+async def is_registered(contact_info) -> bool:
+    if not contact_info:
+        return False
+    return bool(await _fetchall(dm._USER_BY_EMAIL_SQL, (contact_info,)))
+
+
+async def get_user_for_login(contact_info) -> dict:
+    rows = await _fetchall(dm._LOGIN_SQL, (contact_info,))
+    if not rows:
+        return None
+    return {
+        '_key': rows[0][0],
+        'hashed_password': rows[0][1]
+    }
+
+
+async def create_user(username, contact_info, password) -> bool:
+    """
+    Raises:
+        HashingBusyError: If the password cannot be hashed now.
+    """
+    try:
+        hashed_password = await asyncio.wrap_future(sc.generate_password_hash_future(password))
+    except sc.HashingBusyError:
+        raise
+    except Exception:
+        return False
+
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.execute(dm._CREATE_USER_SQL, dm._new_user_params(username, contact_info, hashed_password))
+            await conn.commit()
+            return True
+        except Exception:
+            return False
+
+
+async def get_categories() -> list:
+    return dm._category_documents(await _fetchall(dm._CATEGORIES_SQL))
+
+
+async def get_product_of_category(category) -> list:
+    return [row[0] for row in await _fetchall(dm._CATEGORY_PRODUCTS_SQL, (category,))]
+
+
+async def get_category_page(category, sort: str = 'newest', page_size: int = 20, cursor: str = None) -> dict:
+    """
+    Async equivalent of database_module.get_category_page.
+
+    Raises:
+        ValueError: If ``sort`` or ``cursor`` is invalid.
+    """
+    query, params = dm._category_page_query(category, sort, page_size, cursor)
+    return dm._category_page(await _fetchall(query, params), page_size)
+
+
+async def _fetch_product_documents(cursor, keys) -> dict:
+    unique_keys = list(dict.fromkeys(keys))
+    documents = {}
+    for chunk in dm._chunks(unique_keys):
+        params = tuple(chunk)
+        rows = []
+        for sql in (dm._PRODUCTS_SQL, dm._PRODUCT_CATEGORIES_SQL, dm._PRODUCT_REVIEWS_SQL, dm._PRODUCT_VARIATIONS_SQL):
+            await cursor.execute(sql.format(dm._placeholders(chunk)), params)
+            rows.append(await cursor.fetchall())
+        documents.update(dm._assemble_product_documents(*rows))
+    return documents
+
+
+async def get_product_from_key(keys: list) -> list:
+    """Async equivalent of database_module.get_product_from_key."""
+    if not keys:
+        return []
+
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            documents = await _fetch_product_documents(cursor, keys)
+
+    return [documents[key] for key in keys if key in documents]
+
+
+# The search structures live in database_module and are shared with it; only
+# loading their rows is done here
+_search_lock = None
+_autocomplete_lock = None
+
+
+async def get_search_index():
+    global _search_lock
+    if _search_lock is None:
+        _search_lock = asyncio.Lock()
+    if dm._search_index is None:
+        async with _search_lock:
+            if dm._search_index is None:
+                dm._install_search_index(await _fetchall(*dm._search_rows_query()))
+    return dm._search_index
+
+
+async def refresh_search_index(keys=None):
+    """Async equivalent of database_module.refresh_search_index."""
+    index = dm._search_index
+    if index is None:
+        return
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        rows = await _fetchall(*dm._search_rows_query(keys=keys))
+    else:
+        rows = await _fetchall(*dm._search_rows_query(after_key=index.max_key))
+    dm._update_search_index(index, rows, keys)
+
+
+async def search_products_by_name(search_term, limit=5) -> list:
+    index = await get_search_index()
+    if dm.search_index_stale():
+        await refresh_search_index()
+    return index.search(search_term, limit)
+
+
+async def get_autocomplete_index():
+    global _autocomplete_lock
+    if _autocomplete_lock is None:
+        _autocomplete_lock = asyncio.Lock()
+    if dm._autocomplete_index is None:
+        async with _autocomplete_lock:
+            if dm._autocomplete_index is None:
+                dm._install_autocomplete_index(await _fetchall(*dm._autocomplete_rows_query()))
+    return dm._autocomplete_index
+
+
+async def refresh_autocomplete_index(keys=None):
+    """Async equivalent of database_module.refresh_autocomplete_index."""
+    trie = dm._autocomplete_index
+    if trie is None:
+        return
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        rows = await _fetchall(*dm._autocomplete_rows_query(keys=keys))
+    else:
+        rows = await _fetchall(*dm._autocomplete_rows_query(after_key=trie.max_key))
+    dm._update_autocomplete_index(trie, rows, keys)
+
+
+async def autocomplete_products(prefix, limit=8) -> list:
+    trie = await get_autocomplete_index()
+    if dm.autocomplete_index_stale():
+        await refresh_autocomplete_index()
+    return [{'_key': key, 'productName': name} for key, name in trie.suggest(prefix, limit)]
+
+
+async def _run_statements(statements) -> bool:
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                for statement in statements:
+                    await cursor.execute(*statement)
+            await conn.commit()
+            return True
+        except aiomysql.Error as e:
+            print(f"An error occurred: {e}")
+            await conn.rollback()
+            return False
+
+
+async def add_to_cart(cartItems, userKey) -> bool:
+    """Async equivalent of database_module.add_to_cart."""
+    lines = dm._cart_lines(cartItems)
+    if not lines:
+        return True
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(dm._ADD_TO_CART_SQL, dm._add_to_cart_rows(lines, userKey))
+            await conn.commit()
+            return True
+        except aiomysql.Error as e:
+            print(f"An error occurred: {e}")
+            await conn.rollback()
+            return False
+
+
+async def remove_from_cart(cartItems: list, userKey: int) -> bool:
+    """Async equivalent of database_module.remove_from_cart."""
+    lines = dm._cart_lines(cartItems)
+    if not lines:
+        return True
+    return await _run_statements(dm._remove_from_cart_statements(lines, userKey))
+
+
+async def change_no_of_product_in_cart(data: dict, userKey: int) -> bool:
+    return await _run_statements(dm._change_cart_statements(data, userKey))
+
+
+async def place_order(orders: dict, user_key: int) -> dict:
+    """
+    Async equivalent of database_module.place_order, running the same statements
+    in one transaction.
+    """
+    try:
+        plan = dm._OrderPlan(orders, user_key)
+    except ValueError as e:
+        return {"result": False,
+                "message": str(e)}
+    if not plan.lines:
+        return {"result": False,
+                "message": "No order lines"}
+
+    async with connection() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                if dm.RESERVE_STOCK:
+                    await cursor.execute(*plan.reserve_stock())
+                    if cursor.rowcount < len(plan.demand):
+                        await cursor.execute(*plan.stock())
+                        failures = plan.stock_failures(await cursor.fetchall())
+                        await conn.rollback()
+                        return {"result": False,
+                                "message": "Insufficient stock",
+                                "failures": failures}
+
+                await cursor.execute(*plan.insert_orders())
+                await cursor.execute(*plan.order_keys())
+                stage_rows = plan.stage_rows(await cursor.fetchall())
+                if stage_rows:
+                    await cursor.executemany(plan.INSERT_STAGES_SQL, stage_rows)
+                await cursor.execute(*plan.clear_cart())
+
+            await conn.commit()
+        except aiomysql.Error as e:
+            print(f"An error occurred: {e}")
+            await conn.rollback()
+            return {"result": False,
+                    "message": str(e)}
+
+    product_counts = plan.product_counts()
+    dm.record_product_orders(product_counts)
+    return {"result": True,
+            "message": "Successful",
+            "productKeys": list(product_counts)}
+
+
+async def _orders_from_rows(cursor, rows) -> list:
+    stage_rows = []
+    for chunk in dm._chunks([row[0] for row in rows]):
+        await cursor.execute(dm._ORDER_STAGES_SQL.format(dm._placeholders(chunk)), tuple(chunk))
+        stage_rows += await cursor.fetchall()
+    return dm._order_documents(rows, stage_rows)
+
+
+async def _orders_page(condition: str, params: list, page_size: int = None, cursor: str = None) -> dict:
+    query, params = dm._orders_page_query(condition, params, page_size, cursor)
+
+    async with connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            orders = await _orders_from_rows(cur, rows[:page_size])
+            documents = await _fetch_product_documents(cur, [order['productKey'] for order in orders])
+    return dm._orders_page_result(orders, documents, page_size is not None and len(rows) > page_size)
+
+
+async def get_orders_page(userKey, page_size: int = None, cursor: str = None) -> dict:
+    """
+    Async equivalent of database_module.get_orders_page.
+
+    Raises:
+        ValueError: If ``cursor`` is invalid.
+    """
+    return await _orders_page("userKey = %s", [userKey], page_size, cursor)
+
+
+async def get_orders_by_stage(stage: str, page_size: int = None, cursor: str = None, userKey=None) -> dict:
+    """
+    Async equivalent of database_module.get_orders_by_stage.
+
+    Raises:
+        ValueError: If ``cursor`` is invalid.
+    """
+    if userKey is None:
+        return await _orders_page("currentStage = %s", [stage], page_size, cursor)
+    return await _orders_page("userKey = %s AND currentStage = %s", [userKey, stage], page_size, cursor)
@@ -0,0 +1,168 @@
+import heapq
+import threading
+from search_index import tokenize
+
+
+class _Node:
+    __slots__ = ('children', 'keys', 'tail', 'top')
+
+    def __init__(self):
+        self.children = None  # char -> _Node, created on first child
+        self.keys = None      # product keys whose suggestion string ends here
+        self.tail = None      # (string, key) of longer strings, at max depth only
+        self.top = ()         # best (-weight, key) pairs of the whole subtree
+
+
+class PrefixTrie:
+    """
+    Depth-limited prefix trie over product names for typeahead suggestions.
+
+    A name is reachable from the start of each of its words ("dark" finds "The
+    Dark Knight"). Every node keeps the best ``max_suggestions`` products of its
+    subtree, so a lookup is a walk of ``len(prefix)`` nodes. Below ``max_depth``
+    characters strings are kept in a flat tail list instead of more nodes, which
+    bounds the node count.
+    """
+
+    def __init__(self, max_suggestions: int = 10, max_depth: int = 12):
+        self.max_suggestions = max_suggestions
+        self.max_depth = max_depth
+        self._root = _Node()
+        self._names = {}    # product key -> display name
+        self._weights = {}  # product key -> popularity
+        self._lock = threading.RLock()
+        self.max_key = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    @staticmethod
+    def _strings(name: str) -> set:
+        words = tokenize(name)
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def build(self, entries):
+        """Replace the content with (key, name, weight) entries."""
+        with self._lock:
+            self._root = _Node()
+            self._names, self._weights = {}, {}
+            for key, name, weight in entries:
+                self._names[key] = name
+                self._weights[key] = weight or 0
+                for string in self._strings(name):
+                    self._insert(string, key)
+                self.max_key = max(self.max_key, key)
+            self._recompute(self._root)
+
+    def _path(self, string: str, create: bool) -> list:
+        node, path = self._root, [self._root]
+        for ch in string[:self.max_depth]:
+            if node.children is None or ch not in node.children:
+                if not create:
+                    return path
+                if node.children is None:
+                    node.children = {}
+                node.children[ch] = _Node()
+            node = node.children[ch]
+            path.append(node)
+        return path
+
+    def _insert(self, string: str, key) -> list:
+        path = self._path(string, create=True)
+        node = path[-1]
+        if len(string) > self.max_depth:
+            if node.tail is None:
+                node.tail = []
+            node.tail.append((string, key))
+        else:
+            if node.keys is None:
+                node.keys = set()
+            node.keys.add(key)
+        return path
+
+    def _delete(self, string: str, key) -> list:
+        path = self._path(string, create=False)
+        node = path[-1]
+        if len(string) > self.max_depth:
+            if node.tail:
+                node.tail = [entry for entry in node.tail if entry[1] != key] or None
+        elif node.keys:
+            node.keys.discard(key)
+        return path
+
+    def _node_candidates(self, node) -> set:
+        candidates = set(node.keys or ())
+        candidates.update(key for _, key in node.tail or ())
+        return candidates
+
+    def _refresh_top(self, node):
+        candidates = {(-self._weights[key], key) for key in self._node_candidates(node)}
+        for child in (node.children or {}).values():
+            candidates.update(child.top)
+        node.top = tuple(heapq.nsmallest(self.max_suggestions, candidates))
+
+    def _recompute(self, node):
+        for child in (node.children or {}).values():
+            self._recompute(child)
+        self._refresh_top(node)
+
+    def _refresh_paths(self, paths):
+        nodes = {}
+        for path in paths:
+            for depth, node in enumerate(path):
+                nodes[id(node)] = (depth, node)
+        # Deepest first so every parent merges refreshed children
+        for _, node in sorted(nodes.values(), key=lambda item: -item[0]):
+            self._refresh_top(node)
+
+    def upsert(self, key, name: str, weight=None):
+        with self._lock:
+            paths = self._remove(key)
+            self._names[key] = name
+            self._weights[key] = self._weights.get(key, 0) if weight is None else weight
+            paths += [self._insert(string, key) for string in self._strings(name)]
+            self._refresh_paths(paths)
+            self.max_key = max(self.max_key, key)
+
+    def add_weight(self, key, amount):
+        """Increase the popularity of a product, e.g. when it is ordered."""
+        with self._lock:
+            if key in self._names:
+                self._weights[key] += amount
+                self._refresh_paths([self._path(string, create=False) for string in self._strings(self._names[key])])
+
+    def remove(self, key):
+        with self._lock:
+            self._refresh_paths(self._remove(key))
+
+    def _remove(self, key) -> list:
+        name = self._names.pop(key, None)
+        if name is None:
+            return []
+        paths = [self._delete(string, key) for string in self._strings(name)]
+        # Keep the weight: it is popularity, still valid if the product is renamed
+        return paths
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """
+        Return up to ``limit`` (key, name) suggestions for ``prefix``, most popular first.
+        """
+        words = tokenize(prefix)
+        if not words or limit <= 0:
+            return []
+        # A trailing space means the last word is complete ("war " skips "warcraft")
+        prefix = ' '.join(words) + (' ' if prefix[-1].isspace() else '')
+        with self._lock:
+            path = self._path(prefix, create=False)
+            if len(path) - 1 < min(len(prefix), self.max_depth):
+                return []
+            node = path[-1]
+            if len(prefix) <= self.max_depth:
+                best = node.top[:limit]
+            else:
+                keys = set()
+                for string, key in node.tail or ():
+                    if string.startswith(prefix):
+                        keys.add(key)
+                best = heapq.nsmallest(limit, ((-self._weights[key], key) for key in keys))
+            return [(key, self._names[key]) for _, key in best]
@@ -0,0 +1,49 @@
+'''
+Measure the authentication overhead of one request, with and without the
+verified-token cache of security.decode_jwt_token.
+
+    python bench_auth.py --iterations 20000
+'''
+import argparse
+import time
+from unittest.mock import patch
+import security as sc
+from server import app, require_auth
+
+
+def per_call(function, iterations: int) -> float:
+    '''Return the mean microseconds per call.'''
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request authentication overhead.")
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    token = sc.create_jwt_token(1)
+    view = require_auth(lambda userKey: userKey)
+
+    def decode():
+        sc.decode_jwt_token(token=token)
+
+    with app.test_request_context(headers={'Authorization': token}):
+        results = {}
+        with patch('security.TOKEN_CACHE_SIZE', 0):
+            results['decode, uncached'] = per_call(decode, args.iterations)
+            results['require_auth, uncached'] = per_call(view, args.iterations)
+        sc.clear_token_cache()
+        decode()
+        results['decode, cached'] = per_call(decode, args.iterations)
+        results['require_auth, cached'] = per_call(view, args.iterations)
+
+    for name, micros in results.items():
+        print(f"{name:<24} {micros:8.2f} us/request")
+    print(f"speedup {results['require_auth, uncached'] / results['require_auth, cached']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
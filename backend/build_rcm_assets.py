@@ -0,0 +1,127 @@
+import argparse
+import os
+import time
+import numpy as np
+import rcm_model as rcm
+
+
+def build_topk(args):
+    start = time.perf_counter()
+    ids, scores = rcm.build_topk_index(rcm.open_store(args.source), args.k)
+    rcm.save_topk_index(args.output, ids, scores)
+    print(f"Wrote top-{args.k} index for {ids.shape[0]} movies to {args.output} "
+          f"({ids.nbytes + scores.nbytes} bytes) in {time.perf_counter() - start:.1f}s")
+
+
+def build_npy(args):
+    start = time.perf_counter()
+    store = rcm.SimilarityStore(args.source)
+    rcm.write_npy_store(store, args.output_dir)
+    print(f"Wrote {len(store)} batches to {args.output_dir} in {time.perf_counter() - start:.1f}s")
+
+
+def store_size(path) -> int:
+    path = rcm.resolve_store_path(path)
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def compare_stores(reference, candidate, k=10, sample=None, seed=0) -> dict:
+    """
+    Compare the top-``k`` recommendations served by two stores.
+
+    Args:
+        reference: Store holding the original dense float64 batches.
+        candidate: Store to evaluate.
+        k: Depth of the compared recommendation lists.
+        sample: Number of random movies to compare, all movies if None.
+
+    Returns:
+        dict: movies compared, mean overlap of the top-k sets (1.0 is perfect),
+        share of movies with an identical ordered list, and the worst overlap.
+    """
+    movie_ids = np.concatenate([
+        index * rcm.batch_size + np.arange(rows)
+        for index, rows in enumerate(reference.batch_rows())
+    ])
+    if sample is not None and sample < len(movie_ids):
+        movie_ids = np.random.default_rng(seed).choice(movie_ids, sample, replace=False)
+
+    overlaps = []
+    identical = 0
+    for movie_id in movie_ids:
+        expected, _ = reference.neighbours(int(movie_id), k)
+        actual, _ = candidate.neighbours(int(movie_id), k)
+        overlaps.append(len(set(expected.tolist()) & set(actual.tolist())) / max(len(expected), 1))
+        identical += expected.tolist() == actual.tolist()
+
+    return {
+        'movies': len(movie_ids),
+        'mean_overlap': float(np.mean(overlaps)) if overlaps else 1.0,
+        'identical': identical / len(movie_ids) if len(movie_ids) else 1.0,
+        'min_overlap': float(np.min(overlaps)) if overlaps else 1.0,
+    }
+
+
+def convert(args):
+    start = time.perf_counter()
+    source = rcm.SimilarityStore(args.source)
+    if args.format == 'float16':
+        rcm.write_npy_store(source, args.output_dir, dtype=np.float16)
+    elif args.format == 'float32':
+        rcm.write_npy_store(source, args.output_dir, dtype=np.float32)
+    else:
+        rcm.write_sparse_store(source, args.output_dir, args.k)
+    print(f"Wrote {args.format} store to {args.output_dir} in {time.perf_counter() - start:.1f}s")
+    if not args.no_report:
+        report(argparse.Namespace(reference=args.source, candidate=args.output_dir,
+                                  depth=args.depth, sample=args.sample))
+
+
+def report(args):
+    result = compare_stores(rcm.SimilarityStore(args.reference), rcm.SimilarityStore(args.candidate),
+                            k=args.depth, sample=args.sample)
+    print(f"Size: {store_size(args.reference)} -> {store_size(args.candidate)} bytes")
+    print(f"Top-{args.depth} over {result['movies']} movies: mean overlap {result['mean_overlap']:.4f}, "
+          f"identical lists {result['identical']:.2%}, worst overlap {result['min_overlap']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline build steps for the recommendation assets.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    topk = subparsers.add_parser('topk', help="Precompute the top-K neighbour table.")
+    topk.add_argument('--source', default=None, help="npz archive or npy directory, defaults to the served one.")
+    topk.add_argument('--output', default=rcm.topk_index_path)
+    topk.add_argument('--k', type=int, default=50, help="Neighbours kept per movie.")
+    topk.set_defaults(func=build_topk)
+
+    npy = subparsers.add_parser('npy', help="Convert the npz archive to memory-mappable per-batch .npy files.")
+    npy.add_argument('--source', default=rcm.npz_path)
+    npy.add_argument('--output-dir', default=rcm.assets_dir)
+    npy.set_defaults(func=build_npy)
+
+    conversion = subparsers.add_parser('convert', help="Write a reduced-precision or sparse top-K store.")
+    conversion.add_argument('--format', choices=['float16', 'float32', 'sparse'], required=True)
+    conversion.add_argument('--source', default=rcm.npz_path)
+    conversion.add_argument('--output-dir', required=True)
+    conversion.add_argument('--k', type=int, default=50, help="Entries kept per row for the sparse format.")
+    conversion.add_argument('--depth', type=int, default=10, help="Recommendation depth compared in the report.")
+    conversion.add_argument('--sample', type=int, default=None, help="Movies compared in the report, all by default.")
+    conversion.add_argument('--no-report', action='store_true')
+    conversion.set_defaults(func=convert)
+
+    comparison = subparsers.add_parser('report', help="Compare the recommendations of two stores.")
+    comparison.add_argument('--reference', default=rcm.npz_path)
+    comparison.add_argument('--candidate', required=True)
+    comparison.add_argument('--depth', type=int, default=10)
+    comparison.add_argument('--sample', type=int, default=None)
+    comparison.set_defaults(func=report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
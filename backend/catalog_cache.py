@@ -0,0 +1,389 @@
+import asyncio
+import configparser
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import database_module as dm
+import async_database_module as adm
+
+try:
+    import redis
+except ImportError:  # Only needed for backend=redis
+    redis = None
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+
+def _encode(value) -> str:
+    return json.dumps(value, default=str, separators=(',', ':'))
+
+
+class LocalBackend:
+    """
+    In-process store with per-entry TTL and an approximate memory bound.
+
+    Entries are sized by their JSON encoding; least recently used entries are
+    evicted once the total goes over ``max_bytes``. Values are shared with the
+    callers, who must treat them as read-only.
+    """
+
+    # Calls only take a lock around in-memory work, so the async helpers make them inline
+    blocking = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, expires at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._version = 0
+        self._updated_at = time.time()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def get_many(self, keys) -> dict:
+        return {key: value for key in keys if (value := self.get(key)) is not None}
+
+    def set(self, key, value, ttl: float):
+        size = len(_encode(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            self._updated_at = time.time()
+            return self._version
+
+    def version_info(self) -> tuple:
+        with self._lock:
+            return self._version, self._updated_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+
+class RedisBackend:
+    """
+    Store shared by every process through a Redis-compatible server.
+
+    Values are stored as JSON with the TTL set on the key; the memory bound is the
+    server's own ``maxmemory`` with an LRU eviction policy.
+    """
+
+    # Every call is a network round trip: the async helpers run them in a thread
+    blocking = True
+
+    def __init__(self, url: str, prefix: str = 'ali33:catalog:'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for the redis catalog cache backend.")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._client.set(self._prefix + 'updated_at', time.time(), nx=True)
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def get_many(self, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        raws = self._client.mget([self._prefix + key for key in keys])
+        return {key: json.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+
+    def set(self, key, value, ttl: float):
+        self._client.set(self._prefix + key, _encode(value), px=max(1, int(ttl * 1000)))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self._prefix + key for key in keys])
+
+    def clear(self):
+        keys = [key for key in self._client.scan_iter(self._prefix + '*')
+                if not key.decode().endswith(('version', 'updated_at'))]
+        if keys:
+            self._client.delete(*keys)
+
+    def bump_version(self) -> int:
+        pipe = self._client.pipeline()
+        pipe.incr(self._prefix + 'version')
+        pipe.set(self._prefix + 'updated_at', time.time())
+        return pipe.execute()[0]
+
+    def version_info(self) -> tuple:
+        version, updated_at = self._client.mget([self._prefix + 'version', self._prefix + 'updated_at'])
+        return int(version or 0), float(updated_at or 0)
+
+    def stats(self) -> dict:
+        info = self._client.info('memory')
+        return {'bytes': info.get('used_memory'), 'max_bytes': info.get('maxmemory')}
+
+
+class CatalogCache:
+    """
+    Read-through cache for catalog data: categories, hydrated product documents
+    and the product keys of each category.
+
+    Every invalidation bumps the catalog version, which clients can use to tell
+    whether the catalog changed.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key: str, loader):
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = loader()
+        if value is not None:
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def get_many_or_load(self, keys: dict, loader) -> dict:
+        """
+        Look up several entries at once and load the missing ones with one call.
+
+        Args:
+            keys: item -> cache key.
+            loader: Called with the list of missing items, returns item -> value.
+
+        Returns:
+            dict: item -> value, for the items that exist.
+        """
+        cached = self.backend.get_many(keys.values())
+        result = {item: cached[key] for item, key in keys.items() if key in cached}
+        self.hits += len(result)
+        missing = [item for item in keys if item not in result]
+        self.misses += len(missing)
+        if missing:
+            loaded = loader(missing)
+            for item, value in loaded.items():
+                self.backend.set(keys[item], value, self.ttl)
+            result.update(loaded)
+        return result
+
+    async def offload(self, function, *args):
+        """Call ``function(*args)``, in a thread if it uses a blocking backend, so the event loop keeps running."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _set_many(self, entries: dict):
+        for key, value in entries.items():
+            self.backend.set(key, value, self.ttl)
+
+    async def get_or_load_async(self, key: str, loader):
+        """get_or_load with a coroutine function as loader."""
+        value = await self.offload(self.backend.get, key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await loader()
+        if value is not None:
+            await self.offload(self.backend.set, key, value, self.ttl)
+        return value
+
+    async def get_many_or_load_async(self, keys: dict, loader) -> dict:
+        """get_many_or_load with a coroutine function as loader."""
+        cached = await self.offload(self.backend.get_many, list(keys.values()))
+        result = {item: cached[key] for item, key in keys.items() if key in cached}
+        self.hits += len(result)
+        missing = [item for item in keys if item not in result]
+        self.misses += len(missing)
+        if missing:
+            loaded = await loader(missing)
+            await self.offload(self._set_many, {keys[item]: value for item, value in loaded.items()})
+            result.update(loaded)
+        return result
+
+    def invalidate(self, *keys: str) -> int:
+        self.backend.delete(*keys)
+        return self.backend.bump_version()
+
+    def clear(self) -> int:
+        self.backend.clear()
+        return self.backend.bump_version()
+
+    def version_info(self) -> tuple:
+        return self.backend.version_info()
+
+    def stats(self) -> dict:
+        stats = self.backend.stats()
+        stats.update({'hits': self.hits, 'misses': self.misses})
+        return stats
+
+
+def _create_cache() -> CatalogCache:
+    ttl = config.getfloat('catalog_cache', 'ttl', fallback=300)
+    if config.get('catalog_cache', 'backend', fallback='local') == 'redis':
+        backend = RedisBackend(config.get('catalog_cache', 'redis_url', fallback='redis://localhost:6379/0'))
+    else:
+        backend = LocalBackend(int(config.getfloat('catalog_cache', 'max_memory_mb', fallback=64) * 1024 * 1024))
+    return CatalogCache(backend, ttl)
+
+
+cache = _create_cache()
+
+
+def _product_cache_key(productKey) -> str:
+    return f'product:{productKey}'
+
+
+def _category_cache_key(category) -> str:
+    return f'category_products:{category}'
+
+
+def get_categories() -> list:
+    return cache.get_or_load('categories', dm.get_categories)
+
+
+def get_product_of_category(category) -> list:
+    return cache.get_or_load(_category_cache_key(category), lambda: dm.get_product_of_category(category))
+
+
+def _category_page_cache_key(category, sort: str, page_size: int, cursor: str = None) -> str:
+    version, _ = cache.version_info()
+    return f'category_page:{version}:{category}:{sort}:{page_size}:{cursor or ""}'
+
+
+def get_category_page(category, sort: str, page_size: int, cursor: str = None) -> dict:
+    """
+    Cached equivalent of database_module.get_category_page.
+
+    The catalog version is part of the cache key, so any invalidation retires
+    every cached page at once without tracking them.
+    """
+    return cache.get_or_load(_category_page_cache_key(category, sort, page_size, cursor),
+                             lambda: dm.get_category_page(category, sort, page_size, cursor))
+
+
+def get_product_from_key(keys: list) -> list:
+    """Cached equivalent of database_module.get_product_from_key, same order and duplicates."""
+    def load(missing):
+        return {product['productDetails']['_key']: product for product in dm.get_product_from_key(missing)}
+
+    documents = cache.get_many_or_load({key: _product_cache_key(key) for key in keys}, load)
+    return [documents[key] for key in keys if key in documents]
+
+
+# Same entries, loaded through async_database_module for the ASGI server
+
+async def get_categories_async() -> list:
+    return await cache.get_or_load_async('categories', adm.get_categories)
+
+
+async def get_product_of_category_async(category) -> list:
+    return await cache.get_or_load_async(_category_cache_key(category), lambda: adm.get_product_of_category(category))
+
+
+async def get_category_page_async(category, sort: str, page_size: int, cursor: str = None) -> dict:
+    key = await cache.offload(_category_page_cache_key, category, sort, page_size, cursor)
+    return await cache.get_or_load_async(key, lambda: adm.get_category_page(category, sort, page_size, cursor))
+
+
+async def get_product_from_key_async(keys: list) -> list:
+    async def load(missing):
+        return {product['productDetails']['_key']: product for product in await adm.get_product_from_key(missing)}
+
+    documents = await cache.get_many_or_load_async({key: _product_cache_key(key) for key in keys}, load)
+    return [documents[key] for key in keys if key in documents]
+
+
+def invalidate_products(keys, reindex: bool = True) -> int:
+    """
+    Drop the cached documents of the given products, e.g. after a stock or price change.
+
+    Pass ``reindex=False`` when only the stock changed, to skip refreshing the
+    search structures and the category sort keys.
+    """
+    keys = list(keys)
+    if not keys:
+        return catalog_version()[0]
+    if reindex:
+        dm.refresh_category_sort_keys(keys)
+        dm.refresh_search_index(keys)
+        dm.refresh_autocomplete_index(keys)
+    return cache.invalidate(*[_product_cache_key(key) for key in keys])
+
+
+async def invalidate_products_async(keys, reindex: bool = True) -> int:
+    """invalidate_products for the ASGI server, run in a thread: it may reach Redis and MySQL."""
+    return await asyncio.to_thread(invalidate_products, keys, reindex)
+
+
+def invalidate_categories() -> int:
+    return cache.invalidate('categories')
+
+
+def invalidate_category(category) -> int:
+    return cache.invalidate(_category_cache_key(category))
+
+
+def invalidate_all() -> int:
+    dm.rebuild_search_index()
+    dm.rebuild_autocomplete_index()
+    return cache.clear()
+
+
+def catalog_version() -> tuple:
+    """Return (version, updated at timestamp) of the catalog."""
+    return cache.version_info()
+
+
+def catalog_etag(body: bytes) -> str:
+    """
+    Return the ETag of a rendered catalog response.
+
+    The tag is a hash of the body itself, so it changes whenever the data does,
+    invalidated or not, and every worker derives the same tag for the same data.
+    """
+    return hashlib.sha1(body).hexdigest()
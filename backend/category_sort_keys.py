@@ -0,0 +1,12 @@
+# Copy the sort values used to page through categories into product_categories.
+# Shared by database_module, migrate.py and initialize_database.py, which loads
+# it without importing the rest of the backend.
+CATEGORY_SORT_KEYS_SQL = """
+    UPDATE product_categories pc
+    JOIN products p ON p._key = pc.productKey
+    LEFT JOIN (
+        SELECT productKey, MIN(offerPrice) AS minPrice FROM variations GROUP BY productKey
+    ) v ON v.productKey = pc.productKey
+    SET pc.productRating = COALESCE(p.productRating, 0),
+        pc.minPrice = COALESCE(v.minPrice, 0)
+"""
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection is returned to the pool before the checkout timeout."""
+
+
+class PooledConnection:
+    """
+    Proxy around a checked out connection.
+
+    Every attribute is forwarded to the real connection except ``close``, which
+    returns the connection to its pool instead of closing the socket, so the
+    existing ``finally: conn.close()`` blocks release connections correctly.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise AttributeError(f"connection already returned to the pool: {name}")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections with checkout/return semantics.
+
+    Args:
+        factory: Callable creating a new connection.
+        size: Maximum number of open connections.
+        timeout: Seconds to wait for a free connection before PoolTimeoutError.
+        health_check_interval: Idle seconds after which a connection is pinged
+            before being handed out again.
+    """
+
+    def __init__(self, factory, size=10, timeout=10.0, health_check_interval=30.0):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self._factory = factory
+        self._size = size
+        self._timeout = timeout
+        self._health_check_interval = health_check_interval
+        self._idle = deque()  # (connection, last returned at)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    def get_connection(self, timeout=None) -> PooledConnection:
+        """
+        Check a connection out of the pool, waiting up to ``timeout`` seconds.
+
+        Raises:
+            PoolTimeoutError: If every connection stays checked out until the deadline.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        conn, last_used = None, None
+        with self._cond:
+            waited = False
+            while True:
+                if self._idle:
+                    # LIFO keeps the most recently used connections warm
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self._size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(f"No connection available within {timeout} seconds.")
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self._health_check_interval:
+                if not self._is_alive(conn):
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self._factory()
+                with self._cond:
+                    self._stats['created'] += 1
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, conn)
+
+    def _is_alive(self, conn) -> bool:
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+
+    def _release(self, conn):
+        # End any transaction left open (including the read snapshot of a plain
+        # SELECT) so the next borrower does not inherit it
+        try:
+            if getattr(conn, 'in_transaction', False):
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection. Checked out connections are closed when returned."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        """Return a snapshot of the pool counters and current occupancy."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        return stats
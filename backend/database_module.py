@@ -1,30 +1,148 @@
+import base64
 import datetime
-import sqlite3
+import json
 from flask import jsonify
 import threading
+import time
+import uuid
 import mysql.connector
 import security as sc
 import configparser
 import os
+from connection_pool import ConnectionPool
+from search_index import SearchIndex
+from autocomplete import PrefixTrie
+from category_sort_keys import CATEGORY_SORT_KEYS_SQL
 
 
 # initiate
 config = configparser.ConfigParser()
 config.read(os.path.abspath('config.ini'))
 
-thread_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _connect():
+    return mysql.connector.connect( 
+        host=config.get('database', 'host'),
+        port=config.get('database', 'port'), 
+        user=config.get('database', 'user'),
+        password=config.get('database', 'password'),
+        database=config.get('database', 'database')
+    )
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _connect,
+                    size=config.getint('pool', 'size', fallback=10),
+                    timeout=config.getfloat('pool', 'timeout', fallback=10.0),
+                    health_check_interval=config.getfloat('pool', 'health_check_interval', fallback=30.0)
+                )
+    return _pool
+
 
 def get_db_connection():
-    if not hasattr(thread_local, 'db_conn'):
-        thread_local.db_conn = mysql.connector.connect( 
-            host=config.get('database', 'host'),
-            port=config.get('database', 'port'), 
-            user=config.get('database', 'user'),
-            password=config.get('database', 'password'),
-            database=config.get('database', 'database')
-        )
-    return thread_local.db_conn
+    """
+    Check a connection out of the pool. Calling close() on it returns it to the pool.
+    """
+    return get_pool().get_connection()
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+def reset_pool(close_idle: bool = False):
+    """
+    Forget the current pool so the next checkout creates a new one.
+
+    A forked worker calls this before any query, so it never shares sockets
+    opened by its parent. The parent passes ``close_idle=True`` before forking
+    to close the connections it will not use anymore.
+    """
+    global _pool, _pool_lock
+    pool, _pool = _pool, None
+    _pool_lock = threading.Lock()
+    if close_idle and pool is not None:
+        pool.close_all()
+
+
+
+# Queries and row conversions below are shared with async_database_module
+_USER_SQL = """
+    SELECT  users._key,
+            users.proprietorName,
+            users.deliveryAddress,
+            users.deviceToken,
+            users.dob,
+            users.emailId,
+            users.shopName,
+            users.phoneNo,
+            users.profilePic,
+            users.userType,
+            users.gst
+    FROM users
+    WHERE users._key = %s
+"""
+
+_USER_ORDER_KEYS_SQL = """
+    SELECT _key 
+    FROM orders
+    WHERE userKey = %s
+"""
+
+_USER_CART_SQL = """
+    SELECT productKey, noOfItems, variationQuantity
+    FROM cart_items
+    WHERE userKey = %s
+"""
+
+
+def _user_document(user_data, orders_data, cart_items_data) -> dict:
+    user = {
+        "_key": user_data[0],
+        "cartItems": [],
+        "proprietorName": user_data[1],
+        "deliveryAddress": user_data[2],
+        "deviceToken": user_data[3],
+        "dob": user_data[4],
+        "emailId": user_data[5],
+        "shopName": user_data[6],
+        "orders": [],
+        "phoneNo": user_data[7],
+        "profilePic": user_data[8],
+        "userType": user_data[9],
+        "gst": user_data[10]
+    }
+    for order in orders_data:
+        user["orders"].append(order[0])
+    for cart_item in cart_items_data:
+        user["cartItems"].append({
+            "productKey": cart_item[0],
+            "noOfItems": cart_item[1],
+            "variationQuantity": cart_item[2]
+        })
+    return user
+
+
+def _fetch_user(cursor, userKey):
+    cursor.execute(_USER_SQL, (userKey,))
+    user_data = cursor.fetchone()
+
+    if not user_data:
+        return None
 
+    cursor.execute(_USER_ORDER_KEYS_SQL, (userKey,))
+    orders_data = cursor.fetchall()
+    cursor.execute(_USER_CART_SQL, (userKey,))
+    cart_items_data = cursor.fetchall()
+    return _user_document(user_data, orders_data, cart_items_data)
 
 
 def get_user_by_key(userKey):
@@ -32,69 +150,53 @@ def get_user_by_key(userKey):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            SELECT  users._key,
-                    users.proprietorName,
-                    users.deliveryAddress,
-                    users.deviceToken,
-                    users.dob,
-                    users.emailId,
-                    users.shopName,
-                    users.phoneNo,
-                    users.profilePic,
-                    users.userType,
-                    users.gst
-            FROM users
-            WHERE users._key = %s
-        """, (userKey,))
-        user_data = cursor.fetchone()
-
-        if user_data:
-            user = {
-                "_key": user_data[0],
-                "cartItems": [],
-                "proprietorName": user_data[1],
-                "deliveryAddress": user_data[2],
-                "deviceToken": user_data[3],
-                "dob": user_data[4],
-                "emailId": user_data[5],
-                "shopName": user_data[6],
-                "orders": [],
-                "phoneNo": user_data[7],
-                "profilePic": user_data[8],
-                "userType": user_data[9],
-                "gst": user_data[10]
-            }
-            cursor.execute("""
-                SELECT _key 
-                FROM orders
-                WHERE userKey = %s
-            """, (userKey,))
-            orders_data = cursor.fetchall()
-            for order in orders_data:
-                user["orders"].append(order[0])
-
-            cursor.execute("""
-                SELECT productKey, noOfItems, variationQuantity
-                FROM cart_items
-                WHERE userKey = %s
-            """, (userKey,))
-            cart_items_data = cursor.fetchall()
-            for cart_item in cart_items_data:
-                user["cartItems"].append({
-                    "productKey": cart_item[0],
-                    "noOfItems": cart_item[1],
-                    "variationQuantity": cart_item[2]
-                })
-            return user
-        else:
+        return _fetch_user(cursor, userKey)
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_cart_of_user(userKey):
+    """
+    Get the user details together with a fully hydrated model for every cart line.
+
+    The number of queries does not depend on the cart size: three for the user
+    and four for all products in the cart.
+
+    Returns:
+        dict: {"userDetails": ..., "cartModels": [...]} or None if the user does not exist.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        user = _fetch_user(cursor, userKey)
+        if user is None:
             return None
 
+        documents = _fetch_product_documents(cursor, [item["productKey"] for item in user["cartItems"]])
+        cartModels = [
+            {
+                "cartItemDetails": item,
+                "productDetails": documents[item["productKey"]]["productDetails"]
+            }
+            for item in user["cartItems"]
+            if item["productKey"] in documents
+        ]
+        return {
+            "userDetails": user,
+            "cartModels": cartModels
+        }
     except Exception:
         return None
-    # finally:
-    #     cursor.close()
-    #     conn.close()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+_USER_BY_EMAIL_SQL = "SELECT _key FROM users WHERE emailId = %s"
 
 
 def is_registered(contact_info):
@@ -105,8 +207,7 @@ def is_registered(contact_info):
         if not contact_info:
             return jsonify({'error': 'Missing contact_info'}), 400
 
-        query = "SELECT _key FROM users WHERE emailId = %s"
-        cur.execute(query, (contact_info,))
+        cur.execute(_USER_BY_EMAIL_SQL, (contact_info,))
 
         user_exists = cur.fetchone() is not None
 
@@ -117,19 +218,21 @@ def is_registered(contact_info):
         conn.close() 
 
 
+_LOGIN_SQL = """
+    SELECT
+        u._key,
+        u.hashed_password
+    FROM users u
+    WHERE u.emailId = %s
+"""
+
+
 def get_user_for_login(contact_info) -> dict:
     conn = get_db_connection()
     cur = conn.cursor()
 
     try:
-        query = """
-            SELECT
-                u._key,
-                u.hashed_password
-            FROM users u
-            WHERE u.emailId = %s
-        """
-        cur.execute(query, (contact_info,))
+        cur.execute(_LOGIN_SQL, (contact_info,))
         user_data = cur.fetchone()
 
         if not user_data:
@@ -145,33 +248,46 @@ def get_user_for_login(contact_info) -> dict:
         conn.close() 
 
 
+_CREATE_USER_SQL = """
+    INSERT INTO users (
+        hashed_password,
+        deliveryAddress,
+        deviceToken,
+        dob,
+        emailId,
+        shopName,
+        phoneNo,
+        profilePic,
+        userType,
+        proprietorName,
+        gst 
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def _new_user_params(username, contact_info, hashed_password) -> tuple:
+    cur_time = int(datetime.datetime.now().timestamp())
+    return (hashed_password, " ", " ", cur_time, contact_info, " ", " ", " ", " ", username, " ")
+
+
 def create_user(username, contact_info, password):
+    """
+    Raises:
+        HashingBusyError: If the password cannot be hashed now, so the caller can answer 429.
+    """
+    # Hash the password before taking a connection, so waiting on the hashing pool holds none
+    try:
+        hashed_password = sc.generate_password_hash(password)
+    except sc.HashingBusyError:
+        raise
+    except Exception:
+        return False
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        # Hash the password
-        hashed_password = sc.generate_password_hash(password)
-        cur_time = int(datetime.datetime.now().timestamp())
-
-        cursor.execute(
-            """
-            INSERT INTO users (
-                hashed_password,
-                deliveryAddress,
-                deviceToken,
-                dob,
-                emailId,
-                shopName,
-                phoneNo,
-                profilePic,
-                userType,
-                proprietorName,
-                gst 
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (hashed_password, " ", " ", cur_time, contact_info, " ", " ", " ", " ", username, " ")
-        )
+        cursor.execute(_CREATE_USER_SQL, _new_user_params(username, contact_info, hashed_password))
         conn.commit()
         return True
     except Exception as e:
@@ -182,6 +298,20 @@ def create_user(username, contact_info, password):
         
 
 
+_CATEGORIES_SQL = "SELECT * FROM categories"
+
+
+def _category_documents(category_details) -> list:
+    results = []
+    for category_detail in category_details:
+        results.append({
+            "_key": category_detail[0],
+            "categoryName": category_detail[1],
+            "categoryPicture": category_detail[2]
+        })
+    return results
+
+
 def get_categories():
     # Connect to DB
     connection = get_db_connection()
@@ -189,105 +319,391 @@ def get_categories():
 
     try: 
         # Query to get category details
-        cursor.execute("SELECT * FROM categories")
-        category_details = cursor.fetchall()
-
-        # List to hold the results
-        results = []
-
-        for category_detail in category_details:
-            category_data = {
-                "_key": category_detail[0],
-                "categoryName": category_detail[1],
-                "categoryPicture": category_detail[2]
-            }
-            results.append(category_data)
-
-        return results
+        cursor.execute(_CATEGORIES_SQL)
+        return _category_documents(cursor.fetchall())
 
     finally:
         cursor.close()
         connection.close()
 
 
-def search_products_by_name(search_term):
+_search_index = None
+_search_index_lock = threading.Lock()
+_search_refreshed_at = 0.0
+SEARCH_REFRESH_INTERVAL = config.getfloat('search', 'refresh_interval', fallback=60)
+
+
+def _search_rows_query(after_key=0, keys=None) -> tuple:
+    if keys is not None:
+        return (f"SELECT _key, productName, productRating FROM products WHERE _key IN ({_placeholders(keys)})",
+                tuple(keys))
+    return "SELECT _key, productName, productRating FROM products WHERE _key > %s ORDER BY _key", (after_key,)
+
+
+def _load_search_rows(after_key=0, keys=None) -> list:
     connection = get_db_connection()
     cursor = connection.cursor()
 
     try:
-        # 1. Full-Text Search (FTS) - If available
-        fts_results = []
-        try:
-            query = """
-            SELECT _key FROM products
-            WHERE MATCH(product_name, description) AGAINST (%s IN NATURAL LANGUAGE MODE)
-            LIMIT 5
-            """
-            cursor.execute(query, (search_term,))
-            fts_results = cursor.fetchall()
-        except mysql.connector.errors.ProgrammingError:
-            # FTS might not be enabled or table doesn't have FTS index; handle gracefully
-            pass
-
-        # 2. Basic Keyword Matching (Case-Insensitive)
-        search_term_like = '%' + search_term.lower() + '%'
-        query = """
-            SELECT _key FROM products
-            WHERE lower(productName) LIKE %s
-            LIMIT 5
-        """
-        cursor.execute(query, (search_term_like,))
-        basic_results = cursor.fetchall()
+        cursor.execute(*_search_rows_query(after_key, keys))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def get_search_index() -> SearchIndex:
+    """Return the product search index, building it from the products table on first use."""
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _install_search_index(_load_search_rows())
+    return _search_index
+
+
+def refresh_search_index(keys=None):
+    """
+    Bring the search index up to date without rebuilding it.
+
+    Args:
+        keys: Products to re-index after a change; they are removed from the
+            index if they no longer exist. If None, only products added since the
+            last refresh are indexed.
+    """
+    index = _search_index
+    if index is None:
+        return
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        rows = _load_search_rows(keys=keys)
+    else:
+        rows = _load_search_rows(after_key=index.max_key)
+    _update_search_index(index, rows, keys)
+
+
+def _install_search_index(rows) -> SearchIndex:
+    global _search_index, _search_refreshed_at
+    index = SearchIndex()
+    index.build(rows)
+    _search_refreshed_at = time.monotonic()
+    _search_index = index
+    return index
+
+
+def _update_search_index(index: SearchIndex, rows, keys=None):
+    """Apply the rows loaded for ``keys``, or for new products if None, to the index."""
+    global _search_refreshed_at
+    if keys is not None:
+        found = {row[0] for row in rows}
+        for key in keys:
+            if key not in found:
+                index.remove(key)
+    for key, name, rating in rows:
+        index.upsert(key, name, rating)
+    _search_refreshed_at = time.monotonic()
+
+
+def search_index_stale() -> bool:
+    return time.monotonic() - _search_refreshed_at > SEARCH_REFRESH_INTERVAL
+
+
+def rebuild_search_index():
+    global _search_index
+    _search_index = None
+    get_search_index()
+
+
+def search_products_by_name(search_term, limit=5) -> list:
+    """
+    Search product names with the in-process index.
+
+    Returns:
+        list: Keys of the best matching products, at most ``limit``.
+    """
+    index = get_search_index()
+    if search_index_stale():
+        refresh_search_index()
+    return index.search(search_term, limit)
 
-        # 3. Combine and De-duplicate Results
-        all_results = fts_results + basic_results
-        unique_results = list(set(item for sublist in all_results for item in sublist)) 
 
-        print("unique", unique_results)
+_autocomplete_index = None
+_autocomplete_lock = threading.Lock()
+_autocomplete_refreshed_at = 0.0
 
-        return unique_results
 
+def _autocomplete_rows_query(after_key=0, keys=None) -> tuple:
+    query = """
+        SELECT p._key, p.productName,
+               (SELECT COUNT(*) FROM orders o WHERE o.productKey = p._key)
+        FROM products p
+        WHERE {}
+        ORDER BY p._key
+    """
+    if keys is not None:
+        return query.format(f"p._key IN ({_placeholders(keys)})"), tuple(keys)
+    return query.format("p._key > %s"), (after_key,)
+
+
+def _load_autocomplete_rows(after_key=0, keys=None) -> list:
+    """Return (key, name, number of orders) rows of products."""
+    connection = get_db_connection()
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute(*_autocomplete_rows_query(after_key, keys))
+        return cursor.fetchall()
     finally:
         cursor.close()
         connection.close()
+
+
+def get_autocomplete_index() -> PrefixTrie:
+    """Return the typeahead trie, building it from products and order counts on first use."""
+    if _autocomplete_index is None:
+        with _autocomplete_lock:
+            if _autocomplete_index is None:
+                _install_autocomplete_index(_load_autocomplete_rows())
+    return _autocomplete_index
+
+
+def refresh_autocomplete_index(keys=None):
+    """
+    Bring the typeahead trie up to date without rebuilding it.
+
+    Args:
+        keys: Products to reload after a change, removed if they no longer
+            exist. If None, only products added since the last refresh are loaded.
+    """
+    trie = _autocomplete_index
+    if trie is None:
+        return
+    if keys is not None:
+        keys = list(keys)
+        if not keys:
+            return
+        rows = _load_autocomplete_rows(keys=keys)
+    else:
+        rows = _load_autocomplete_rows(after_key=trie.max_key)
+    _update_autocomplete_index(trie, rows, keys)
+
+
+def _install_autocomplete_index(rows) -> PrefixTrie:
+    global _autocomplete_index, _autocomplete_refreshed_at
+    # Every node keeps max_suggestions candidates: size it by the largest
+    # autocomplete page, not the search limit
+    trie = PrefixTrie(max_suggestions=config.getint('search', 'autocomplete_limit', fallback=8))
+    trie.build(rows)
+    _autocomplete_refreshed_at = time.monotonic()
+    _autocomplete_index = trie
+    return trie
+
+
+def _update_autocomplete_index(trie: PrefixTrie, rows, keys=None):
+    """Apply the rows loaded for ``keys``, or for new products if None, to the trie."""
+    global _autocomplete_refreshed_at
+    if keys is not None:
+        found = {row[0] for row in rows}
+        for key in keys:
+            if key not in found:
+                trie.remove(key)
+    for key, name, order_count in rows:
+        trie.upsert(key, name, order_count)
+    _autocomplete_refreshed_at = time.monotonic()
+
+
+def autocomplete_index_stale() -> bool:
+    return time.monotonic() - _autocomplete_refreshed_at > SEARCH_REFRESH_INTERVAL
+
+
+def rebuild_autocomplete_index():
+    global _autocomplete_index
+    _autocomplete_index = None
+    get_autocomplete_index()
+
+
+def record_product_orders(product_counts: dict):
+    """Raise the typeahead popularity of ordered products (product key -> number of orders)."""
+    trie = _autocomplete_index
+    if trie is None:
+        return
+    for key, count in product_counts.items():
+        trie.add_weight(key, count)
+
+
+def autocomplete_products(prefix, limit=8) -> list:
+    """
+    Suggest products whose name has a word starting with ``prefix``.
+
+    Returns:
+        list: {'_key', 'productName'} of the most ordered matching products, at most ``limit``.
+    """
+    trie = get_autocomplete_index()
+    if autocomplete_index_stale():
+        refresh_autocomplete_index()
+    return [{'_key': key, 'productName': name} for key, name in trie.suggest(prefix, limit)]
+
         
-        
+_CATEGORY_PRODUCTS_SQL = """
+    SELECT pc.productKey
+    FROM product_categories pc
+    WHERE pc.categoryKey = %s 
+    LIMIT 8
+"""
+
+
 def get_product_of_category(category) -> list:
     # Connect to DB
     connection = get_db_connection()
     cursor = connection.cursor()
 
-    query = """
-        SELECT pc.productKey
-        FROM product_categories pc
-        WHERE pc.categoryKey = %s 
-        LIMIT 8
+    try:
+        cursor.execute(_CATEGORY_PRODUCTS_SQL, (category,))
+        productKeys = []
+        for row in cursor.fetchall():
+            productKeys.append(row[0])
+        return productKeys
+
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# sort name -> (product_categories column, descending); ties and "newest" use
+# productKey, since product keys grow with insertion
+CATEGORY_SORTS = {
+    'rating': ('productRating', True),
+    'price': ('minPrice', False),
+    'newest': (None, True),
+}
+
+
+def _category_page_query(category, sort: str, page_size: int, cursor: str = None) -> tuple:
+    if sort not in CATEGORY_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    column, descending = CATEGORY_SORTS[sort]
+    direction, comparison = ('DESC', '<') if descending else ('ASC', '>')
+
+    query = f"""
+        SELECT productKey{', ' + column if column else ''}
+        FROM product_categories
+        WHERE categoryKey = %s
+    """
+    params = [category]
+    if cursor and column:
+        value, product_key = decode_page_cursor(cursor, 2)
+        query += f" AND ({column} {comparison} %s OR ({column} = %s AND productKey {comparison} %s))"
+        params += [value, value, product_key]
+    elif cursor:
+        product_key, = decode_page_cursor(cursor, 1)
+        query += f" AND productKey {comparison} %s"
+        params.append(product_key)
+    query += f" ORDER BY {column + ' ' + direction + ', ' if column else ''}productKey {direction} LIMIT %s"
+    # One extra row tells whether there is a next page
+    params.append(page_size + 1)
+    return query, tuple(params)
+
+
+def _category_page(rows, page_size: int) -> dict:
+    next_cursor = None
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        next_cursor = encode_page_cursor(*last[1:], last[0])
+    return {
+        "productKeys": [row[0] for row in rows[:page_size]],
+        "nextCursor": next_cursor
+    }
+
+
+def get_category_page(category, sort: str = 'newest', page_size: int = 20, cursor: str = None) -> dict:
     """
-    cursor.execute(query, (category,))
-    productKeys = []
-    for row in cursor.fetchall():
-        productKeys.append(row[0])
-    cursor.close()
-    connection.close()
-    return productKeys
+    Get one page of the product keys of a category in the requested order.
 
+    Sort values are copied into product_categories (see refresh_category_sort_keys)
+    and indexed together with categoryKey, so a page is one index range scan of
+    ``page_size + 1`` rows wherever it starts.
+
+    Args:
+        category: The category key.
+        sort: One of CATEGORY_SORTS.
+        page_size: Maximum number of keys on the page.
+        cursor: The ``nextCursor`` of the previous page, None for the first page.
+
+    Returns:
+        dict: {"productKeys": [...], "nextCursor": str or None}.
+
+    Raises:
+        ValueError: If ``sort`` or ``cursor`` is invalid.
+    """
+    query, params = _category_page_query(category, sort, page_size, cursor)
 
-def get_product_from_key(keys:list) -> list:
-    # Connect to DB
     connection = get_db_connection()
-    cursor = connection.cursor()
-    results = []
-    for key in keys:
-        query = """
-            SELECT p._key, p.productName, p.productDescription, p.productPicture, p.productRating
-            FROM products p
-            WHERE p._key = %s 
-        """
-        cursor.execute(query, (key,))
-        
-        for row in cursor.fetchall(): # key is unique
+    cur = connection.cursor()
+    try:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        connection.close()
+
+    return _category_page(rows, page_size)
+
+
+def refresh_category_sort_keys(product_keys=None):
+    """
+    Copy product ratings and lowest offer prices into product_categories.
+
+    Run after loading the catalog, with None for the whole catalog;
+    catalog_cache.invalidate_products runs it for the products it is given
+    after their rating or variations change.
+    """
+    query = CATEGORY_SORT_KEYS_SQL
+    connection = get_db_connection()
+    cur = connection.cursor()
+    try:
+        if product_keys is None:
+            cur.execute(query)
+        else:
+            for chunk in _chunks(list(product_keys)):
+                cur.execute(query + f" WHERE pc.productKey IN ({_placeholders(chunk)})", tuple(chunk))
+        connection.commit()
+    finally:
+        cur.close()
+        connection.close()
+
+
+_IN_CHUNK_SIZE = 1000
+
 
-            product_data = {
+def _placeholders(values) -> str:
+    return ', '.join(['%s'] * len(values))
+
+
+def _chunks(values: list, size: int = _IN_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _assemble_product_documents(product_rows, category_rows, review_rows, variation_rows) -> dict:
+    """
+    Build product documents from the rows of the four hydration queries.
+
+    Args:
+        product_rows: (_key, productName, productDescription, productPicture, productRating) rows.
+        category_rows: (productKey, _key, categoryName, categoryPicture) rows.
+        review_rows: (productKey, userKey, comment) rows.
+        variation_rows: (productKey, availabilityQuantity, discountPrice, offerPrice,
+            quantity, sellingPrice) rows.
+
+    Returns:
+        dict: product key -> {"categoryDetails": [...], "productDetails": {...}}.
+    """
+    documents = {}
+    for row in product_rows:
+        documents[row[0]] = {
+            "categoryDetails": [],
+            "productDetails": {
                 "_key": row[0],
                 "productName": row[1],
                 "productDescription": row[2],
@@ -296,84 +712,155 @@ def get_product_from_key(keys:list) -> list:
                 "reviews": [],
                 "variations": []
             }
+        }
 
-            # Query to get list of category that product belongs to
-            query = """
-                SELECT c._key, c.categoryName, c.categoryPicture
-                FROM product_categories pc
-                INNER JOIN categories c ON pc.categoryKey = c._key
-                WHERE pc.productKey = %s
-            """
-            cursor.execute(query, (product_data['_key'],))
-            category_data = [
-                {
-                    "_key": row[0],
-                    "categoryName": row[1],
-                    "categoryPicture": row[2],
-                }
-                for row in cursor.fetchall()
-            ]
-
-            # Query to get reviews (using product_data["_key"] directly)
-            cursor.execute("SELECT userKey, comment FROM reviews WHERE productKey=%s", (product_data["_key"],))
-            for review in cursor.fetchall():
-                product_data["reviews"].append({
-                    "userId": review[0],
-                    "comment": review[1]
-                })
+    for row in category_rows:
+        if row[0] in documents:
+            documents[row[0]]["categoryDetails"].append({
+                "_key": row[1],
+                "categoryName": row[2],
+                "categoryPicture": row[3],
+            })
 
-            # Query to get variations (using product_data["_key"] directly)
-            cursor.execute("SELECT availabilityQuantity, discountPrice, offerPrice, quantity, sellingPrice FROM variations WHERE productKey=%s",
-                            (product_data["_key"],))
-            for variation in cursor.fetchall():
-                product_data["variations"].append({
-                    "availabilityQuantity": variation[0],
-                    "discountPrice": variation[1],
-                    "offerPrice": variation[2],
-                    "quantity": variation[3],
-                    "sellingPrice": variation[4]
-                })
+    for row in review_rows:
+        if row[0] in documents:
+            documents[row[0]]["productDetails"]["reviews"].append({
+                "userId": row[1],
+                "comment": row[2]
+            })
 
-            results.append({
-                "categoryDetails": category_data,
-                "productDetails": product_data
+    for row in variation_rows:
+        if row[0] in documents:
+            documents[row[0]]["productDetails"]["variations"].append({
+                "availabilityQuantity": row[1],
+                "discountPrice": row[2],
+                "offerPrice": row[3],
+                "quantity": row[4],
+                "sellingPrice": row[5]
             })
 
-    return results
+    return documents
 
 
-def add_to_cart(cartItems, userKey):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+_PRODUCTS_SQL = """
+    SELECT p._key, p.productName, p.productDescription, p.productPicture, p.productRating
+    FROM products p
+    WHERE p._key IN ({})
+"""
+
+_PRODUCT_CATEGORIES_SQL = """
+    SELECT pc.productKey, c._key, c.categoryName, c.categoryPicture
+    FROM product_categories pc
+    INNER JOIN categories c ON pc.categoryKey = c._key
+    WHERE pc.productKey IN ({})
+"""
+
+_PRODUCT_REVIEWS_SQL = """
+    SELECT productKey, userKey, comment
+    FROM reviews
+    WHERE productKey IN ({})
+    ORDER BY _key
+"""
+
+_PRODUCT_VARIATIONS_SQL = """
+    SELECT productKey, availabilityQuantity, discountPrice, offerPrice, quantity, sellingPrice
+    FROM variations
+    WHERE productKey IN ({})
+    ORDER BY _key
+"""
+
+
+def _fetch_product_documents(cursor, keys) -> dict:
+    """
+    Hydrate the given products with a constant number of queries per chunk of keys.
+
+    Args:
+        cursor: An open database cursor.
+        keys: Product keys, duplicates allowed.
+
+    Returns:
+        dict: product key -> product document, only for keys that exist.
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    documents = {}
+    for chunk in _chunks(unique_keys):
+        params = tuple(chunk)
+        rows = []
+        for sql in (_PRODUCTS_SQL, _PRODUCT_CATEGORIES_SQL, _PRODUCT_REVIEWS_SQL, _PRODUCT_VARIATIONS_SQL):
+            cursor.execute(sql.format(_placeholders(chunk)), params)
+            rows.append(cursor.fetchall())
+        documents.update(_assemble_product_documents(*rows))
+    return documents
+
+
+def get_product_from_key(keys:list) -> list:
+    """
+    Get product documents for a list of product keys.
+
+    The result follows the order of ``keys``, repeats duplicated keys and skips
+    keys that do not exist.
+    """
+    if not keys:
+        return []
+
+    # Connect to DB
+    connection = get_db_connection()
+    cursor = connection.cursor()
 
     try:
-        # Check if the item already exists in the cart
-        cursor.execute('''
-            SELECT 1 
-            FROM cart_items 
-            WHERE userKey = %s AND productKey = %s AND variationQuantity = %s
-        ''', (userKey, cartItems['productKey'], cartItems['variationQuantity']))
+        documents = _fetch_product_documents(cursor, keys)
+    finally:
+        cursor.close()
+        connection.close()
 
-        item_exists = cursor.fetchone()
+    return [documents[key] for key in keys if key in documents]
 
-        if item_exists:
-            # If item exists, increment noOfItems
-            cursor.execute('''
-                UPDATE cart_items 
-                SET noOfItems = noOfItems + %s 
-                WHERE userKey = %s AND productKey = %s AND variationQuantity = %s
-            ''', (cartItems['noOfItems'], userKey, cartItems['productKey'], cartItems['variationQuantity']))
-        else:
-            # If item doesn't exist, insert a new row
-            cursor.execute('''
-                INSERT INTO cart_items (userKey, productKey, noOfItems, variationQuantity)
-                VALUES (%s, %s, %s, %s)
-            ''', (userKey, cartItems['productKey'], cartItems['noOfItems'], cartItems['variationQuantity']))
 
+def _cart_lines(cartItems) -> dict:
+    """
+    Normalize one cart item or a list of them to (productKey, variationQuantity) -> noOfItems,
+    adding up repeated lines.
+    """
+    if isinstance(cartItems, dict):
+        cartItems = [cartItems]
+    lines = {}
+    for item in cartItems:
+        line = (item['productKey'], item['variationQuantity'])
+        lines[line] = lines.get(line, 0) + item['noOfItems']
+    return lines
+
+
+_ADD_TO_CART_SQL = '''
+    INSERT INTO cart_items (userKey, productKey, noOfItems, variationQuantity)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE noOfItems = noOfItems + VALUES(noOfItems)
+'''
+
+
+def _add_to_cart_rows(lines: dict, userKey) -> list:
+    return [(userKey, productKey, noOfItems, variationQuantity)
+            for (productKey, variationQuantity), noOfItems in lines.items()]
+
+
+def add_to_cart(cartItems, userKey) -> bool:
+    """
+    Add one cart item or a list of them to the cart, increasing existing lines.
+
+    All lines are written by one batched upsert relying on the unique key of
+    cart_items, so the call costs the same round trips for any number of items.
+    """
+    lines = _cart_lines(cartItems)
+    if not lines:
+        return True
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany(_ADD_TO_CART_SQL, _add_to_cart_rows(lines, userKey))
         conn.commit()  # Commit changes within the try block
         return True
 
-    except sqlite3.Error as e:
+    except mysql.connector.Error as e:
         print(f"An error occurred: {e}")
         conn.rollback()
         return False
@@ -382,68 +869,94 @@ def add_to_cart(cartItems, userKey):
         conn.close()
 
 
+def _remove_from_cart_statements(lines: dict, userKey) -> list:
+    """Return the (sql, params) statements removing ``lines`` from the cart."""
+    statements = []
+    for chunk in _chunks(list(lines.items())):
+        cases = ' '.join(['WHEN productKey = %s AND variationQuantity = %s THEN %s'] * len(chunk))
+        matches = ', '.join(['(%s, %s)'] * len(chunk))
+        params = [value for (productKey, variationQuantity), noOfItems in chunk
+                  for value in (productKey, variationQuantity, noOfItems)]
+        params.append(userKey)
+        params += [value for line, _ in chunk for value in line]
+        statements.append((f'''
+            UPDATE cart_items 
+            SET noOfItems = noOfItems - CASE {cases} ELSE 0 END
+            WHERE userKey = %s AND (productKey, variationQuantity) IN ({matches})
+        ''', tuple(params)))
+
+    # If the quantity becomes zero or negative, delete the item
+    statements.append(('''
+        DELETE FROM cart_items 
+        WHERE userKey = %s AND noOfItems <= 0
+    ''', (userKey,)))
+    return statements
+
+
 def remove_from_cart(cartItems: list[dict], userKey: int) -> bool:
+    """
+    Decrease the quantity of cart lines, deleting the lines that drop to zero or below.
+
+    Each chunk of lines is one UPDATE, followed by one DELETE for the whole cart.
+    """
+    lines = _cart_lines(cartItems)
+    if not lines:
+        return True
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        # Directly decrease the quantity 
-        for cartItem in cartItems:
-            cursor.execute('''
-                UPDATE cart_items 
-                SET noOfItems = noOfItems - %s 
-                WHERE userKey = %s AND productKey = %s AND variationQuantity = %s
-            ''', (cartItem['noOfItems'], userKey, cartItem['productKey'], cartItem['variationQuantity']))
-
-            # If the quantity becomes zero or negative, delete the item
-            cursor.execute('''
-                DELETE FROM cart_items 
-                WHERE userKey = %s AND productKey = %s AND variationQuantity = %s AND noOfItems <= 0
-            ''', (userKey, cartItem['productKey'], cartItem['variationQuantity']))
-
+        for statement in _remove_from_cart_statements(lines, userKey):
+            cursor.execute(*statement)
         conn.commit() # Commit changes within the try block
         return True
 
-    except sqlite3.Error as e:
+    except mysql.connector.Error as e:
         print(f"An error occurred: {e}")
         conn.rollback()
         return False
     finally:
         cursor.close()
         conn.close() 
-  
- 
-def change_no_of_product_in_cart(data: dict, userKey: int) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    try:
-        old_product_key = data['old']['productKey']
-        old_variation_quantity = data['old']['variationQuantity']
 
-        new_product_key = data['new']['productKey']
-        new_variation_quantity = data['new']['variationQuantity']
-        new_no_of_items = data['new']['noOfItems']
+def _change_cart_statements(data: dict, userKey) -> list:
+    """Return the (sql, params) statements moving a cart line to new values."""
+    old_product_key = data['old']['productKey']
+    old_variation_quantity = data['old']['variationQuantity']
 
-        # First, try to update the existing item with the new values
-        cursor.execute('''
-            UPDATE cart_items 
-            SET productKey = %s, variationQuantity = %s, noOfItems = %s
+    new_product_key = data['new']['productKey']
+    new_variation_quantity = data['new']['variationQuantity']
+    new_no_of_items = data['new']['noOfItems']
+
+    statements = []
+    # Moving to another line replaces the old one
+    if (old_product_key, old_variation_quantity) != (new_product_key, new_variation_quantity):
+        statements.append(('''
+            DELETE FROM cart_items
             WHERE userKey = %s AND productKey = %s AND variationQuantity = %s
-        ''', (new_product_key, new_variation_quantity, new_no_of_items,
-              userKey, old_product_key, old_variation_quantity))
+        ''', (userKey, old_product_key, old_variation_quantity)))
+
+    # Set the count of the new line, creating it if needed
+    statements.append(('''
+        INSERT INTO cart_items (userKey, productKey, noOfItems, variationQuantity)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE noOfItems = VALUES(noOfItems)
+    ''', (userKey, new_product_key, new_no_of_items, new_variation_quantity)))
+    return statements
 
-        # If no rows were updated, it means the old item doesn't exist, so insert the new one
-        if cursor.rowcount == 0:
-            cursor.execute('''
-                INSERT INTO cart_items (userKey, productKey, noOfItems, variationQuantity)
-                VALUES (%s, %s, %s, %s)
-            ''', (userKey, new_product_key, new_no_of_items, new_variation_quantity))
 
+def change_no_of_product_in_cart(data: dict, userKey: int) -> bool:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        for statement in _change_cart_statements(data, userKey):
+            cursor.execute(*statement)
         conn.commit()  # Commit changes
         return True
 
-    except sqlite3.Error as e:
+    except mysql.connector.Error as e:
         print(f"An error occurred: {e}")
         conn.rollback()
         return False
@@ -452,75 +965,429 @@ def change_no_of_product_in_cart(data: dict, userKey: int) -> bool:
         conn.close()
 
 
+RESERVE_STOCK = config.getboolean('orders', 'reserve_stock', fallback=False)
+
+
+class _OrderPlan:
+    """
+    The statements of one place_order call, built from the request before any
+    database work so the transaction only runs them.
+
+    Raises:
+        ValueError: If the noOfItems of a line is not a positive integer.
+    """
+
+    def __init__(self, orders: dict, user_key):
+        self.orders = orders['orders']
+        self.user_key = user_key
+        self.lines = [(order['productDetails']['productKey'], order['productDetails']['variationQuantity'],
+                       order['productDetails']['noOfItems']) for order in self.orders]
+        self.demand = {}
+        for product_key, variation_quantity, no_of_items in self.lines:
+            # A negative count would add stock, a zero one fail the stock check
+            if isinstance(no_of_items, bool) or not isinstance(no_of_items, int) or no_of_items < 1:
+                raise ValueError(f"noOfItems must be a positive integer, got {no_of_items!r}")
+            variation = (product_key, variation_quantity)
+            self.demand[variation] = self.demand.get(variation, 0) + no_of_items
+        self._matches = ', '.join(['(%s, %s)'] * len(self.demand))
+        self._match_params = [value for variation in self.demand for value in variation]
+        # Tells this checkout's rows apart in orders, to read their keys back
+        self.checkout_token = uuid.uuid4().hex
+
+    def reserve_stock(self) -> tuple:
+        """
+        Guarded UPDATE taking the demand of every variation, touching only
+        variations with enough stock: it changed fewer than len(demand) rows
+        if any line cannot be served.
+        """
+        cases = ' '.join(['WHEN productKey = %s AND quantity = %s THEN %s'] * len(self.demand))
+        case_params = [value for variation, count in self.demand.items() for value in (*variation, count)]
+        return f"""
+            UPDATE variations
+            SET availabilityQuantity = availabilityQuantity - CASE {cases} END
+            WHERE (productKey, quantity) IN ({self._matches})
+              AND availabilityQuantity >= CASE {cases} END
+        """, tuple(case_params + self._match_params + case_params)
+
+    def stock(self) -> tuple:
+        return f"""
+            SELECT productKey, quantity, availabilityQuantity
+            FROM variations
+            WHERE (productKey, quantity) IN ({self._matches})
+        """, tuple(self._match_params)
+
+    def stock_failures(self, stock_rows) -> list:
+        """Describe the order lines whose variation is missing or short of stock."""
+        available = {(row[0], row[1]): row[2] for row in stock_rows}
+        failures = []
+        for index, (product_key, variation_quantity, no_of_items) in enumerate(self.lines):
+            variation = (product_key, variation_quantity)
+            if available.get(variation, 0) < self.demand[variation]:
+                failures.append({
+                    "line": index,
+                    "productKey": product_key,
+                    "variationQuantity": variation_quantity,
+                    "requested": no_of_items,
+                    "available": available.get(variation)
+                })
+        return failures
+
+    def insert_orders(self) -> tuple:
+        """
+        One multi-row INSERT of every order. Each row carries the checkout token
+        and its line number, since the keys of a multi-row INSERT need not be
+        consecutive (innodb_autoinc_lock_mode=2).
+        """
+        rows = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(self.orders))
+        params = [value
+                  for line, (order, (product_key, variation_quantity, no_of_items))
+                  in enumerate(zip(self.orders, self.lines))
+                  for value in (self.user_key, order['deliveryAddress'],
+                                order['deliveryStages'][-1] if order['deliveryStages'] else None,
+                                order['orderedDate'], order['paidPrice'], order['paymentStatus'],
+                                product_key, no_of_items, variation_quantity, self.checkout_token, line)]
+        return f"""
+            INSERT INTO orders (userKey, deliveryAddress, currentStage, orderedDate,
+                               paidPrice, paymentStatus, productKey, noOfItems,
+                               variationQuantity, checkoutToken, checkoutLine)
+            VALUES {rows}
+        """, tuple(params)
+
+    def order_keys(self) -> tuple:
+        """Read back the (checkoutLine, _key) of the inserted orders."""
+        return """
+            SELECT checkoutLine, _key
+            FROM orders
+            WHERE checkoutToken = %s
+        """, (self.checkout_token,)
+
+    INSERT_STAGES_SQL = """
+        INSERT INTO order_delivery_stages (orderKey, position, stage)
+        VALUES (%s, %s, %s)
+    """
+
+    def stage_rows(self, key_rows) -> list:
+        """Rows of INSERT_STAGES_SQL, given the result of order_keys."""
+        order_keys = dict(key_rows)
+        # A line without a key fails the NOT NULL orderKey, rolling the checkout back
+        return [(order_keys.get(line), position, stage)
+                for line, order in enumerate(self.orders)
+                for position, stage in enumerate(order['deliveryStages'])]
+
+    def clear_cart(self) -> tuple:
+        """The purchased lines leave the cart."""
+        return f"""
+            DELETE FROM cart_items
+            WHERE userKey = %s AND (productKey, variationQuantity) IN ({self._matches})
+        """, (self.user_key, *self._match_params)
+
+    def product_counts(self) -> dict:
+        counts = {}
+        for product_key, _, _ in self.lines:
+            counts[product_key] = counts.get(product_key, 0) + 1
+        return counts
+
+
 def place_order(orders: list, user_key: int) -> dict:
+    """
+    Place all order lines in one short transaction: reserve their stock, insert
+    the orders and clear the purchased lines from the cart.
+
+    Stock is taken with a single guarded UPDATE that only touches variations
+    with enough availability, so concurrent checkouts cannot oversell. If any
+    line cannot be served nothing is written.
+
+    Returns:
+        dict: {"result": bool, "message": str}, plus "productKeys" of the ordered
+        products on success, or "failures" describing the lines without enough
+        stock when the order is refused for that reason.
+    """
+    try:
+        plan = _OrderPlan(orders, user_key)
+    except ValueError as e:
+        return {"result": False,
+                "message": str(e)}
+    if not plan.lines:
+        return {"result": False,
+                "message": "No order lines"}
+
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        for order in orders['orders']:
-            delivery_address = order['deliveryAddress']
-            delivery_stages = ','.join(order['deliveryStages'])  # Storing as comma-separated
-            ordered_date = order['orderedDate']
-            paid_price = order['paidPrice']
-            payment_status = order['paymentStatus']
-            product_key = order['productDetails']['productKey']
-            no_of_items = order['productDetails']['noOfItems']
-            variation_quantity = order['productDetails']['variationQuantity']
-
-            cursor.execute("""
-                INSERT INTO orders (userKey, deliveryAddress, deliveryStages, orderedDate, 
-                                   paidPrice, paymentStatus, productKey, noOfItems, 
-                                   variationQuantity)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (user_key, delivery_address, delivery_stages, ordered_date, paid_price,
-                  payment_status, product_key, no_of_items, variation_quantity))
+        if RESERVE_STOCK:
+            cursor.execute(*plan.reserve_stock())
+            if cursor.rowcount < len(plan.demand):
+                cursor.execute(*plan.stock())
+                failures = plan.stock_failures(cursor.fetchall())
+                conn.rollback()
+                return {"result": False,
+                        "message": "Insufficient stock",
+                        "failures": failures}
+
+        cursor.execute(*plan.insert_orders())
+        cursor.execute(*plan.order_keys())
+        stage_rows = plan.stage_rows(cursor.fetchall())
+        if stage_rows:
+            cursor.executemany(plan.INSERT_STAGES_SQL, stage_rows)
+        cursor.execute(*plan.clear_cart())
+
         conn.commit()  # Commit changes
+        product_counts = plan.product_counts()
+        record_product_orders(product_counts)
         return {"result": True,
-                "message": "Successful"}
+                "message": "Successful",
+                "productKeys": list(product_counts)}
 
-    except sqlite3.Error as e:
+    except mysql.connector.Error as e:
         print(f"An error occurred: {e}")
         conn.rollback()
         return {"result": False,
-                "message": e}
+                "message": str(e)}
     finally:
         cursor.close()
         conn.close() 
     
 
-def get_orders_of_user(userKey) -> dict[str, any]:
-    conn = get_db_connection()  
-    cursor = conn.cursor()
+_ORDER_COLUMNS = """
+    _key, productKey, orderedDate, paidPrice, paymentStatus, 
+    deliveryStages, deliveryAddress, noOfItems, variationQuantity
+"""
 
-    cursor.execute("""
-        SELECT 
-            _key, productKey, orderedDate, paidPrice, paymentStatus, 
-            deliveryStages, deliveryAddress, noOfItems, variationQuantity
-        FROM orders 
-        WHERE userKey = %s
-    """, (userKey,))
+_ORDER_STAGES_SQL = """
+    SELECT orderKey, stage
+    FROM order_delivery_stages
+    WHERE orderKey IN ({})
+    ORDER BY orderKey, position
+"""
+
+
+def _order_documents(rows, stage_rows) -> list:
+    """
+    Build order dicts from _ORDER_COLUMNS rows and the _ORDER_STAGES_SQL rows of
+    the same orders.
+    """
+    stages = {}
+    for order_key, stage in stage_rows:
+        stages.setdefault(order_key, []).append(stage)
 
     orders = []
-    for row in cursor.fetchall():
-        order = {
+    for row in rows:
+        if row[0] in stages:
+            delivery_stages = stages[row[0]]
+        elif row[5]:
+            # Orders placed before the stages table keep them comma-separated
+            delivery_stages = row[5].split(",")
+        else:
+            delivery_stages = []
+        orders.append({
             '_key': row[0],
             'productKey': row[1],
             'orderedDate': row[2],
             'paidPrice': row[3],
             'paymentStatus': row[4],
-            'deliveryStages': row[5].split(","), 
+            'deliveryStages': delivery_stages,
             'deliveryAddress': row[6],
             'noOfItems': row[7],
             'variationQuantity': row[8],
-        }
-        orders.append(order)
-
+        })
     return orders
 
-    # finally:
-    #     cursor.close()
-    #     conn.close()
+
+def _orders_from_rows(cursor, rows) -> list:
+    """Build order dicts from _ORDER_COLUMNS rows, reading their delivery stages with one query."""
+    stage_rows = []
+    for chunk in _chunks([row[0] for row in rows]):
+        cursor.execute(_ORDER_STAGES_SQL.format(_placeholders(chunk)), tuple(chunk))
+        stage_rows += cursor.fetchall()
+    return _order_documents(rows, stage_rows)
+
+
+def get_orders_of_user(userKey) -> dict[str, any]:
+    conn = get_db_connection()  
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(f"""
+            SELECT {_ORDER_COLUMNS}
+            FROM orders 
+            WHERE userKey = %s
+        """, (userKey,))
+
+        return _orders_from_rows(cursor, cursor.fetchall())
+
+    finally:
+        cursor.close()
+        conn.close()
         
         
+def encode_page_cursor(*values) -> str:
+    """Encode the sort key of the last row of a page into an opaque cursor string."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def decode_page_cursor(cursor: str, size: int) -> list:
+    """
+    Decode a cursor produced by encode_page_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not hold ``size`` values.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception as e:
+        raise ValueError("Invalid page cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid page cursor")
+    return values
+
+
+def _orders_page_query(condition: str, params: list, page_size: int = None, cursor: str = None) -> tuple:
+    query = f"""
+        SELECT {_ORDER_COLUMNS}
+        FROM orders 
+        WHERE {condition}
+    """
+    params = list(params)
+    if cursor:
+        ordered_date, order_key = decode_page_cursor(cursor, 2)
+        query += " AND (orderedDate < %s OR (orderedDate = %s AND _key < %s))"
+        params += [ordered_date, ordered_date, order_key]
+    query += " ORDER BY orderedDate DESC, _key DESC"
+    if page_size is not None:
+        # One extra row tells whether there is a next page
+        query += " LIMIT %s"
+        params.append(page_size + 1)
+    return query, tuple(params)
+
+
+def _orders_page_result(orders: list, documents: dict, has_more: bool) -> dict:
+    for order in orders:
+        document = documents.get(order['productKey'])
+        order['productDetails'] = document['productDetails'] if document else None
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_page_cursor(orders[-1]['orderedDate'], orders[-1]['_key'])
+    return {"orders": orders, "nextCursor": next_cursor}
+
+
+def _orders_page(condition: str, params: list, page_size: int = None, cursor: str = None) -> dict:
+    """
+    Get one page of the orders matching ``condition``, newest first, keyed on
+    (orderedDate, _key), with their products hydrated.
+
+    Raises:
+        ValueError: If ``cursor`` is invalid.
+    """
+    query, params = _orders_page_query(condition, params, page_size, cursor)
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        orders = _orders_from_rows(cur, rows[:page_size])
+        documents = _fetch_product_documents(cur, [order['productKey'] for order in orders])
+        return _orders_page_result(orders, documents, page_size is not None and len(rows) > page_size)
+
+    finally:
+        cur.close()
+        conn.close()
+
+
+def get_orders_page(userKey, page_size: int = None, cursor: str = None) -> dict:
+    """
+    Get one page of a user's orders, newest first, with their products hydrated.
+
+    Pages are keyed on (orderedDate, _key) so every page costs one index range
+    scan plus the batched product hydration, however long the order history is.
+
+    Args:
+        userKey: The user whose orders are listed.
+        page_size: Maximum number of orders on the page, None for every order.
+        cursor: The ``nextCursor`` of the previous page, None for the first page.
+
+    Returns:
+        dict: {"orders": [...], "nextCursor": str or None}. Each order carries the
+        hydrated "productDetails" of its product, or None if the product is gone.
+
+    Raises:
+        ValueError: If ``cursor`` is invalid.
+    """
+    return _orders_page("userKey = %s", [userKey], page_size, cursor)
+
+
+def get_orders_by_stage(stage: str, page_size: int = None, cursor: str = None, userKey=None) -> dict:
+    """
+    Get one page of the orders whose current delivery stage is ``stage``, newest first.
+
+    Without ``userKey`` this is one range scan of the (currentStage, orderedDate,
+    _key) index, for order-tracking dashboards.
+
+    Args:
+        stage: The current stage to match, e.g. "Order Placed".
+        page_size: Maximum number of orders on the page, None for every order.
+        cursor: The ``nextCursor`` of the previous page, None for the first page.
+        userKey: Only list the orders of this user.
+
+    Returns:
+        dict: {"orders": [...], "nextCursor": str or None}, as get_orders_page.
+
+    Raises:
+        ValueError: If ``cursor`` is invalid.
+    """
+    if userKey is None:
+        return _orders_page("currentStage = %s", [stage], page_size, cursor)
+    return _orders_page("userKey = %s AND currentStage = %s", [userKey, stage], page_size, cursor)
+
+
+def advance_order_stage(orderKey, stage: str) -> bool:
+    """
+    Append a delivery stage to an order and make it the current one.
+
+    Returns:
+        bool: False if the order does not exist or the update failed.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Lock the order so concurrent updates get distinct positions
+        cursor.execute("SELECT deliveryStages FROM orders WHERE _key = %s FOR UPDATE", (orderKey,))
+        order = cursor.fetchone()
+        if order is None:
+            conn.rollback()
+            return False
+        cursor.execute("SELECT COUNT(*) FROM order_delivery_stages WHERE orderKey = %s", (orderKey,))
+        position = cursor.fetchone()[0]
+
+        rows = []
+        if position == 0 and order[0]:
+            # Move the comma-separated stages of an older order to the table first
+            rows = [(orderKey, index, legacy_stage) for index, legacy_stage in enumerate(order[0].split(","))]
+            position = len(rows)
+        rows.append((orderKey, position, stage))
+        cursor.executemany("""
+            INSERT INTO order_delivery_stages (orderKey, position, stage)
+            VALUES (%s, %s, %s)
+        """, rows)
+        cursor.execute("""
+            UPDATE orders SET currentStage = %s, deliveryStages = NULL WHERE _key = %s
+        """, (stage, orderKey))
+
+        conn.commit()
+        return True
+
+    except mysql.connector.Error as e:
+        print(f"An error occurred: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # def get_cart_items(userKey:int) -> list[dict]:
 #     conn = get_db_connection()
 #     cursor = conn.cursor()
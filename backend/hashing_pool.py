@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing queue is full and the caller should retry later."""
+
+
+class HashingPool:
+    """
+    Bounded process pool for CPU-bound password hashing.
+
+    At most ``processes`` hashes run at once, in other processes so they do not
+    hold the GIL of the API workers, and at most ``queue_size`` more wait for a
+    process. Past that, submit raises HashingBusyError at once instead of
+    queueing work the client will have given up on.
+
+    The executor is created on first use in each process, so a pool inherited
+    through fork is replaced rather than shared. It is also replaced once one of
+    its processes dies, which leaves a ProcessPoolExecutor broken for good.
+
+    Args:
+        processes: Number of hashing processes.
+        queue_size: Number of hashes allowed to wait for a free process.
+    """
+
+    def __init__(self, processes: int = 2, queue_size: int = 32):
+        if processes < 1:
+            raise ValueError("Hashing pool needs at least one process.")
+        self._processes = processes
+        self._max_pending = processes + max(0, queue_size)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'restarts': 0,
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self._processes)
+            self._pid = os.getpid()
+            self._pending = 0
+        elif getattr(self._executor, '_broken', False):
+            # A hashing process died (e.g. OOM killed): the pool fails its
+            # pending futures, whose callbacks release their slots, and would
+            # raise BrokenProcessPool on every later submit
+            self._executor.shutdown(wait=False)
+            self._executor = ProcessPoolExecutor(max_workers=self._processes)
+            self._stats['restarts'] += 1
+        return self._executor
+
+    def submit(self, function, *args) -> Future:
+        """
+        Run ``function(*args)`` in a hashing process.
+
+        Raises:
+            HashingBusyError: If the queue is full.
+        """
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self._max_pending:
+                self._stats['rejected'] += 1
+                raise HashingBusyError("Too many password checks in progress, try again later.")
+            self._pending += 1
+            self._stats['submitted'] += 1
+        submitted_at = time.monotonic()
+        try:
+            try:
+                future = executor.submit(function, *args)
+            except BrokenProcessPool:
+                # Broke after the check above: retry once on a new pool
+                with self._lock:
+                    executor = self._get_executor()
+                future = executor.submit(function, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda done: self._finish(done, submitted_at))
+        return future
+
+    def run(self, function, *args):
+        """Run ``function(*args)`` in a hashing process and wait for its result."""
+        return self.submit(function, *args).result()
+
+    def _finish(self, future: Future, submitted_at: float):
+        latency = time.monotonic() - submitted_at
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._stats['failed'] += 1
+                return
+            self._stats['completed'] += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def stats(self) -> dict:
+        """Return the queue depth and hash latency (seconds, queueing included)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['processes'] = self._processes
+            stats['pending'] = self._pending
+            stats['queued'] = max(0, self._pending - self._processes)
+            stats['max_pending'] = self._max_pending
+            completed = self._stats['completed']
+            stats['latency_avg'] = self._latency_total / completed if completed else 0.0
+            stats['latency_max'] = self._latency_max
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,433 @@
+import argparse
+import configparser
+import os
+import re
+import sys
+import time
+import mysql.connector
+import database_module as dm
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'database', 'database.sql')
+
+
+def connect(create_database: bool = False):
+    """
+    Connect to the configured database, creating it first if asked to.
+    """
+    connection = mysql.connector.connect(
+        host=config.get('database', 'host'),
+        port=config.get('database', 'port'),
+        user=config.get('database', 'user'),
+        password=config.get('database', 'password')
+    )
+    database = config.get('database', 'database')
+    cursor = connection.cursor()
+    if create_database:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    cursor.execute(f"USE `{database}`")
+    cursor.close()
+    return connection
+
+
+def _table_exists(cursor, table: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def _index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def _column_type(cursor, table: str, column: str) -> str:
+    cursor.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    row = cursor.fetchone()
+    return row[0].lower() if row else None
+
+
+def _add_column(cursor, table: str, column: str, definition: str):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _add_index(cursor, table: str, index: str, columns: str, unique: bool = False):
+    if not _index_exists(cursor, table, index):
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index} ON {table} ({columns})")
+
+
+def _schema_statements(path: str = SCHEMA_PATH) -> list:
+    """Return the statements of database.sql, without comments and the database selection."""
+    with open(path) as file:
+        text = '\n'.join(line.split('--')[0] for line in file)
+    statements = [statement.strip() for statement in text.split(';')]
+    return [statement for statement in statements
+            if statement and not re.match(r'(CREATE DATABASE|USE)\b', statement, re.IGNORECASE)]
+
+
+def base_schema(cursor):
+    """
+    Create the tables of database.sql that do not exist yet, with their indexes.
+
+    Tables that already exist are left to the following migrations, which bring
+    them to the same shape.
+    """
+    created = set()
+    for statement in _schema_statements():
+        table = re.match(r'CREATE TABLE (\w+)', statement, re.IGNORECASE)
+        if table:
+            if not _table_exists(cursor, table.group(1)):
+                cursor.execute(statement)
+                created.add(table.group(1))
+            continue
+        index = re.match(r'CREATE (?:UNIQUE )?INDEX (\w+) ON (\w+)', statement, re.IGNORECASE)
+        if index and index.group(2) in created and not _index_exists(cursor, index.group(2), index.group(1)):
+            cursor.execute(statement)
+
+
+def user_email_index(cursor):
+    _add_index(cursor, 'users', 'idx_users_email', 'emailId(191)')
+
+
+def unique_cart_lines(cursor):
+    """Merge duplicated cart lines, then enforce one row per line for the cart upserts."""
+    if _index_exists(cursor, 'cart_items', 'uq_cart_items_line'):
+        return
+    duplicates = """
+        SELECT MIN(_key) AS keep, userKey, productKey, variationQuantity, SUM(noOfItems) AS total
+        FROM cart_items
+        GROUP BY userKey, productKey, variationQuantity
+        HAVING COUNT(*) > 1
+    """
+    cursor.execute(f"""
+        UPDATE cart_items c JOIN ({duplicates}) d ON c._key = d.keep
+        SET c.noOfItems = d.total
+    """)
+    cursor.execute(f"""
+        DELETE c FROM cart_items c JOIN ({duplicates}) d
+            ON c.userKey = d.userKey AND c.productKey = d.productKey
+            AND c.variationQuantity = d.variationQuantity AND c._key <> d.keep
+    """)
+    _add_index(cursor, 'cart_items', 'uq_cart_items_line', 'userKey, productKey, variationQuantity', unique=True)
+
+
+def order_history_index(cursor):
+    _add_index(cursor, 'orders', 'idx_orders_user_date', 'userKey, orderedDate, _key')
+
+
+def category_sort_keys(cursor):
+    added = not _column_exists(cursor, 'product_categories', 'minPrice')
+    _add_column(cursor, 'product_categories', 'productRating', 'DOUBLE NOT NULL DEFAULT 0')
+    _add_column(cursor, 'product_categories', 'minPrice', 'DOUBLE NOT NULL DEFAULT 0')
+    _add_index(cursor, 'product_categories', 'idx_product_categories_newest', 'categoryKey, productKey')
+    _add_index(cursor, 'product_categories', 'idx_product_categories_rating', 'categoryKey, productRating, productKey')
+    _add_index(cursor, 'product_categories', 'idx_product_categories_price', 'categoryKey, minPrice, productKey')
+    if added:
+        cursor.execute(dm.CATEGORY_SORT_KEYS_SQL)
+
+
+def exact_category_sort_keys(cursor):
+    """
+    Store the category sort keys as DOUBLE.
+
+    Page cursors carry the sort value of the last row as a double; compared with
+    a FLOAT column it never matched the stored value, so rows tied at a page
+    boundary were skipped.
+    """
+    changed = False
+    for column in ('productRating', 'minPrice'):
+        if _column_type(cursor, 'product_categories', column) == 'float':
+            cursor.execute(f"ALTER TABLE product_categories MODIFY COLUMN {column} DOUBLE NOT NULL DEFAULT 0")
+            changed = True
+    if changed:
+        cursor.execute(dm.CATEGORY_SORT_KEYS_SQL)
+
+
+def delivery_stages(cursor):
+    _add_column(cursor, 'orders', 'currentStage', 'VARCHAR(64)')
+    _add_index(cursor, 'orders', 'idx_orders_stage_date', 'currentStage, orderedDate, _key')
+    if not _table_exists(cursor, 'order_delivery_stages'):
+        cursor.execute("""
+            CREATE TABLE order_delivery_stages (
+              orderKey INT NOT NULL,
+              position SMALLINT NOT NULL,
+              stage VARCHAR(64) NOT NULL,
+              PRIMARY KEY (orderKey, position),
+              FOREIGN KEY (orderKey) REFERENCES orders(_key)
+            )
+        """)
+    # Older orders keep their comma-separated stages, the last one is current
+    cursor.execute("""
+        UPDATE orders SET currentStage = SUBSTRING_INDEX(deliveryStages, ',', -1)
+        WHERE currentStage IS NULL AND deliveryStages IS NOT NULL AND deliveryStages <> ''
+    """)
+
+
+def order_checkout_token(cursor):
+    _add_column(cursor, 'orders', 'checkoutToken', 'CHAR(32)')
+    _add_column(cursor, 'orders', 'checkoutLine', 'SMALLINT')
+    _add_index(cursor, 'orders', 'uq_orders_checkout', 'checkoutToken, checkoutLine', unique=True)
+
+
+# Applied in order, each once. Every migration checks the current schema before
+# changing it, so it is safe to run again after a partial failure. Append new
+# ones at the end and never renumber.
+MIGRATIONS = [
+    (1, 'Base schema', base_schema),
+    (2, 'Index users by email', user_email_index),
+    (3, 'One cart row per cart line', unique_cart_lines),
+    (4, 'Index order history by user and date', order_history_index),
+    (5, 'Category sort keys and indexes', category_sort_keys),
+    (6, 'Delivery stages table and current stage index', delivery_stages),
+    (7, 'Category sort keys as DOUBLE', exact_category_sort_keys),
+    (8, 'Checkout token on orders', order_checkout_token),
+]
+
+
+def applied_versions(cursor) -> set:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version INT PRIMARY KEY,
+          description VARCHAR(255) NOT NULL,
+          appliedAt BIGINT NOT NULL
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(connection, target: int = None) -> list:
+    """
+    Apply the pending migrations up to ``target``, all of them if None.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    cursor = connection.cursor(buffered=True)
+    applied = []
+    try:
+        done = applied_versions(cursor)
+        for version, description, migration in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+            start = time.perf_counter()
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description, appliedAt) VALUES (%s, %s, %s)",
+                (version, description, int(time.time()))
+            )
+            connection.commit()
+            applied.append(version)
+            print(f"Applied {version}: {description} ({time.perf_counter() - start:.1f}s)")
+    finally:
+        cursor.close()
+    return applied
+
+
+class _ExplainingCursor:
+    """
+    Cursor that EXPLAINs every statement before running it. SELECTs then run for
+    real so the calling code follows its normal path; other statements are only
+    explained and act as if they changed ``rowcount`` rows.
+    """
+
+    def __init__(self, cursor, plans: list, label: str):
+        self._cursor = cursor
+        self._plans = plans
+        self._label = label
+        self._selected = False
+        self.rowcount = 0
+        self.lastrowid = 0
+
+    def execute(self, sql, params=None):
+        self._cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in self._cursor.description]
+        self._plans.append((self._label, ' '.join(sql.split()), [dict(zip(columns, row)) for row in self._cursor.fetchall()]))
+        self._selected = sql.lstrip().upper().startswith('SELECT')
+        if self._selected:
+            self._cursor.execute(sql, params)
+            self.rowcount = self._cursor.rowcount
+        else:
+            self.rowcount = sys.maxsize
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        if seq_params:
+            self.execute(sql, seq_params[0])
+
+    def fetchall(self):
+        return self._cursor.fetchall() if self._selected else []
+
+    def fetchone(self):
+        return self._cursor.fetchone() if self._selected else None
+
+    def close(self):
+        self._cursor.close()
+
+
+class _ExplainingConnection:
+    """Connection handed to database_module during the check; nothing is committed."""
+
+    def __init__(self, connection, plans: list):
+        self._connection = connection
+        self._plans = plans
+        self.label = None
+
+    def cursor(self, *args, **kwargs):
+        return _ExplainingCursor(self._connection.cursor(buffered=True), self._plans, self.label)
+
+    def commit(self):
+        self._connection.rollback()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.rollback()
+
+
+def _sample(cursor) -> dict:
+    """Pick existing keys to call database_module with."""
+    def first(query):
+        cursor.execute(query)
+        row = cursor.fetchone()
+        return row[0] if row else 1
+    return {
+        'user': first("SELECT _key FROM users ORDER BY _key LIMIT 1"),
+        'email': first("SELECT emailId FROM users ORDER BY _key LIMIT 1"),
+        'product': first("SELECT productKey FROM variations ORDER BY _key LIMIT 1"),
+        'variation': first("SELECT quantity FROM variations ORDER BY _key LIMIT 1"),
+        'category': first("SELECT categoryKey FROM product_categories LIMIT 1"),
+        'order': first("SELECT _key FROM orders ORDER BY _key LIMIT 1"),
+    }
+
+
+def _scenarios(sample: dict) -> list:
+    """
+    (label, call, tables expected to be scanned in full) for every query path
+    of database_module.
+    """
+    user, product, category = sample['user'], sample['product'], sample['category']
+    item = {'productKey': product, 'noOfItems': 1, 'variationQuantity': sample['variation']}
+    order = {'deliveryAddress': 'check', 'deliveryStages': ['Order Placed'], 'orderedDate': int(time.time()),
+             'paidPrice': 0, 'paymentStatus': 0, 'productDetails': item}
+    return [
+        ('get_cart_of_user', lambda: dm.get_cart_of_user(user), set()),
+        ('is_registered', lambda: dm.is_registered(sample['email']), set()),
+        ('get_user_for_login', lambda: dm.get_user_for_login(sample['email']), set()),
+        ('create_user', lambda: dm.create_user('check', 'check@example.com', 'check'), set()),
+        # The category list is tiny and cached
+        ('get_categories', dm.get_categories, {'categories'}),
+        # The search structures load the whole catalog once, then refresh by key
+        ('_load_search_rows', dm._load_search_rows, {'products'}),
+        ('_load_search_rows(keys)', lambda: dm._load_search_rows(keys=[product]), set()),
+        ('_load_autocomplete_rows', dm._load_autocomplete_rows, {'products'}),
+        ('_load_autocomplete_rows(keys)', lambda: dm._load_autocomplete_rows(keys=[product]), set()),
+        ('get_product_of_category', lambda: dm.get_product_of_category(category), set()),
+        ('get_category_page(newest)', lambda: dm.get_category_page(category, 'newest'), set()),
+        ('get_category_page(rating)', lambda: dm.get_category_page(category, 'rating'), set()),
+        ('get_category_page(price)', lambda: dm.get_category_page(category, 'price'), set()),
+        ('refresh_category_sort_keys', lambda: dm.refresh_category_sort_keys([product]), {'<derived2>'}),
+        ('get_product_from_key', lambda: dm.get_product_from_key([product]), set()),
+        ('add_to_cart', lambda: dm.add_to_cart([item], user), set()),
+        ('remove_from_cart', lambda: dm.remove_from_cart([item], user), set()),
+        ('change_no_of_product_in_cart', lambda: dm.change_no_of_product_in_cart({'old': item, 'new': item}, user), set()),
+        ('place_order', lambda: dm.place_order({'orders': [order]}, user), set()),
+        ('get_orders_of_user', lambda: dm.get_orders_of_user(user), set()),
+        ('get_orders_page', lambda: dm.get_orders_page(user, 20), set()),
+        ('get_orders_by_stage', lambda: dm.get_orders_by_stage('Order Placed', 20), set()),
+        ('advance_order_stage', lambda: dm.advance_order_stage(sample['order'], 'Delivered'), set()),
+    ]
+
+
+def check(connection) -> int:
+    """
+    EXPLAIN every query database_module runs and report full table scans.
+
+    Returns:
+        int: Number of unexpected full scans.
+    """
+    cursor = connection.cursor(buffered=True)
+    sample = _sample(cursor)
+    cursor.close()
+
+    plans = []
+    explaining = _ExplainingConnection(connection, plans)
+    expected = {}
+    get_db_connection = dm.get_db_connection
+    dm.get_db_connection = lambda: explaining
+    try:
+        for label, call, full_scans in _scenarios(sample):
+            explaining.label = label
+            expected[label] = full_scans
+            call()
+    finally:
+        dm.get_db_connection = get_db_connection
+        connection.rollback()
+
+    problems = 0
+    for label, sql, rows in plans:
+        for row in rows:
+            full_scan = row.get('type') == 'ALL'
+            if full_scan and row.get('table') not in expected[label]:
+                status = 'FULL SCAN'
+                problems += 1
+            else:
+                status = 'full scan (expected)' if full_scan else 'ok'
+            print(f"{label:32} {str(row.get('table')):24} {str(row.get('type')):8} "
+                  f"{str(row.get('key')):34} rows={row.get('rows')}  {status}")
+            if status == 'FULL SCAN':
+                print(f"    {sql[:160]}")
+    print(f"{len(plans)} statements explained, {problems} unexpected full scans")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schema migrations and query plan checks for the MySQL database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    up = subparsers.add_parser('up', help="Create the database if needed and apply pending migrations.")
+    up.add_argument('--to', type=int, default=None, help="Stop after this version.")
+    subparsers.add_parser('status', help="List migrations and whether they are applied.")
+    subparsers.add_parser('check', help="EXPLAIN every query of database_module and flag full table scans.")
+    args = parser.parse_args()
+
+    connection = connect(create_database=args.command == 'up')
+    try:
+        if args.command == 'up':
+            if not migrate(connection, args.to):
+                print("Schema is up to date")
+        elif args.command == 'status':
+            cursor = connection.cursor(buffered=True)
+            done = applied_versions(cursor)
+            cursor.close()
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:4} {'applied' if version in done else 'pending':8} {description}")
+        else:
+            sys.exit(1 if check(connection) else 0)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
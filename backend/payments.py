@@ -0,0 +1,184 @@
+import asyncio
+import configparser
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import stripe
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+PROVIDER = config.get('payment', 'provider', fallback='stripe')
+WORKERS = config.getint('payment', 'workers', fallback=4)
+MAX_PENDING = config.getint('payment', 'max_pending', fallback=32)
+TIMEOUT = config.getfloat('payment', 'timeout', fallback=10.0)
+
+
+class PaymentBusyError(Exception):
+    """Raised when ``max_pending`` payment calls are already waiting for the provider."""
+
+
+class PaymentTimeoutError(Exception):
+    """Raised when the provider does not answer within the timeout."""
+
+
+class StripePaymentProvider:
+    """
+    Creates payment intents with Stripe.
+
+    The HTTP client gives up after ``timeout`` seconds, and retried requests
+    carry the idempotency key so Stripe never creates a second intent.
+    """
+
+    def __init__(self, api_key: str, timeout: float, network_retries: int = 2):
+        stripe.api_key = api_key
+        stripe.max_network_retries = network_retries
+        stripe.default_http_client = stripe.new_default_http_client(timeout=timeout)
+
+    def create_intent(self, amount, currency, idempotency_key: str) -> dict:
+        return stripe.PaymentIntent.create(
+            amount=amount,
+            currency=currency,
+            idempotency_key=idempotency_key,
+        )
+
+
+class StubPaymentProvider:
+    """
+    Offline provider for development and load tests.
+
+    Answers like Stripe for a payment that still needs confirming, after
+    ``latency`` seconds. The same idempotency key always gives the same intent.
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def create_intent(self, amount, currency, idempotency_key: str) -> dict:
+        time.sleep(self.latency)
+        intent_id = f'pi_stub_{idempotency_key[:24]}'
+        return {
+            'id': intent_id,
+            'amount': amount,
+            'currency': currency,
+            'status': 'requires_payment_method',
+            'client_secret': f'{intent_id}_secret_stub',
+        }
+
+
+def _create_provider():
+    if PROVIDER == 'stub':
+        return StubPaymentProvider(config.getfloat('payment', 'stub_latency', fallback=0.05))
+    return StripePaymentProvider(config.get('stripe_key', 'secret_key'), TIMEOUT,
+                                 config.getint('payment', 'network_retries', fallback=2))
+
+
+provider = _create_provider()
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='payment')
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+_in_flight = {}  # idempotency key -> Future
+_in_flight_lock = threading.Lock()
+
+
+def _scoped_key(*parts) -> str:
+    payload = json.dumps(parts, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def idempotency_key(body: dict, user=None, client_key: str = None) -> tuple:
+    """
+    Choose the idempotency key of a payment request.
+
+    - A client key (the ``Idempotency-Key`` header) is used when given, hashed
+      together with the user so one caller can never share, or replay, the
+      payment of another.
+    - Otherwise an authenticated user paying a real ``orderId`` gets a key
+      derived from both, so resubmitting the order maps to the same intent.
+    - Otherwise the checkout gets a new random client key, which the client
+      must send back as ``Idempotency-Key`` when it retries.
+
+    Args:
+        body: The decoded payment request.
+        user: The authenticated userKey, None for an anonymous payer.
+        client_key: The ``Idempotency-Key`` header, if any.
+
+    Returns:
+        tuple: (key sent to the provider, client key to return to the client or None).
+    """
+    if client_key:
+        return _scoped_key('client', user, client_key), client_key
+    if user is not None and body.get('orderId') is not None:
+        return _scoped_key('order', user, body['orderId']), None
+    client_key = secrets.token_urlsafe(24)
+    return _scoped_key('client', user, client_key), client_key
+
+
+def _finish(key: str, future):
+    with _in_flight_lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+    _pending.release()
+
+
+def submit(amount, currency, key: str):
+    """
+    Start creating a payment intent on the payment executor.
+
+    A request with the same key as one still in progress shares its future, so
+    a double submit makes a single provider call.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the provider's payment intent.
+
+    Raises:
+        PaymentBusyError: If ``[payment] max_pending`` calls are already in progress.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        if not _pending.acquire(blocking=False):
+            raise PaymentBusyError("Too many payments in progress, try again later.")
+        future = _executor.submit(provider.create_intent, amount, currency, key)
+        _in_flight[key] = future
+    future.add_done_callback(lambda done: _finish(key, done))
+    return future
+
+
+def create_payment_intent(amount, currency, key: str, timeout: float = None) -> dict:
+    """
+    Create a payment intent, waiting at most ``timeout`` seconds ([payment] timeout by default).
+
+    Raises:
+        PaymentBusyError: If too many payments are in progress.
+        PaymentTimeoutError: If the provider does not answer in time. The call
+            keeps running, and retrying with the same key waits for it.
+    """
+    timeout = TIMEOUT if timeout is None else timeout
+    try:
+        return submit(amount, currency, key).result(timeout=timeout)
+    except FutureTimeoutError as e:
+        raise PaymentTimeoutError(f"Payment provider did not answer within {timeout} seconds.") from e
+
+
+async def create_payment_intent_async(amount, currency, key: str, timeout: float = None) -> dict:
+    """Awaitable equivalent of create_payment_intent."""
+    timeout = TIMEOUT if timeout is None else timeout
+    future = asyncio.wrap_future(submit(amount, currency, key))
+    try:
+        # Shielded: a timed out request must not cancel the call other requests share
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError as e:
+        raise PaymentTimeoutError(f"Payment provider did not answer within {timeout} seconds.") from e
+
+
+def stats() -> dict:
+    with _in_flight_lock:
+        in_flight = len(_in_flight)
+    return {'provider': PROVIDER, 'in_flight': in_flight, 'max_pending': MAX_PENDING}
@@ -1,27 +1,713 @@
-import numpy as np
+import configparser
+import json
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
 
 batch_size = 10000
-data = np.load(os.path.abspath('assets/similarity_matrices.npz'))
-similarity_matrices = [data[f'arr_{i}'] for i in range(len(data.files))]
+npz_path = os.path.abspath(config.get('recommendation', 'npz_path', fallback='assets/similarity_matrices.npz'))
+assets_dir = os.path.abspath(config.get('recommendation', 'assets_dir', fallback='assets/similarity'))
+
+MANIFEST_NAME = 'manifest.json'
+# A store directory holds one subdirectory per build and a CURRENT file naming
+# the one being served; the previous builds are kept for processes still on them
+CURRENT_NAME = 'CURRENT'
+KEPT_VERSIONS = config.getint('recommendation', 'kept_versions', fallback=3)
+
+
+def batch_file_name(index: int, part: str = None) -> str:
+    if part:
+        return f'batch_{index:04d}.{part}.npy'
+    return f'batch_{index:04d}.npy'
+
+
+class CsrBatch:
+    """
+    One similarity batch reduced to the top-K entries of every row, in CSR form.
+
+    Indexing densifies rows (entries that were dropped read as 0), so a sparse
+    batch can stand in for a dense one; row_entries gives the stored entries only.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, columns: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, columns)
+
+    def row_entries(self, position: int):
+        """Return (ids, scores) of a row, ordered by descending score."""
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def _dense_row(self, position: int) -> np.ndarray:
+        row = np.zeros(self.shape[1], dtype=self.data.dtype)
+        ids, scores = self.row_entries(position)
+        row[ids] = scores
+        return row
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return np.array([self._dense_row(position) for position in range(*item.indices(self.shape[0]))])
+        if item < 0:
+            item += self.shape[0]
+        if not 0 <= item < self.shape[0]:
+            raise IndexError(f"row {item} out of range")
+        return self._dense_row(item)
+
+
+class SimilarityStore:
+    """
+    Similarity batches opened lazily on first access.
+
+    A directory written by `python build_rcm_assets.py npy` holds one uncompressed
+    ``.npy`` file per batch, memory-mapped read-only so every worker process shares
+    the pages through the OS page cache. The same layout may hold float16 batches,
+    or top-K CSR batches (``format: sparse`` in the manifest), both written by
+    `python build_rcm_assets.py convert`. The compressed ``.npz`` archive is still
+    supported, but each batch is then decompressed into process memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path = resolve_store_path(path)
+        self._lock = threading.Lock()
+        if os.path.isdir(path):
+            with open(os.path.join(path, MANIFEST_NAME)) as f:
+                self.manifest = json.load(f)
+            self._archive = None
+            count = self.manifest['batches']
+        else:
+            self.manifest = {'format': 'npz'}
+            self._archive = np.load(path)
+            count = len(self._archive.files)
+        self._batches = [None] * count
+
+    def __len__(self):
+        return len(self._batches)
+
+    def batch(self, index: int) -> np.ndarray:
+        matrix = self._batches[index]
+        if matrix is None:
+            with self._lock:
+                matrix = self._batches[index]
+                if matrix is None:
+                    matrix = self._load(index)
+                    self._batches[index] = matrix
+        return matrix
+
+    def _load(self, index: int):
+        if self._archive is not None:
+            return self._archive[f'arr_{index}']
+        if self.manifest['format'] == 'sparse':
+            parts = [
+                np.load(os.path.join(self.path, batch_file_name(index, part)), mmap_mode='r')
+                for part in ('indptr', 'indices', 'data')
+            ]
+            return CsrBatch(*parts, columns=self.manifest['columns'])
+        return np.load(os.path.join(self.path, batch_file_name(index)), mmap_mode='r')
+
+    def load_all(self):
+        """
+        Decompress every batch of an npz archive into memory and close the archive.
+
+        The gunicorn master calls this before forking: the workers then share the
+        loaded batches copy-on-write instead of each decompressing its own, and no
+        open archive is inherited, whose shared file offset would interleave the
+        workers' reads. Directory stores are already shared through mmap and are
+        left as they are.
+        """
+        if self._archive is None:
+            return
+        with self._lock:
+            for index in range(len(self)):
+                if self._batches[index] is None:
+                    self._batches[index] = self._archive[f'arr_{index}']
+            self.manifest['rows'] = [matrix.shape[0] for matrix in self._batches]
+            self._archive.close()
+            self._archive = None
+
+    def neighbours(self, movie_id: int, k: int):
+        """Return the (ids, scores) of the ``k`` movies most similar to ``movie_id``."""
+        batch = self.batch(movie_id // batch_size)
+        position = movie_id % batch_size
+        if isinstance(batch, CsrBatch):
+            ids, scores = batch.row_entries(position)
+            keep = ids != movie_id
+            return ids[keep][:k], scores[keep][:k]
+        return top_k_neighbours(batch[position], k, exclude=movie_id)
+
+    def __iter__(self):
+        """
+        Yield every batch in order without keeping it, so a full pass over an
+        npz archive holds one decompressed batch at a time.
+        """
+        for index in range(len(self)):
+            matrix = self._batches[index]
+            yield matrix if matrix is not None else self._load(index)
+
+    def batch_rows(self) -> list:
+        """
+        Return the number of rows of every batch without loading any of them.
+
+        Stores written since the manifest records ``rows`` read it from there;
+        otherwise only the .npy headers are read.
+        """
+        if 'rows' in self.manifest:
+            return list(self.manifest['rows'])
+        rows = []
+        for index in range(len(self)):
+            if self._archive is not None:
+                with self._archive.zip.open(f'arr_{index}.npy') as f:
+                    read_header = (np.lib.format.read_array_header_1_0 if np.lib.format.read_magic(f) == (1, 0)
+                                   else np.lib.format.read_array_header_2_0)
+                    shape, _, _ = read_header(f)
+                rows.append(shape[0])
+            elif self.manifest['format'] == 'sparse':
+                indptr = np.load(os.path.join(self.path, batch_file_name(index, 'indptr')), mmap_mode='r')
+                rows.append(len(indptr) - 1)
+            else:
+                rows.append(np.load(os.path.join(self.path, batch_file_name(index)), mmap_mode='r').shape[0])
+        return rows
+
+
+def resolve_store_path(path: str) -> str:
+    """Return the build a versioned store directory currently points to, else ``path`` itself."""
+    pointer = os.path.join(path, CURRENT_NAME)
+    if os.path.isfile(pointer):
+        with open(pointer) as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def default_store_path() -> str:
+    """The npy directory if it has been built, else the npz archive."""
+    built = any(os.path.exists(os.path.join(assets_dir, name)) for name in (CURRENT_NAME, MANIFEST_NAME))
+    return assets_dir if built else npz_path
+
+
+def open_store(path: str = None) -> SimilarityStore:
+    """Open ``path``, or the default store."""
+    return SimilarityStore(path or default_store_path())
+
+
+def _replace_file(path: str, write):
+    # Write next to the target and rename over it: processes that still map the
+    # old file keep its inode, instead of seeing it truncated under them
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _save_array(path: str, values: np.ndarray):
+    _replace_file(path, lambda f: np.save(f, values))
+
+
+def _write_manifest(directory: str, manifest: dict):
+    _replace_file(os.path.join(directory, MANIFEST_NAME), lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+
+
+def _new_version(directory: str) -> str:
+    # Every build goes to a fresh subdirectory, so files a running process has
+    # mapped, or has yet to open lazily, are never rewritten
+    version_dir = os.path.join(directory, f'v{time.time_ns()}')
+    os.makedirs(version_dir)
+    return version_dir
+
+
+def _publish_version(directory: str, version_dir: str):
+    # The build is complete before CURRENT names it, and renaming CURRENT over
+    # the old one is atomic, so a reader sees either the old or the new build
+    _replace_file(os.path.join(directory, CURRENT_NAME),
+                  lambda f: f.write(os.path.basename(version_dir).encode('utf-8')))
+    versions = sorted(name for name in os.listdir(directory)
+                      if name.startswith('v') and os.path.isdir(os.path.join(directory, name)))
+    for name in versions[:-KEPT_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def write_npy_store(matrices, directory: str, dtype=None) -> str:
+    """
+    Write every batch as an uncompressed .npy file plus a manifest, one batch in memory at a time.
+
+    The batches go to a new build under ``directory``, which is only made
+    current once complete.
+
+    Args:
+        matrices: Dense similarity batches.
+        directory: Store directory.
+        dtype: Optional storage dtype, e.g. np.float16 to halve or quarter the footprint.
+
+    Returns:
+        str: The directory of the new build.
+    """
+    version_dir = _new_version(directory)
+    rows = []
+    stored_dtype = None
+    for index, matrix in enumerate(matrices):
+        matrix = np.asarray(matrix if dtype is None else matrix.astype(dtype))
+        _save_array(os.path.join(version_dir, batch_file_name(index)), matrix)
+        stored_dtype = str(matrix.dtype)
+        rows.append(matrix.shape[0])
+        del matrix
+    _write_manifest(version_dir, {'format': 'npy', 'batch_size': batch_size, 'batches': len(rows),
+                                  'dtype': stored_dtype, 'rows': rows})
+    _publish_version(directory, version_dir)
+    return version_dir
+
+
+def write_sparse_store(matrices, directory: str, k: int, dtype=np.float32) -> str:
+    """
+    Write only the top-K neighbours of every row, excluding the movie itself, as CSR batches.
+
+    Like write_npy_store, the batches go to a new build made current once complete.
+
+    Args:
+        matrices: Dense similarity batches.
+        directory: Store directory.
+        k: Entries kept per row.
+        dtype: Storage dtype of the scores.
+
+    Returns:
+        str: The directory of the new build.
+    """
+    version_dir = _new_version(directory)
+    rows = []
+    columns = 0
+    for index, matrix in enumerate(matrices):
+        ids, scores = _topk_rows(matrix, index * batch_size, k)
+        columns = matrix.shape[1]
+        indptr = np.arange(0, ids.size + 1, ids.shape[1], dtype=np.int64)
+        parts = {'indptr': indptr, 'indices': ids.ravel(), 'data': scores.astype(dtype).ravel()}
+        for part, values in parts.items():
+            _save_array(os.path.join(version_dir, batch_file_name(index, part)), values)
+        rows.append(matrix.shape[0])
+    _write_manifest(version_dir, {'format': 'sparse', 'batch_size': batch_size, 'batches': len(rows),
+                                  'dtype': np.dtype(dtype).name, 'k': k, 'columns': columns, 'rows': rows})
+    _publish_version(directory, version_dir)
+    return version_dir
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with hit/miss/eviction counters."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'capacity': self.capacity,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = LRUCache(config.getint('recommendation', 'cache_size', fallback=10000))
+
+
+def cache_stats() -> dict:
+    """Return the hit, miss and eviction counters of the recommendation cache."""
+    return _cache.stats()
+
+
+def clear_cache():
+    """Drop every cached recommendation, e.g. after the similarity assets changed."""
+    _cache.clear()
+
+
+# Precomputed neighbour table, built offline by `python build_rcm_assets.py topk`
+topk_index_path = os.path.abspath(config.get('recommendation', 'topk_index_path', fallback='assets/topk_index.npz'))
+
 
-def get_recommendations(movie_id: int):
+def load_topk_index(path=topk_index_path):
+    """
+    Load the precomputed neighbour table if it exists.
+
+    Returns:
+        tuple: (ids, scores), or (None, None) when there is no table.
+    """
+    if not path or not os.path.exists(path):
+        return None, None
+    with np.load(path) as index:
+        return index['ids'], index['scores']
+
+
+def _asset_signature(store_path: str, topk_path: str) -> tuple:
+    """Current build and modification times of the asset files, used to detect a newly shipped set."""
+    store_path = resolve_store_path(store_path)
+    paths = [store_path, topk_path]
+    if os.path.isdir(store_path):
+        paths.append(os.path.join(store_path, MANIFEST_NAME))
+    return (store_path,) + tuple(os.path.getmtime(path) if path and os.path.exists(path) else None for path in paths)
+
+
+class ModelAssets:
+    """
+    One immutable set of recommendation assets: the similarity store and the
+    optional top-K table.
+
+    Readers take a reference once per call and keep using it, so swapping in a
+    new set never disturbs a call in progress; the old set is freed when its
+    last reader returns.
+    """
+
+    def __init__(self, store: SimilarityStore, topk_ids=None, topk_scores=None, version: int = 0, signature=None):
+        self.store = store
+        self.topk_ids = topk_ids
+        self.topk_scores = topk_scores
+        self.version = version
+        self.signature = signature
+
+    @classmethod
+    def load(cls, store_path: str = None, topk_path: str = topk_index_path, version: int = 0):
+        """Open the store lazily and read the top-K table, if any."""
+        store = open_store(store_path)
+        ids, scores = load_topk_index(topk_path)
+        return cls(store, ids, scores, version, _asset_signature(store.path, topk_path))
+
+    def validate(self):
+        """
+        Check that the assets are consistent before they are served.
+
+        Memory-mapped batches are only opened, not read; npz batches are not
+        decompressed, so validation stays cheap.
+
+        Raises:
+            ValueError: If the store or the top-K table is malformed.
+        """
+        if len(self.store) == 0:
+            raise ValueError("Similarity store has no batches.")
+        movies = None
+        if self.store.manifest['format'] != 'npz':
+            columns = set()
+            movies = 0
+            for index in range(len(self.store)):
+                rows, cols = self.store.batch(index).shape
+                if rows > batch_size or (rows < batch_size and index != len(self.store) - 1):
+                    raise ValueError(f"Batch {index} has {rows} rows, expected {batch_size}.")
+                columns.add(cols)
+                movies += rows
+            if len(columns) != 1:
+                raise ValueError("Similarity batches disagree on the number of movies.")
+        if self.topk_ids is not None:
+            if self.topk_scores is None or self.topk_ids.shape != self.topk_scores.shape:
+                raise ValueError("Top-K ids and scores have different shapes.")
+            if self.topk_ids.size and self.topk_ids.min() < 0:
+                raise ValueError("Top-K table holds negative movie ids.")
+            if movies is not None and self.topk_ids.shape[0] != movies:
+                raise ValueError(f"Top-K table covers {self.topk_ids.shape[0]} movies, store has {movies}.")
+
+
+_assets = None
+_assets_lock = threading.Lock()
+
+
+def get_assets() -> ModelAssets:
+    """Return the assets currently served, loading them on first use."""
+    global _assets
+    assets = _assets
+    if assets is None:
+        with _assets_lock:
+            if _assets is None:
+                _assets = ModelAssets.load(version=1)
+            assets = _assets
+    return assets
+
+
+def get_store() -> SimilarityStore:
+    return get_assets().store
+
+
+def assets_version() -> int:
+    return get_assets().version
+
+
+def reload_assets(store_path: str = None, topk_path: str = topk_index_path, background: bool = True):
+    """
+    Load a new asset set, validate it and swap it in atomically.
+
+    Loading and validation run without any lock held, so recommendations keep
+    being served from the current set meanwhile. If the new set fails to load or
+    validate, the current set stays in place.
+
+    Args:
+        store_path: npz archive or npy directory, the configured one by default.
+        topk_path: Top-K table, the configured one by default.
+        background: Run in a daemon thread and return it instead of blocking.
+
+    Returns:
+        The started thread when ``background``, else whether the swap happened.
+    """
+    if background:
+        thread = threading.Thread(target=reload_assets, args=(store_path, topk_path, False),
+                                  name='rcm-reload', daemon=True)
+        thread.start()
+        return thread
+
+    global _assets
+    try:
+        new_assets = ModelAssets.load(store_path, topk_path)
+        new_assets.validate()
+    except Exception as e:
+        print("error: failed to reload recommendation assets: ", e)
+        return False
+
+    with _assets_lock:
+        new_assets.version = (_assets.version if _assets else 0) + 1
+        _assets = new_assets
+    clear_cache()
+    print(f"Recommendation assets version {new_assets.version} loaded from {new_assets.store.path}")
+    return True
+
+
+_watcher = None
+
+
+def start_asset_watcher(interval: float):
+    """
+    Poll the asset files every ``interval`` seconds and reload them when they change.
+
+    Only one watcher runs per process; threads do not survive a fork, so a
+    forked worker calls this again to get its own.
+
+    Returns:
+        threading.Thread: The daemon watcher thread.
+    """
+    global _watcher
+    if _watcher is not None and _watcher.is_alive():
+        return _watcher
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            if _asset_signature(default_store_path(), topk_index_path) != get_assets().signature:
+                reload_assets(background=False)
+
+    _watcher = threading.Thread(target=watch, name='rcm-watcher', daemon=True)
+    _watcher.start()
+    return _watcher
+
+
+def top_k_neighbours(scores: np.ndarray, k: int, exclude: int = None):
+    """
+    Select the ``k`` highest scores of a similarity row without sorting the whole row.
+
+    Args:
+        scores: 1-D similarity row, indexed by movie id.
+        k: Number of neighbours to return.
+        exclude: Movie id left out of the result (the movie itself).
+
+    Returns:
+        tuple: (ids, scores) ordered by descending score, ties by ascending id.
+    """
+    n = scores.shape[0]
+    # One spare candidate covers the excluded id
+    take = min(k + 1, n)
+    if take < n:
+        candidates = np.argpartition(-scores, take - 1)[:take]
+    else:
+        candidates = np.arange(n)
+    candidate_scores = scores[candidates]
+    order = np.lexsort((candidates, -candidate_scores))
+    candidates = candidates[order]
+    if exclude is not None:
+        candidates = candidates[candidates != exclude]
+    candidates = candidates[:k]
+    return candidates, scores[candidates]
+
+
+def _topk_of_rows(rows: np.ndarray, movie_ids: np.ndarray, k: int):
+    """Vectorised top-``k`` of several dense rows, each excluding its own movie id."""
+    n = rows.shape[1]
+    take = min(k + 1, n)
+    if take < n:
+        candidates = np.argpartition(-rows, take - 1, axis=1)[:, :take]
+    else:
+        candidates = np.broadcast_to(np.arange(n), rows.shape)
+    candidate_scores = np.take_along_axis(rows, candidates, axis=1)
+    # Rank by descending score, ties by id, and push the movie itself last
+    is_self = candidates == movie_ids[:, None]
+    order = np.lexsort((candidates, -candidate_scores, is_self), axis=1)
+    candidates = np.take_along_axis(candidates, order, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)[:, :k]
+    return candidates.astype(np.int32), candidate_scores.astype(np.float32)
+
+
+def _topk_rows(matrix, first_movie_id: int, k: int, rows_per_chunk: int = 512):
+    ids_parts, score_parts = [], []
+    for start in range(0, matrix.shape[0], rows_per_chunk):
+        chunk = np.asarray(matrix[start:start + rows_per_chunk])
+        movie_ids = first_movie_id + start + np.arange(chunk.shape[0])
+        ids, scores = _topk_of_rows(chunk, movie_ids, k)
+        ids_parts.append(ids)
+        score_parts.append(scores)
+    return np.concatenate(ids_parts), np.concatenate(score_parts)
+
+
+def build_topk_index(matrices, k: int, rows_per_chunk: int = 512):
+    """
+    Precompute the ``k`` nearest neighbours of every movie.
+
+    Args:
+        matrices: Similarity batches; row ``i`` of batch ``b`` is movie ``b * batch_size + i``.
+        k: Neighbours kept per movie.
+        rows_per_chunk: Rows processed at once, bounds the temporary memory.
+
+    Returns:
+        tuple: (ids int32 array, scores float32 array), both of shape (movies, k).
+    """
+    ids_parts, score_parts = [], []
+    for batch_index, matrix in enumerate(matrices):
+        ids, scores = _topk_rows(matrix, batch_index * batch_size, k, rows_per_chunk)
+        ids_parts.append(ids)
+        score_parts.append(scores)
+    return np.concatenate(ids_parts), np.concatenate(score_parts)
+
+
+def save_topk_index(path, ids: np.ndarray, scores: np.ndarray):
+    _replace_file(path, lambda f: np.savez(f, ids=ids, scores=scores))
+
+
+def get_recommendations(movie_id: int, k: int = 10):
     try:
-        # Determine the batch index and position within the batch
-        batch_index = movie_id // batch_size  # Integer division
-        position_in_batch = movie_id % batch_size 
+        if movie_id < 0:
+            return []
 
-        # Load the correct similarity matrix
-        similarity_matrix = similarity_matrices[batch_index] 
+        assets = get_assets()
+        key = (assets.version, movie_id, k)
+        cached = _cache.get(key)
+        if cached is not None:
+            return list(cached)
 
-        # Get similarity scores for the movie (use position_in_batch directly)
-        sim_scores = list(enumerate(similarity_matrix[position_in_batch]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        sim_scores = sim_scores[1:11]  # Get top 10 recommendations (excluding the movie itself)
+        # Served straight from the precomputed table when it is deep enough
+        topk_ids = assets.topk_ids
+        if topk_ids is not None and k <= topk_ids.shape[1] and movie_id < topk_ids.shape[0]:
+            movie_indices = topk_ids[movie_id, :k].tolist()
+        else:
+            # Get top recommendations (excluding the movie itself) from the similarity batch
+            movie_indices = assets.store.neighbours(movie_id, k)[0].tolist()
 
-        # Get movie indices for recommendations
-        movie_indices = [i[0] for i in sim_scores]
+        _cache.put(key, tuple(movie_indices))
         return movie_indices
     except Exception as e:
         print("error: ", e)
-        return []
\ No newline at end of file
+        return []
+
+
+def get_recommendations_batch(movie_ids: list, k: int = 10) -> dict:
+    """
+    Get the top-``k`` recommendations of many movies at once.
+
+    Ids served by the precomputed table are looked up with one fancy index; the
+    rest are grouped by similarity batch and ranked with one vectorised
+    argpartition per batch.
+
+    Returns:
+        dict: movie id -> list of recommended movie ids, empty for unknown ids.
+    """
+    result = {movie_id: [] for movie_id in movie_ids}
+    try:
+        assets = get_assets()
+    except Exception as e:
+        print("error: ", e)
+        return result
+
+    pending = []
+    for movie_id in result:
+        if movie_id < 0:
+            continue
+        cached = _cache.get((assets.version, movie_id, k))
+        if cached is not None:
+            result[movie_id] = list(cached)
+        else:
+            pending.append(movie_id)
+    computed = []
+
+    topk_ids = assets.topk_ids
+    if topk_ids is not None and k <= topk_ids.shape[1]:
+        indexed = [movie_id for movie_id in pending if movie_id < topk_ids.shape[0]]
+        if indexed:
+            rows = topk_ids[np.asarray(indexed), :k].tolist()
+            result.update(zip(indexed, rows))
+            computed += indexed
+        pending = [movie_id for movie_id in pending if movie_id >= topk_ids.shape[0]]
+
+    if pending:
+        try:
+            computed += _batch_from_store(assets.store, pending, k, result)
+        except Exception as e:
+            print("error: ", e)
+
+    for movie_id in computed:
+        _cache.put((assets.version, movie_id, k), tuple(result[movie_id]))
+    return result
+
+
+def _batch_from_store(store: SimilarityStore, pending: list, k: int, result: dict) -> list:
+    """Fill ``result`` for ids not served by the top-K table and return the ids computed."""
+    computed = []
+
+    groups = {}
+    for movie_id in pending:
+        groups.setdefault(movie_id // batch_size, []).append(movie_id)
+
+    for batch_index, ids in groups.items():
+        if batch_index >= len(store):
+            continue
+        batch = store.batch(batch_index)
+        ids = [movie_id for movie_id in ids if movie_id % batch_size < batch.shape[0]]
+        if not ids:
+            continue
+        if isinstance(batch, CsrBatch):
+            for movie_id in ids:
+                result[movie_id] = store.neighbours(movie_id, k)[0].tolist()
+        else:
+            positions = np.asarray(ids) % batch_size
+            rows = np.asarray(batch[positions])
+            neighbour_ids, _ = _topk_of_rows(rows, np.asarray(ids), k)
+            result.update(zip(ids, neighbour_ids.tolist()))
+        computed += ids
+
+    return computed
@@ -0,0 +1,122 @@
+import bisect
+import re
+import threading
+import unicodedata
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    """Case-fold and strip accents so 'Amélie' and 'amelie' match."""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> list:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    """
+    Inverted index over product names with prefix-aware lookups.
+
+    Every query term matches index tokens equal to it or starting with it, using
+    a sorted vocabulary and binary search, so the cost depends on the matching
+    postings rather than on the catalog size.
+    """
+
+    EXACT_SCORE = 2
+    PREFIX_SCORE = 1
+
+    def __init__(self):
+        self._postings = {}   # token -> set of product keys
+        self._vocabulary = []  # sorted tokens
+        self._documents = {}  # product key -> (tokens, rating)
+        self._lock = threading.RLock()
+        self.max_key = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def build(self, rows):
+        """Replace the index content with (key, name, rating) rows."""
+        postings, documents = {}, {}
+        for key, name, rating in rows:
+            tokens = tuple(dict.fromkeys(tokenize(name)))
+            documents[key] = (tokens, rating)
+            for token in tokens:
+                postings.setdefault(token, set()).add(key)
+        with self._lock:
+            self._postings = postings
+            self._documents = documents
+            self._vocabulary = sorted(postings)
+            self.max_key = max(documents, default=0)
+
+    def upsert(self, key, name: str, rating=None):
+        with self._lock:
+            self._remove(key)
+            tokens = tuple(dict.fromkeys(tokenize(name)))
+            self._documents[key] = (tokens, rating)
+            for token in tokens:
+                keys = self._postings.get(token)
+                if keys is None:
+                    keys = self._postings[token] = set()
+                    bisect.insort(self._vocabulary, token)
+                keys.add(key)
+            self.max_key = max(self.max_key, key)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        for token in document[0]:
+            keys = self._postings[token]
+            keys.discard(key)
+            if not keys:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def _matches(self, term: str) -> dict:
+        """Return product key -> score of the best index token matching ``term``."""
+        scores = {}
+        vocabulary = self._vocabulary
+        for position in range(bisect.bisect_left(vocabulary, term), len(vocabulary)):
+            token = vocabulary[position]
+            if not token.startswith(term):
+                break
+            score = self.EXACT_SCORE if token == term else self.PREFIX_SCORE
+            for key in self._postings[token]:
+                if scores.get(key, 0) < score:
+                    scores[key] = score
+        return scores
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """
+        Return the keys of the products whose names match every term of ``query``.
+
+        Results are ranked by match quality (whole words before prefixes), then by
+        product rating, then by key.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        with self._lock:
+            # Rarest terms first keeps the intersection small
+            matches = sorted((self._matches(term) for term in terms), key=len)
+            scores = dict(matches[0])
+            for term_matches in matches[1:]:
+                scores = {key: score + term_matches[key] for key, score in scores.items() if key in term_matches}
+                if not scores:
+                    return []
+            ranked = sorted(
+                scores.items(),
+                key=lambda item: (-item[1], -(self._documents[item[0]][1] or 0), item[0])
+            )
+        return [key for key, _ in ranked[:limit]]
@@ -1,21 +1,63 @@
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 import bcrypt
 import jwt
 import configparser
 import os
+from hashing_pool import HashingBusyError, HashingPool
 
 # initiate
 config = configparser.ConfigParser()
 config.read(os.path.abspath('config.ini'))
 SECRET_KEY = config.get('key', 'key')
+TOKEN_CACHE_SIZE = config.getint('auth', 'token_cache_size', fallback=10000)
+BCRYPT_ROUNDS = config.getint('hashing', 'rounds', fallback=12)
 
+hashing_pool = HashingPool(
+    processes=config.getint('hashing', 'processes', fallback=2),
+    queue_size=config.getint('hashing', 'queue_size', fallback=32)
+)
 
+_token_cache = OrderedDict()  # token digest -> (userKey, exp)
+_token_cache_lock = threading.Lock()
+
+
+def _cached_user_key(digest: bytes):
+    with _token_cache_lock:
+        entry = _token_cache.get(digest)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del _token_cache[digest]
+            return None
+        _token_cache.move_to_end(digest)
+        return entry[0]
+
+
+def _cache_user_key(digest: bytes, user_key, expiration_timestamp):
+    with _token_cache_lock:
+        _token_cache[digest] = (user_key, expiration_timestamp)
+        _token_cache.move_to_end(digest)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+
+def clear_token_cache():
+    with _token_cache_lock:
+        _token_cache.clear()
 
 
 def decode_jwt_token(token, secret_key=SECRET_KEY) -> bool:
     """
     Decodes a JWT token and checks if it's expired.
 
+    Tokens signed with the configured key are verified once and then served
+    from a bounded cache until their ``exp``, keyed by a digest of the token.
+
     Args:
         token: The JWT token to decode.
         secret_key: The secret key used to encode the token.
@@ -29,6 +71,13 @@ def decode_jwt_token(token, secret_key=SECRET_KEY) -> bool:
     try:
         if not secret_key:
             raise ValueError("Secret key not found.")
+        cached = secret_key == SECRET_KEY and TOKEN_CACHE_SIZE > 0
+        if cached:
+            digest = hashlib.blake2b(token.encode('utf-8') if isinstance(token, str) else token,
+                                     digest_size=16).digest()
+            user_key = _cached_user_key(digest)
+            if user_key is not None:
+                return user_key
         payload = jwt.decode(token, secret_key, algorithms=['HS256'])
         
         # Check if the 'exp' (expiration) claim exists
@@ -42,6 +91,8 @@ def decode_jwt_token(token, secret_key=SECRET_KEY) -> bool:
             return None
             # raise ValueError("JWT token does not contain correct info.")
 
+        if cached and payload['userKey'] is not None:
+            _cache_user_key(digest, payload['userKey'], expiration_timestamp)
         return payload['userKey']
     except jwt.exceptions.DecodeError:
         return None
@@ -67,32 +118,66 @@ def create_jwt_token(userKey, expires_in_minutes=30):
         raise ValueError("Error creating JWT token") from e
     
  
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
 def check_password(user, password):
     """
     Check password with the given user info and password.
 
+    The bcrypt check runs in the hashing pool.
+
     Args:
         user (dict): The user info.
         password (string): The password entered by user.
 
     Returns:
         bool: Password is correct or not.
+
+    Raises:
+        HashingBusyError: If the hashing queue is full.
     """
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), bytes(user['hashed_password'])):
+    if not user:
         return False
-    return True
+    return hashing_pool.run(_checkpw, password.encode('utf-8'), bytes(user['hashed_password']))
 
 
 def generate_password_hash(password):
     """
-    Hash password with the given password.
+    Hash password with the given password, with [hashing] rounds as cost factor.
+
+    The hash is computed in the hashing pool.
 
     Args:
         password (string): The password entered by user.
 
     Returns:
         bytes: Hash password.
+
+    Raises:
+        HashingBusyError: If the hashing queue is full.
     """
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt)
+    return hashing_pool.run(_hashpw, password.encode('utf-8'), BCRYPT_ROUNDS)
+
+
+def check_password_future(user, password):
+    """Like check_password, returning a concurrent.futures.Future of the result."""
+    if not user:
+        future = Future()
+        future.set_result(False)
+        return future
+    return hashing_pool.submit(_checkpw, password.encode('utf-8'), bytes(user['hashed_password']))
+
+
+def generate_password_hash_future(password):
+    """Like generate_password_hash, returning a concurrent.futures.Future of the hash."""
+    return hashing_pool.submit(_hashpw, password.encode('utf-8'), BCRYPT_ROUNDS)
+
 
+def hashing_stats() -> dict:
+    return hashing_pool.stats()
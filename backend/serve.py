@@ -0,0 +1,139 @@
+'''
+Production launcher: runs server.app under gunicorn with pre-forked workers.
+
+The master imports the app and loads the recommendation assets and search
+structures once, before forking, so every worker shares them copy-on-write
+instead of loading its own copy. Each worker creates its own database pool
+after the fork.
+
+Send SIGHUP to the master for a graceful reload: the assets and search
+structures are reloaded in the master, new workers start from them and the old
+workers finish their requests before exiting.
+'''
+import argparse
+import configparser
+import gc
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+import database_module as dm
+import rcm_model as rcm
+
+
+# initiate
+config = configparser.ConfigParser()
+config.read(os.path.abspath('config.ini'))
+
+RCM_RELOAD_INTERVAL = config.getfloat('recommendation', 'reload_interval', fallback=0)
+
+
+def default_workers() -> int:
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def _load_recommendation_store():
+    # An npz store is read through an open archive: load it whole here rather
+    # than let every worker inherit the handle
+    rcm.get_store().load_all()
+
+
+def preload(reload: bool = False):
+    '''
+    Load the read-only data every worker needs, then get the master ready to fork.
+
+    Args:
+        reload: Replace the data already loaded, on SIGHUP, instead of loading it
+            for the first time.
+    '''
+    if reload:
+        # Let the replaced assets and indexes be collected instead of staying
+        # in the permanent generation of the previous freeze
+        gc.unfreeze()
+        rcm.reload_assets(background=False)
+        _load_recommendation_store()
+        dm.rebuild_search_index()
+        dm.rebuild_autocomplete_index()
+        gc.collect()
+    else:
+        try:
+            _load_recommendation_store()
+        except Exception as e:
+            # Recommendations load lazily in the workers instead
+            print("error: failed to preload recommendation assets: ", e)
+        dm.get_search_index()
+        dm.get_autocomplete_index()
+    # The master serves no request: do not hand its sockets to the workers
+    dm.reset_pool(close_idle=True)
+    # Keep the garbage collector from writing to the shared objects, which
+    # would copy their pages into every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    dm.reset_pool()
+    if RCM_RELOAD_INTERVAL > 0:
+        rcm.start_asset_watcher(RCM_RELOAD_INTERVAL)
+
+
+def server_options(bind: str = None, workers: int = None, threads: int = None) -> dict:
+    '''
+    Build the gunicorn settings from the [server] section of config.ini.
+
+    Args:
+        bind: Overrides [server] bind.
+        workers: Overrides [server] workers; 0 means two per CPU plus one.
+        threads: Overrides [server] threads.
+    '''
+    if workers is None:
+        workers = config.getint('server', 'workers', fallback=0)
+    return {
+        'bind': bind or config.get('server', 'bind', fallback='127.0.0.1:5000'),
+        'workers': workers or default_workers(),
+        'threads': threads or config.getint('server', 'threads', fallback=4),
+        'timeout': config.getint('server', 'timeout', fallback=30),
+        'graceful_timeout': config.getint('server', 'graceful_timeout', fallback=30),
+        'max_requests': config.getint('server', 'max_requests', fallback=0),
+        'max_requests_jitter': config.getint('server', 'max_requests_jitter', fallback=0),
+        'preload_app': True,
+        'post_fork': post_fork,
+    }
+
+
+class ProductionServer(BaseApplication):
+
+    def __init__(self, options: dict):
+        self.options = options
+        self._preloaded = False
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from server import app
+        preload(reload=self._preloaded)
+        self._preloaded = True
+        return app
+
+    def reload(self):
+        # On SIGHUP the arbiter calls this in the master before forking the new
+        # workers. Refresh the preloaded data here, unless the app was dropped
+        # and load() is about to run again and do it
+        super().reload()
+        if self.callable is not None:
+            preload(reload=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked gunicorn workers.")
+    parser.add_argument('--bind', default=None, help="Address to listen on, [server] bind by default.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes, [server] workers by default.")
+    parser.add_argument('--threads', type=int, default=None, help="Threads per worker, [server] threads by default.")
+    args = parser.parse_args()
+
+    ProductionServer(server_options(args.bind, args.workers, args.threads)).run()
+
+
+if __name__ == '__main__':
+    main()
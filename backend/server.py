@@ -1,10 +1,13 @@
-from ast import literal_eval
-from flask import Flask, request, jsonify
+import functools
+import json
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS
 import security as sc
 import database_module as dm 
+import catalog_cache as cc
 import rcm_model as rcm 
-import stripe
+import payments
+from connection_pool import PoolTimeoutError
 import configparser
 import os
 
@@ -13,12 +16,74 @@ import os
 config = configparser.ConfigParser()
 config.read(os.path.abspath('config.ini'))
 
-# Initialize Stripe 
-stripe.api_key = config.get('stripe_key', 'secret_key')
+ORDER_PAGE_SIZE = config.getint('orders', 'page_size', fallback=50)
+MAX_ORDER_PAGE_SIZE = config.getint('orders', 'max_page_size', fallback=200)
+CATEGORY_PAGE_SIZE = config.getint('category_pages', 'page_size', fallback=20)
+MAX_CATEGORY_PAGE_SIZE = config.getint('category_pages', 'max_page_size', fallback=100)
+MAX_RELATED_BATCH_KEYS = config.getint('recommendation', 'max_batch_keys', fallback=100)
+MAX_RELATED_K = config.getint('recommendation', 'max_k', fallback=50)
+
+SEARCH_LIMIT = config.getint('search', 'limit', fallback=5)
+MAX_SEARCH_LIMIT = config.getint('search', 'max_limit', fallback=50)
+AUTOCOMPLETE_LIMIT = config.getint('search', 'autocomplete_limit', fallback=8)
+CATALOG_CACHE_CONTROL = config.get('http_cache', 'catalog_cache_control', fallback='public, max-age=60, must-revalidate')
+
+# Pick up newly shipped recommendation assets without restarting; the watcher
+# is started per serving process, never at import (see serve.post_fork)
+RCM_RELOAD_INTERVAL = config.getfloat('recommendation', 'reload_interval', fallback=0)
 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag'])
+
+
+@app.errorhandler(sc.HashingBusyError)
+def hashing_busy(error):
+    # Password hashing is saturated: ask the client to retry instead of queueing
+    return jsonify({'error': str(error)}), 429, {'Retry-After': '1'}
+
+
+@app.errorhandler(PoolTimeoutError)
+def pool_timeout(error):
+    # Every database connection stayed busy past [pool] timeout: shed the request
+    return jsonify({'error': 'Service busy, try again later.'}), 503, {'Retry-After': '1'}
+
+
+def require_auth(view):
+    '''
+    Reject requests without a valid token in the Authorization header, and
+    call the view with the userKey of the token as first argument.
+    '''
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({"error": "Authorization header missing"}), 401
+        userKey = sc.decode_jwt_token(token=auth_header)
+        if userKey is None:
+            return jsonify({"error": "Session expired"}), 404
+        return view(userKey, *args, **kwargs)
+    return wrapper
+
+
+def catalog_conditional(view):
+    '''
+    Add an ETag derived from the response body to a catalog endpoint, and answer
+    304 Not Modified without the body when the client copy is still current.
+    '''
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        etag = cc.catalog_etag(response.get_data())
+
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = CATALOG_CACHE_CONTROL
+        return response
+    return wrapper
 
 
 @app.route('/users/check_user', methods=['POST'])
@@ -78,13 +143,8 @@ def sign_up():
 
 
 @app.route('/users/get-current-user', methods=['GET'])
-def getCurrentUser():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
+@require_auth
+def getCurrentUser(userKey):
     user = dm.get_user_by_key(userKey)
         
     if user is not None:
@@ -94,6 +154,7 @@ def getCurrentUser():
 
 
 @app.route('/products/get-product-from-keys')
+@catalog_conditional
 def get_product_by_keys():
     productKeys:list = [int(key) for key in request.args.get('key').split(',')]
     print(productKeys)
@@ -101,20 +162,35 @@ def get_product_by_keys():
     if not productKeys:
         return jsonify({"error": "productKeys are required"}), 400
     
-    products:list = dm.get_product_from_key(productKeys)  # Adapt to fetch by category
+    products:list = cc.get_product_from_key(productKeys)
     
     return jsonify({'result':products}), 200
 
 
 
 @app.route('/products/get-products-from-category')
+@catalog_conditional
 def get_products_by_category():
     category = request.args.get('category')
     
     if not category:
         return jsonify({"error": "Category parameter is required"}), 400
     
-    productKeys = dm.get_product_of_category(category)  # Adapt to fetch by category
+    paged = any(name in request.args for name in ('sort', 'pageSize', 'cursor', 'hydrate'))
+    if paged:
+        sort = request.args.get('sort', 'newest')
+        page_size = max(1, min(request.args.get('pageSize', CATEGORY_PAGE_SIZE, type=int), MAX_CATEGORY_PAGE_SIZE))
+        try:
+            page = cc.get_category_page(category, sort, page_size, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = page['productKeys']
+        if request.args.get('hydrate', 'false').lower() in ('1', 'true', 'yes'):
+            result = cc.get_product_from_key(result)
+        return jsonify({'result': result, 'nextCursor': page['nextCursor']}), 200
+
+    productKeys = cc.get_product_of_category(category)
     
     if productKeys:
         return jsonify({'result':productKeys}), 200
@@ -123,8 +199,9 @@ def get_products_by_category():
     
     
 @app.route('/products/get-all-categories')
+@catalog_conditional
 def get_all_categories(): 
-    category_data_list = dm.get_categories()
+    category_data_list = cc.get_categories()
     
     if category_data_list:
         return jsonify({'result': category_data_list}), 200
@@ -138,7 +215,8 @@ def search_product():
     if not search_term:
         return jsonify({"error": "Search term parameter is required"}), 400
     
-    product_data_list:list = dm.search_products_by_name(search_term) 
+    limit = max(1, min(request.args.get('limit', SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    product_data_list:list = dm.search_products_by_name(search_term, limit)
     
     if product_data_list:
         return jsonify({'result':product_data_list}), 200
@@ -146,17 +224,23 @@ def search_product():
         return jsonify({"error": "Product not found"}), 404
 
 
+@app.route('/products/autocomplete')
+def autocomplete_product():
+    prefix = request.args.get('prefix')
+    if not prefix or not prefix.strip():
+        return jsonify({"error": "Prefix parameter is required"}), 400
+
+    limit = max(1, min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), AUTOCOMPLETE_LIMIT))
+    # No suggestion is a normal answer while typing, not an error
+    return jsonify({'result': dm.autocomplete_products(prefix, limit)}), 200
+
+
 @app.route('/users/add-to-cart', methods=['POST'])
-def addToCart():
+@require_auth
+def addToCart(userKey):
     data = request.get_json()
     cartItems = data['cartItems']
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
+
     if dm.add_to_cart(cartItems, userKey):
         return jsonify({"result": "Successfully add to your cart"}), 200
     return jsonify({"error":"Failure adding to your cart"}), 400
@@ -164,16 +248,11 @@ def addToCart():
    
     
 @app.route('/users/remove-from-cart', methods=['DELETE'])
-def removeFromCart():
+@require_auth
+def removeFromCart(userKey):
     data = request.get_json()
     cartItems:list = data['cartItems']
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
+
     if dm.remove_from_cart(cartItems, userKey):
         return jsonify({"result": "Successfully remove from your cart"}), 200
     return jsonify({"error":"Failure removing from your cart"}), 400
@@ -182,15 +261,10 @@ def removeFromCart():
 
 
 @app.route('/users/change-no-of-product-in-cart', methods=['PUT'])
-def changeNoOfProductInCart():
+@require_auth
+def changeNoOfProductInCart(userKey):
     data = request.get_json()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
+
     if dm.change_no_of_product_in_cart(data, userKey):
         return jsonify({"result": "Successfully change number of product in your cart"}), 200
     return jsonify({"error":"Failure changing number of product in your cart"}), 400
@@ -198,61 +272,53 @@ def changeNoOfProductInCart():
 
 
 @app.route('/users/get-cart-items', methods=['GET'])
-def getCartItems():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
-    user = dm.get_user_by_key(userKey)
-    cartModels = []
-    for item in user['cartItems']:
-        product = dm.get_product_from_key([item["productKey"]])
-        cartModels.append({"cartItemDetails": item,
-                          "productDetails": product[0]["productDetails"]})
-    if user:
-        return jsonify({"result": {
-                            "userDetails": user,
-                            "cartModels": cartModels
-                            }}), 200
+@require_auth
+def getCartItems(userKey):
+    cart = dm.get_cart_of_user(userKey)
+    if cart:
+        return jsonify({"result": cart}), 200
     
     return jsonify({"error":"Cart items not found"}), 404
 
 
 
 @app.route('/orders/place-order', methods=['POST'])
-def placeOrder():
+@require_auth
+def placeOrder(userKey):
     orders:list = request.get_json()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
+
     placeOrder = dm.place_order(orders, userKey)
     if placeOrder["result"]:
+        # Cached product documents carry the stock that was just taken
+        cc.invalidate_products(placeOrder.get("productKeys", []), reindex=False)
         return jsonify({"result":"Successfully place order"}), 200
+    if placeOrder.get("failures"):
+        return jsonify({"result": placeOrder["message"], "failures": placeOrder["failures"]}), 409
     return jsonify({"result": placeOrder["message"]}), 400
     
    
 @app.route('/users/get-all-orders', methods=['GET'])
-def getAllOrders():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return jsonify({"error": "Authorization header missing"}), 401
-    userKey = sc.decode_jwt_token(token=auth_header)
-    if userKey is None:
-        return jsonify({"error": "Session expired"}), 404
-    
-    orders = dm.get_orders_of_user(userKey)
+@require_auth
+def getAllOrders(userKey):
+    # Without pageSize or cursor the whole history is returned, unpaged, as
+    # clients that predate paging expect
+    paged = any(name in request.args for name in ('pageSize', 'cursor'))
+    pageSize = None
+    if paged:
+        pageSize = request.args.get('pageSize', ORDER_PAGE_SIZE, type=int)
+        pageSize = max(1, min(pageSize, MAX_ORDER_PAGE_SIZE))
+    stage = request.args.get('stage')
+    try:
+        if stage:
+            page = dm.get_orders_by_stage(stage, pageSize, request.args.get('cursor'), userKey=userKey)
+        else:
+            page = dm.get_orders_page(userKey, pageSize, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     orderCombinedModel = []
     
-    for order in orders:
-        product = dm.get_product_from_key([order["productKey"]])
-        
+    for order in page["orders"]:
         orderCombinedModel.append(
             {
             "orderModel": 
@@ -271,10 +337,12 @@ def getAllOrders():
                     "deliveryStages": order["deliveryStages"],
                     "deliveryAddress": order["deliveryAddress"]
                 },
-            "productDetails": product[0]["productDetails"]
+            "productDetails": order["productDetails"]
             })
         
-    return jsonify({"result": orderCombinedModel}), 200
+    if not paged:
+        return jsonify({"result": orderCombinedModel}), 200
+    return jsonify({"result": orderCombinedModel, "nextCursor": page["nextCursor"]}), 200
 
 
 
@@ -285,31 +353,70 @@ def getRelatedProducts():
     return jsonify({"result": relatedProductKeys}), 200
 
 
+@app.route('/products/get-related-products-batch', methods=['GET'])
+def getRelatedProductsBatch():
+    keys = request.args.get('productKeys')
+    if not keys:
+        return jsonify({"error": "productKeys are required"}), 400
+    try:
+        productKeys:list = [int(key) for key in keys.split(',')]
+    except ValueError:
+        return jsonify({"error": "productKeys must be integers"}), 400
+    if len(productKeys) > MAX_RELATED_BATCH_KEYS:
+        return jsonify({"error": f"At most {MAX_RELATED_BATCH_KEYS} productKeys per request"}), 400
+    k = max(1, min(request.args.get('k', 10, type=int), MAX_RELATED_K))
+
+    related:dict = rcm.get_recommendations_batch(productKeys, k)
+
+    if request.args.get('hydrate', 'false').lower() == 'true':
+        # Hydrate every related product of every key with one batched lookup
+        allKeys = list(dict.fromkeys(key for relatedKeys in related.values() for key in relatedKeys))
+        documents = {product['productDetails']['_key']: product for product in cc.get_product_from_key(allKeys)}
+        related = {
+            productKey: [documents[key] for key in relatedKeys if key in documents]
+            for productKey, relatedKeys in related.items()
+        }
+
+    return jsonify({"result": {str(key): value for key, value in related.items()}}), 200
+
+
 @app.route('/users/payment', methods=['POST'])
 def create_payment_intent():
     try:
-        body = literal_eval(request.get_json()['body'])
+        body = json.loads(request.get_json()['body'])
         amount = body['amount']
         currency = body['currency']
+        auth_header = request.headers.get('Authorization')
+        userKey = sc.decode_jwt_token(token=auth_header) if auth_header else None
+        key, clientKey = payments.idempotency_key(body, userKey, request.headers.get('Idempotency-Key'))
 
-        payment_intent = stripe.PaymentIntent.create(
-            amount=amount,  
-            currency=currency,
-        )
+        payment_intent = payments.create_payment_intent(amount, currency, key)
         
         if payment_intent['status'] != 'succeeded':
-            print('==== in')
-            return jsonify({
+            result = {
                 'message': "Confirm payment please",
                 'client_secret': payment_intent['client_secret'],
-            }), 200
-
-        return jsonify({'message': "Payment Completed Successfully"}), 200
-
+            }
+        else:
+            result = {'message': "Payment Completed Successfully"}
+        if clientKey:
+            # Sent back as Idempotency-Key on a retry of the same checkout
+            result['idempotencyKey'] = clientKey
+        return jsonify(result), 200
+
+    except payments.PaymentBusyError as e:
+        return jsonify({'error': str(e)}), 503
+    except payments.PaymentTimeoutError as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         print(f'error: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
 
 if __name__ == '__main__':
+    # Build the search structures before the first request instead of during it
+    dm.get_search_index()
+    dm.get_autocomplete_index()
+    if RCM_RELOAD_INTERVAL > 0:
+        rcm.start_asset_watcher(RCM_RELOAD_INTERVAL)
     app.run(host='127.0.0.1', debug=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import contextlib
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import catalog_cache as cc
+from connection_pool import PoolTimeoutError
+
+try:
+    import quart
+except ImportError:
+    quart = None
+
+if quart is not None:
+    import async_database_module as adm
+    from asgi_server import app
+
+
+def fake_connection(cursor):
+    connection = MagicMock()
+    connection.cursor.return_value.__aenter__.return_value = cursor
+    connection.commit = AsyncMock()
+    connection.rollback = AsyncMock()
+
+    @contextlib.asynccontextmanager
+    async def connect():
+        yield connection
+    return connection, connect
+
+
+@unittest.skipIf(quart is None, "quart is not installed")
+class AsyncDatabaseModuleTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.cursor.execute = AsyncMock()
+        self.cursor.executemany = AsyncMock()
+        self.cursor.fetchall = AsyncMock(return_value=[])
+        self.connection, connect = fake_connection(self.cursor)
+        self.connection_context = adm.connection
+        for patcher in (patch('async_database_module.connection', connect),
+                        patch('database_module.RESERVE_STOCK', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_get_product_from_key_keeps_order_and_duplicates(self):
+        self.cursor.fetchall.side_effect = [
+            [(2, 'B', 'desc', 'pic', 4.0), (1, 'A', 'desc', 'pic', 3.0)], [], [], []]
+        products = await adm.get_product_from_key([1, 2, 1])
+        self.assertEqual([product['productDetails']['_key'] for product in products], [1, 2, 1])
+        self.assertEqual(self.cursor.execute.await_count, 4)
+
+    async def test_place_order_runs_the_shared_statements(self):
+        self.cursor.rowcount = 1
+        self.cursor.fetchall.return_value = [(0, 10)]
+        orders = {'orders': [{'deliveryAddress': 'Address', 'deliveryStages': ['Order Placed'],
+                              'orderedDate': 1677721600, 'paidPrice': 100, 'paymentStatus': 1,
+                              'productDetails': {'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5}}]}
+        result = await adm.place_order(orders, 7)
+        self.assertTrue(result['result'])
+        self.assertEqual(result['productKeys'], [1])
+        self.assertEqual(self.cursor.executemany.await_args[0][1], [(10, 0, 'Order Placed')])
+        self.connection.commit.assert_awaited_once()
+
+    async def test_place_order_short_stock_rolls_back(self):
+        self.cursor.rowcount = 0
+        self.cursor.fetchall.return_value = [(1, 5, 1)]
+        orders = {'orders': [{'deliveryAddress': 'Address', 'deliveryStages': ['Order Placed'],
+                              'orderedDate': 1677721600, 'paidPrice': 100, 'paymentStatus': 1,
+                              'productDetails': {'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5}}]}
+        result = await adm.place_order(orders, 7)
+        self.assertEqual(result['failures'][0]['available'], 1)
+        self.connection.rollback.assert_awaited_once()
+        self.connection.commit.assert_not_awaited()
+
+    async def test_connection_ends_open_transaction_before_release(self):
+        conn = MagicMock()
+        conn.get_transaction_status.return_value = True
+        conn.rollback = AsyncMock()
+        pool = MagicMock()
+        pool.acquire = AsyncMock(return_value=conn)
+        with patch('async_database_module.get_pool', AsyncMock(return_value=pool)):
+            async with self.connection_context() as acquired:
+                self.assertIs(acquired, conn)
+        conn.rollback.assert_awaited_once()
+        pool.release.assert_called_once_with(conn)
+        conn.close.assert_not_called()
+
+    async def test_get_category_page_rejects_unknown_sort(self):
+        with self.assertRaises(ValueError):
+            await adm.get_category_page(3, sort='name')
+
+
+@unittest.skipIf(quart is None, "quart is not installed")
+class AsyncServerTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        cc.cache.clear()
+
+    @patch('async_database_module.get_categories', new_callable=AsyncMock)
+    async def test_get_all_categories_cached_with_validators(self, mock_get_categories):
+        mock_get_categories.return_value = [{'_key': 1, 'categoryName': 'Drama'}]
+        response = await self.client.get('/products/get-all-categories')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = await self.client.get('/products/get-all-categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        mock_get_categories.assert_awaited_once()
+
+    @patch('async_database_module.get_product_from_key', new_callable=AsyncMock)
+    async def test_pool_timeout_is_service_unavailable(self, mock_get_product_from_key):
+        mock_get_product_from_key.side_effect = PoolTimeoutError("No connection available")
+        response = await self.client.get('/products/get-product-from-keys?key=1')
+        self.assertEqual(response.status_code, 503)
+
+    @patch('security.decode_jwt_token')
+    async def test_pool_timeout_on_user_routes_is_service_unavailable(self, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 7
+
+        @contextlib.asynccontextmanager
+        async def exhausted():
+            raise PoolTimeoutError("No connection available")
+            yield
+        with patch('async_database_module.connection', exhausted):
+            for path in ('/users/get-cart-items', '/users/get-current-user'):
+                response = await self.client.get(path, headers={'Authorization': 'token'})
+                self.assertEqual(response.status_code, 503, path)
+
+    @patch('security.decode_jwt_token')
+    @patch('async_database_module.place_order', new_callable=AsyncMock)
+    async def test_place_order_out_of_stock(self, mock_place_order, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 7
+        mock_place_order.return_value = {'result': False, 'message': 'Insufficient stock',
+                                         'failures': [{'line': 0}]}
+        response = await self.client.post('/orders/place-order', json={'orders': []},
+                                          headers={'Authorization': 'token'})
+        self.assertEqual(response.status_code, 409)
+
+    async def test_get_cart_items_requires_authorization(self):
+        response = await self.client.get('/users/get-cart-items')
+        self.assertEqual(response.status_code, 401)
+
+    @patch('stripe.PaymentIntent.create')
+    async def test_create_payment_intent_pending(self, mock_payment_intent_create):
+        mock_payment_intent_create.return_value = {'status': 'requires_confirmation', 'client_secret': 'secret'}
+        response = await self.client.post('/users/payment', json={'body': '{"amount": 1000, "currency": "usd"}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await response.get_json())['client_secret'], 'secret')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+import database_module as dm
+from autocomplete import PrefixTrie
+
+
+class PrefixTrieTests(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = PrefixTrie(max_suggestions=3, max_depth=6)
+        self.trie.build([
+            (1, 'The Dark Knight', 40),
+            (2, 'The Dark Knight Rises', 25),
+            (3, 'Darkman', 2),
+            (4, 'Amélie', 10),
+            (5, 'Dark City', 0),
+        ])
+
+    def test_popular_first_from_any_word(self):
+        self.assertEqual([key for key, _ in self.trie.suggest('dar')], [1, 2, 3])
+        self.assertEqual(self.trie.suggest('kni', limit=1), [(1, 'The Dark Knight')])
+        self.assertEqual(self.trie.suggest('AME'), [(4, 'Amélie')])
+        self.assertEqual(self.trie.suggest('xyz'), [])
+
+    def test_prefixes_longer_than_the_trie_depth(self):
+        self.assertEqual([key for key, _ in self.trie.suggest('dark knight r')], [2])
+        self.assertEqual([key for key, _ in self.trie.suggest('the dark knight')], [1, 2])
+
+    def test_trailing_space_completes_the_word(self):
+        self.assertEqual([key for key, _ in self.trie.suggest('dark ')], [1, 2, 5])
+
+    def test_incremental_updates(self):
+        self.trie.add_weight(5, 100)
+        self.assertEqual([key for key, _ in self.trie.suggest('dar')], [5, 1, 2])
+        self.trie.remove(1)
+        self.trie.upsert(6, 'Darkest Hour', 30)
+        self.assertEqual([key for key, _ in self.trie.suggest('dar')], [5, 6, 2])
+        self.assertEqual([key for key, _ in self.trie.suggest('dark k')], [2])
+        self.assertEqual(self.trie.max_key, 6)
+
+
+class AutocompleteProductsTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.multiple(dm, _autocomplete_index=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('database_module._load_autocomplete_rows')
+    def test_index_is_built_once_and_follows_orders(self, mock_load_autocomplete_rows):
+        mock_load_autocomplete_rows.return_value = [(1, 'Apple', 1), (2, 'Apple Pie', 3)]
+        self.assertEqual([p['_key'] for p in dm.autocomplete_products('app')], [2, 1])
+        dm.record_product_orders({1: 5})
+        self.assertEqual([p['_key'] for p in dm.autocomplete_products('app')], [1, 2])
+        mock_load_autocomplete_rows.return_value = [(3, 'Applesauce', 0)]
+        dm.refresh_autocomplete_index()
+        mock_load_autocomplete_rows.assert_called_with(after_key=2)
+        self.assertEqual(dm.autocomplete_products('apples'), [{'_key': 3, 'productName': 'Applesauce'}])
+        self.assertEqual(mock_load_autocomplete_rows.call_count, 2)
+
+    def test_order_counts_are_looked_up_per_product(self):
+        # A correlated count reads only the orders of the listed products
+        sql, params = dm._autocomplete_rows_query(keys=[4, 9])
+        self.assertIn('WHERE o.productKey = p._key', sql)
+        self.assertNotIn('GROUP BY', sql)
+        self.assertEqual(params, (4, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
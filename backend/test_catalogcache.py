@@ -0,0 +1,93 @@
+import threading
+import unittest
+from unittest.mock import patch
+import catalog_cache as cc
+
+
+def product(key):
+    return {'categoryDetails': [], 'productDetails': {'_key': key, 'productName': f'Product {key}'}}
+
+
+class LocalBackendTests(unittest.TestCase):
+
+    def test_entries_expire(self):
+        backend = cc.LocalBackend(1024)
+        backend.set('a', [1], ttl=-1)
+        self.assertIsNone(backend.get('a'))
+        backend.set('b', [2], ttl=60)
+        self.assertEqual(backend.get('b'), [2])
+
+    def test_memory_bound_evicts_least_recently_used(self):
+        backend = cc.LocalBackend(30)
+        backend.set('a', 'x' * 10, ttl=60)
+        backend.set('b', 'y' * 10, ttl=60)
+        backend.get('a')
+        backend.set('c', 'z' * 10, ttl=60)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), 'x' * 10)
+        self.assertLessEqual(backend.stats()['bytes'], 30)
+        self.assertEqual(backend.stats()['evictions'], 1)
+
+
+class CatalogCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(cc, 'cache', cc.CatalogCache(cc.LocalBackend(1024 * 1024), ttl=60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('database_module.get_categories')
+    def test_categories_are_read_through(self, mock_get_categories):
+        mock_get_categories.return_value = [{'_key': 1}]
+        self.assertEqual(cc.get_categories(), [{'_key': 1}])
+        self.assertEqual(cc.get_categories(), [{'_key': 1}])
+        mock_get_categories.assert_called_once()
+        version, _ = cc.catalog_version()
+        self.assertEqual(cc.invalidate_categories(), version + 1)
+        cc.get_categories()
+        self.assertEqual(mock_get_categories.call_count, 2)
+
+    @patch('database_module.refresh_category_sort_keys')
+    @patch('database_module.get_product_from_key')
+    def test_products_load_only_missing_keys(self, mock_get_product_from_key, mock_refresh_category_sort_keys):
+        mock_get_product_from_key.side_effect = lambda keys: [product(key) for key in keys if key != 99]
+        cc.get_product_from_key([1, 2])
+        products = cc.get_product_from_key([2, 3, 2, 99, 1])
+        self.assertEqual([p['productDetails']['_key'] for p in products], [2, 3, 2, 1])
+        mock_get_product_from_key.assert_called_with([3, 99])
+        cc.invalidate_products([2])
+        mock_refresh_category_sort_keys.assert_called_once_with([2])
+        cc.get_product_from_key([1, 2])
+        mock_get_product_from_key.assert_called_with([2])
+
+    @patch('database_module.get_product_of_category')
+    def test_failed_loads_are_not_cached(self, mock_get_product_of_category):
+        mock_get_product_of_category.return_value = None
+        self.assertIsNone(cc.get_product_of_category(5))
+        mock_get_product_of_category.return_value = [1, 2]
+        self.assertEqual(cc.get_product_of_category(5), [1, 2])
+
+
+class AsyncCatalogCacheTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_blocking_backend_runs_off_the_event_loop(self):
+        backend = cc.LocalBackend(1024)
+        backend.blocking = True
+        threads = set()
+        get_many = backend.get_many
+
+        def record(keys):
+            threads.add(threading.get_ident())
+            return get_many(keys)
+        backend.get_many = record
+        cache = cc.CatalogCache(backend, ttl=60)
+
+        async def load(missing):
+            return {item: item * 2 for item in missing}
+        self.assertEqual(await cache.get_many_or_load_async({1: 'a', 2: 'b'}, load), {1: 2, 2: 4})
+        self.assertEqual(await cache.get_many_or_load_async({1: 'a'}, load), {1: 2})
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
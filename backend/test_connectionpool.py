@@ -0,0 +1,83 @@
+import threading
+import unittest
+from connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def is_connected(self):
+        return self.alive
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+        self.pool = ConnectionPool(self._factory, size=2, timeout=0.05, health_check_interval=0)
+
+    def _factory(self):
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+    def test_close_returns_connection_to_pool(self):
+        conn = self.pool.get_connection()
+        conn.close()
+        self.pool.get_connection().close()
+        self.assertEqual(len(self.created), 1)
+        self.assertFalse(self.created[0].closed)
+        self.assertEqual(self.pool.stats()['checkouts'], 2)
+
+    def test_checkout_times_out_when_exhausted(self):
+        first = self.pool.get_connection()
+        second = self.pool.get_connection()
+        with self.assertRaises(PoolTimeoutError):
+            self.pool.get_connection()
+        stats = self.pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['in_use'], 2)
+        first.close()
+        second.close()
+
+    def test_waiter_gets_released_connection(self):
+        held = self.pool.get_connection()
+        self.pool.get_connection()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.pool.get_connection(timeout=1)))
+        waiter.start()
+        held.close()
+        waiter.join()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(len(self.created), 2)
+
+    def test_dead_idle_connection_is_replaced(self):
+        self.pool.get_connection().close()
+        self.created[0].alive = False
+        self.pool.get_connection().close()
+        self.assertTrue(self.created[0].closed)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.pool.stats()['discarded'], 1)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        conn = self.pool.get_connection()
+        self.created[0].in_transaction = True
+        conn.close()
+        self.assertEqual(self.created[0].rollbacks, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
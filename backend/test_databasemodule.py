@@ -1,6 +1,8 @@
 import unittest
+from unittest.mock import MagicMock, patch
 import sqlite3
 import datetime
+import mysql.connector
 import database_module as dm
 import security as sc
 
@@ -137,4 +139,281 @@ class DatabaseModuleTests(unittest.TestCase):
         self.assertEqual(orders[0]['deliveryStages'], ['Order Placed', 'Payment Confirmed', 'Order Processed', 'Ready to Pickup'])
         self.assertEqual(orders[0]['deliveryAddress'], 'Test Address')
         self.assertEqual(orders[0]['noOfItems'], 1)
-        self.assertEqual(orders[0]['variationQuantity'], 5)
\ No newline at end of file
+        self.assertEqual(orders[0]['variationQuantity'], 5)
+
+
+class ProductHydrationTests(unittest.TestCase):
+
+    def setUp(self):
+        # Rows keyed by the table each hydration query reads from
+        self.rows = {
+            'FROM products': [(1, 'Apple', 'Red', 'apple.jpg', 4.5), (2, 'Pear', 'Green', 'pear.jpg', 3.0)],
+            'FROM product_categories': [(1, 10, 'Fruits', 'fruits.jpg'), (2, 10, 'Fruits', 'fruits.jpg')],
+            'FROM reviews': [(1, 7, 'Tasty')],
+            'FROM variations': [(2, 5, 1.0, 2.0, 1, 3.0)],
+            'FROM users': [(1, 'Test User', 'Test Address', ' ', 0, 'test@example.com', ' ', '1234567890', ' ', ' ', ' ')],
+            'FROM orders': [(3,)],
+            'FROM cart_items': [(2, 1, 5), (1, 2, 5), (99, 1, 5)],
+        }
+        self.cursor = MagicMock()
+        self.cursor.execute.side_effect = self._execute
+        connection = MagicMock()
+        connection.cursor.return_value = self.cursor
+        patcher = patch('database_module.get_db_connection', return_value=connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _execute(self, sql, params=None):
+        table = next(name for name in self.rows if name in sql)
+        self.cursor.fetchall.return_value = self.rows[table]
+        self.cursor.fetchone.return_value = self.rows[table][0] if self.rows[table] else None
+
+    def test_get_product_from_key_batches_queries(self):
+        products = dm.get_product_from_key([2, 1, 2, 99])
+        self.assertEqual(self.cursor.execute.call_count, 4)
+        self.assertEqual([p['productDetails']['_key'] for p in products], [2, 1, 2])
+        self.assertEqual(products[0]['productDetails']['variations'][0]['sellingPrice'], 3.0)
+        self.assertEqual(products[1]['productDetails']['reviews'], [{'userId': 7, 'comment': 'Tasty'}])
+        self.assertEqual(products[1]['categoryDetails'][0]['categoryName'], 'Fruits')
+
+    def test_get_product_from_key_empty(self):
+        self.assertEqual(dm.get_product_from_key([]), [])
+        self.cursor.execute.assert_not_called()
+
+    def test_get_cart_of_user_uses_fixed_number_of_queries(self):
+        cart = dm.get_cart_of_user(1)
+        self.assertEqual(self.cursor.execute.call_count, 7)
+        self.assertEqual(cart['userDetails']['orders'], [3])
+        self.assertEqual(len(cart['userDetails']['cartItems']), 3)
+        # The cart line for the missing product is left out of the models
+        self.assertEqual([m['productDetails']['_key'] for m in cart['cartModels']], [2, 1])
+        self.assertEqual(cart['cartModels'][1]['cartItemDetails']['noOfItems'], 2)
+
+
+class CartMutationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.connection = MagicMock()
+        self.connection.cursor.return_value = self.cursor
+        patcher = patch('database_module.get_db_connection', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_add_to_cart_upserts_all_lines_at_once(self):
+        items = [
+            {'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5},
+            {'productKey': 2, 'noOfItems': 1, 'variationQuantity': 5},
+            {'productKey': 1, 'noOfItems': 3, 'variationQuantity': 5},
+        ]
+        self.assertTrue(dm.add_to_cart(items, 7))
+        sql, rows = self.cursor.executemany.call_args[0]
+        self.assertIn('ON DUPLICATE KEY UPDATE', sql)
+        self.assertEqual(rows, [(7, 1, 5, 5), (7, 2, 1, 5)])
+        self.cursor.execute.assert_not_called()
+        self.connection.commit.assert_called_once()
+
+    def test_add_to_cart_accepts_a_single_item(self):
+        self.assertTrue(dm.add_to_cart({'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5}, 7))
+        self.assertEqual(self.cursor.executemany.call_args[0][1], [(7, 1, 2, 5)])
+
+    def test_remove_from_cart_uses_two_statements(self):
+        items = [{'productKey': 1, 'noOfItems': 1, 'variationQuantity': 5},
+                 {'productKey': 2, 'noOfItems': 4, 'variationQuantity': 6}]
+        self.assertTrue(dm.remove_from_cart(items, 7))
+        self.assertEqual(self.cursor.execute.call_count, 2)
+        update_params = self.cursor.execute.call_args_list[0][0][1]
+        self.assertEqual(update_params, (1, 5, 1, 2, 6, 4, 7, 1, 5, 2, 6))
+        self.assertIn('DELETE FROM cart_items', self.cursor.execute.call_args_list[1][0][0])
+
+    def test_database_errors_roll_back(self):
+        self.cursor.executemany.side_effect = dm.mysql.connector.Error('boom')
+        self.assertFalse(dm.add_to_cart({'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5}, 7))
+        self.connection.rollback.assert_called_once()
+
+
+class CreateUserTests(unittest.TestCase):
+
+    @patch('database_module.get_db_connection')
+    @patch('security.generate_password_hash', side_effect=sc.HashingBusyError('busy'))
+    def test_busy_hashing_is_raised_without_a_connection(self, mock_generate_password_hash, mock_get_db_connection):
+        with self.assertRaises(sc.HashingBusyError):
+            dm.create_user('testuser', 'newtest@example.com', 'password123')
+        mock_get_db_connection.assert_not_called()
+
+
+class PlaceOrderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.connection = MagicMock()
+        self.connection.cursor.return_value = self.cursor
+        for patcher in (patch('database_module.get_db_connection', return_value=self.connection),
+                        patch('database_module.RESERVE_STOCK', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        line = {'deliveryAddress': 'Test Address', 'deliveryStages': ['Order Placed'], 'orderedDate': 1677721600,
+                'paidPrice': 100, 'paymentStatus': 1}
+        self.orders = {'orders': [
+            dict(line, productDetails={'productKey': 1, 'noOfItems': 2, 'variationQuantity': 5}),
+            dict(line, productDetails={'productKey': 2, 'noOfItems': 1, 'variationQuantity': 5}),
+            dict(line, productDetails={'productKey': 1, 'noOfItems': 1, 'variationQuantity': 5}),
+        ]}
+
+    def test_reserves_stock_inserts_orders_and_clears_cart_in_one_transaction(self):
+        self.cursor.rowcount = 2
+        # Keys of concurrent inserts may interleave, so they are not consecutive
+        self.cursor.fetchall.return_value = [(0, 100), (2, 105), (1, 104)]
+        self.orders['orders'][2]['deliveryStages'] = ['Order Placed', 'Payment Confirmed']
+        result = dm.place_order(self.orders, 7)
+        self.assertTrue(result['result'])
+        self.assertEqual(result['productKeys'], [1, 2])
+        update_sql, update_params = self.cursor.execute.call_args_list[0][0]
+        self.assertIn('availabilityQuantity >= CASE', update_sql)
+        # Demand of the same variation is added up
+        self.assertEqual(update_params[:6], (1, 5, 3, 2, 5, 1))
+        # All lines go in with one INSERT, tagged with the checkout token and line
+        insert_sql, insert_params = self.cursor.execute.call_args_list[1][0]
+        self.assertIn('INSERT INTO orders', insert_sql)
+        self.assertEqual(len(insert_params), 33)
+        token = insert_params[9]
+        self.assertEqual(insert_params[20:22], (token, 1))
+        self.assertEqual(insert_params[24], 'Payment Confirmed')
+        keys_sql, keys_params = self.cursor.execute.call_args_list[2][0]
+        self.assertIn('WHERE checkoutToken = %s', keys_sql)
+        self.assertEqual(keys_params, (token,))
+        self.assertEqual(self.cursor.executemany.call_args[0][1], [
+            (100, 0, 'Order Placed'), (104, 0, 'Order Placed'),
+            (105, 0, 'Order Placed'), (105, 1, 'Payment Confirmed')])
+        self.assertIn('DELETE FROM cart_items', self.cursor.execute.call_args_list[3][0][0])
+        self.assertEqual(self.cursor.execute.call_count, 4)
+        self.connection.commit.assert_called_once()
+
+    def test_non_positive_counts_are_rejected_before_the_transaction(self):
+        for count in (0, -2, 1.5, '3', True):
+            self.orders['orders'][1]['productDetails']['noOfItems'] = count
+            result = dm.place_order(self.orders, 7)
+            self.assertFalse(result['result'])
+            self.assertNotIn('failures', result)
+        self.cursor.execute.assert_not_called()
+
+    def test_short_stock_refuses_the_whole_order(self):
+        self.cursor.rowcount = 1
+        self.cursor.fetchall.return_value = [(1, 5, 10), (2, 5, 0)]
+        result = dm.place_order(self.orders, 7)
+        self.assertFalse(result['result'])
+        self.assertEqual(result['failures'], [
+            {'line': 1, 'productKey': 2, 'variationQuantity': 5, 'requested': 1, 'available': 0}])
+        self.assertEqual(self.cursor.execute.call_count, 2)
+        self.connection.rollback.assert_called_once()
+        self.connection.commit.assert_not_called()
+
+
+class DeliveryStageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = {
+            'FROM orders': [(1, 2, 1677721600, 100, 1, None, 'Address', 1, 5),
+                            (2, 2, 1677721500, 100, 1, 'Order Placed,Shipped', 'Address', 1, 5)],
+            'FROM order_delivery_stages': [(1, 'Order Placed'), (1, 'Payment Confirmed')],
+            'FROM products': [],
+        }
+        self.cursor = MagicMock()
+        self.cursor.execute.side_effect = self._execute
+        self.connection = MagicMock()
+        self.connection.cursor.return_value = self.cursor
+        patcher = patch('database_module.get_db_connection', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _execute(self, sql, params=None):
+        table = next((name for name in self.rows if name in sql), None)
+        self.cursor.fetchall.return_value = self.rows.get(table, [])
+        self.cursor.fetchone.return_value = (self.rows.get(table) or [None])[0]
+
+    def test_stages_come_from_the_table_with_legacy_fallback(self):
+        page = dm.get_orders_by_stage('Payment Confirmed', 10)
+        self.assertEqual(page['orders'][0]['deliveryStages'], ['Order Placed', 'Payment Confirmed'])
+        self.assertEqual(page['orders'][1]['deliveryStages'], ['Order Placed', 'Shipped'])
+        sql, params = self.cursor.execute.call_args_list[0][0]
+        self.assertIn('WHERE currentStage = %s', sql)
+        self.assertEqual(params, ('Payment Confirmed', 11))
+
+    def test_without_page_size_every_order_is_listed(self):
+        page = dm.get_orders_page(2)
+        self.assertEqual(len(page['orders']), 2)
+        self.assertIsNone(page['nextCursor'])
+        sql, params = self.cursor.execute.call_args_list[0][0]
+        self.assertNotIn('LIMIT', sql)
+        self.assertEqual(params, (2,))
+
+    def test_advance_moves_legacy_stages_to_the_table(self):
+        self.rows['FROM orders'] = [('Order Placed,Shipped',)]
+        self.rows['FROM order_delivery_stages'] = [(0,)]
+        self.assertTrue(dm.advance_order_stage(2, 'Delivered'))
+        self.assertEqual(self.cursor.executemany.call_args[0][1],
+                         [(2, 0, 'Order Placed'), (2, 1, 'Shipped'), (2, 2, 'Delivered')])
+        self.assertEqual(self.cursor.execute.call_args[0][1], ('Delivered', 2))
+        self.connection.commit.assert_called_once()
+
+
+class PageCursorTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        cursor = dm.encode_page_cursor(1677721600, 42)
+        self.assertEqual(dm.decode_page_cursor(cursor, 2), [1677721600, 42])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            dm.decode_page_cursor('not-a-cursor', 2)
+        with self.assertRaises(ValueError):
+            dm.decode_page_cursor(dm.encode_page_cursor(1), 2)
+
+
+class CategoryPageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.connection = MagicMock()
+        self.connection.cursor.return_value = self.cursor
+        patcher = patch('database_module.get_db_connection', return_value=self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unpaged_category_releases_connection_on_error(self):
+        self.cursor.execute.side_effect = mysql.connector.Error('lost connection')
+        with self.assertRaises(mysql.connector.Error):
+            dm.get_product_of_category(10)
+        self.cursor.close.assert_called_once()
+        self.connection.close.assert_called_once()
+
+    def test_rating_pages_are_keyed_on_rating_and_product(self):
+        self.cursor.fetchall.return_value = [(7, 4.5), (3, 4.5), (9, 4.0)]
+        page = dm.get_category_page(10, 'rating', 2)
+        self.assertEqual(page['productKeys'], [7, 3])
+        self.assertEqual(dm.decode_page_cursor(page['nextCursor'], 2), [4.5, 3])
+        sql, params = self.cursor.execute.call_args[0]
+        self.assertIn('ORDER BY productRating DESC, productKey DESC LIMIT %s', sql)
+        self.assertEqual(params, (10, 3))
+
+        self.cursor.fetchall.return_value = [(9, 4.0)]
+        page = dm.get_category_page(10, 'rating', 2, page['nextCursor'])
+        self.assertEqual(page, {'productKeys': [9], 'nextCursor': None})
+        sql, params = self.cursor.execute.call_args[0]
+        self.assertIn('productRating < %s OR (productRating = %s AND productKey < %s)', sql)
+        self.assertEqual(params, (10, 4.5, 4.5, 3, 3))
+
+    def test_newest_and_price(self):
+        self.cursor.fetchall.return_value = [(5,)]
+        dm.get_category_page(10, 'newest', 2, dm.encode_page_cursor(8))
+        sql, params = self.cursor.execute.call_args[0]
+        self.assertIn('AND productKey < %s ORDER BY productKey DESC', ' '.join(sql.split()))
+        self.assertEqual(params, (10, 8, 3))
+        dm.get_category_page(10, 'price', 2)
+        self.assertIn('ORDER BY minPrice ASC, productKey ASC', self.cursor.execute.call_args[0][0])
+
+    def test_invalid_sort_or_cursor(self):
+        with self.assertRaises(ValueError):
+            dm.get_category_page(10, 'name')
+        with self.assertRaises(ValueError):
+            dm.get_category_page(10, 'rating', 2, dm.encode_page_cursor(8))
@@ -0,0 +1,52 @@
+import os
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from hashing_pool import HashingBusyError, HashingPool
+
+
+class HashingPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = HashingPool(processes=1, queue_size=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_run_returns_result_and_records_latency(self):
+        self.assertEqual(self.pool.run(pow, 2, 10), 1024)
+        stats = self.pool.stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['pending'], 0)
+        self.assertGreater(stats['latency_max'], 0)
+
+    def test_full_queue_rejects(self):
+        running = self.pool.submit(time.sleep, 0.5)
+        queued = self.pool.submit(time.sleep, 0)
+        self.assertEqual(self.pool.stats()['queued'], 1)
+        with self.assertRaises(HashingBusyError):
+            self.pool.submit(time.sleep, 0)
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+        running.result()
+        queued.result()
+        # Room again once the queue drains
+        self.assertEqual(self.pool.run(pow, 3, 2), 9)
+
+    def test_failures_are_counted(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.pool.run(divmod, 1, 0)
+        self.assertEqual(self.pool.stats()['failed'], 1)
+
+    def test_dead_process_is_replaced(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.pool.run(os._exit, 1)
+        self.assertEqual(self.pool.run(pow, 2, 3), 8)
+        stats = self.pool.stats()
+        self.assertEqual(stats['restarts'], 1)
+        self.assertEqual(stats['pending'], 0)
+
+    def test_needs_a_process(self):
+        with self.assertRaises(ValueError):
+            HashingPool(processes=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import migrate
+
+
+class SchemaStatementsTests(unittest.TestCase):
+
+    def test_statements_skip_comments_and_database_selection(self):
+        statements = migrate._schema_statements()
+        self.assertFalse(any(s.upper().startswith(('CREATE DATABASE', 'USE')) for s in statements))
+        self.assertFalse(any('--' in s for s in statements))
+        tables = [s.split()[2] for s in statements if s.upper().startswith('CREATE TABLE')]
+        # Referenced tables come first
+        self.assertLess(tables.index('orders'), tables.index('order_delivery_stages'))
+
+
+class MigrateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = MagicMock()
+        self.cursor.fetchall.return_value = [(1,), (2,)]
+        self.connection = MagicMock()
+        self.connection.cursor.return_value = self.cursor
+        self.calls = []
+        migrations = [(version, f'm{version}', lambda cursor, v=version: self.calls.append(v)) for version in (1, 2, 3, 4)]
+        patcher = patch('migrate.MIGRATIONS', migrations)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_pending_migrations_run_in_order(self):
+        self.assertEqual(migrate.migrate(self.connection), [3, 4])
+        self.assertEqual(self.calls, [3, 4])
+        self.assertEqual(self.connection.commit.call_count, 2)
+
+    def test_target_version(self):
+        self.assertEqual(migrate.migrate(self.connection, target=3), [3])
+
+    def test_failed_migration_is_not_recorded(self):
+        def fail(cursor):
+            raise RuntimeError('boom')
+        with patch('migrate.MIGRATIONS', [(3, 'm3', fail)]):
+            with self.assertRaises(RuntimeError):
+                migrate.migrate(self.connection)
+        self.connection.commit.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import payments
+
+
+class SlowProvider:
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        self.release = threading.Event()
+
+    def create_intent(self, amount, currency, idempotency_key):
+        self.calls += 1
+        self.release.wait(self.delay)
+        return {'id': idempotency_key, 'status': 'requires_payment_method', 'client_secret': 'secret'}
+
+
+class IdempotencyKeyTests(unittest.TestCase):
+
+    def test_same_order_of_same_user_same_key(self):
+        body = {'amount': 100, 'currency': 'usd', 'orderId': 12}
+        key, client_key = payments.idempotency_key(body, 7)
+        self.assertIsNone(client_key)
+        self.assertEqual(key, payments.idempotency_key(dict(body), 7)[0])
+        self.assertNotEqual(key, payments.idempotency_key(body, 8)[0])
+        self.assertNotEqual(key, payments.idempotency_key(dict(body, orderId=13), 7)[0])
+
+    def test_checkouts_without_order_get_their_own_key(self):
+        body = {'amount': 100, 'currency': 'usd'}
+        first, first_client_key = payments.idempotency_key(body, None)
+        second, second_client_key = payments.idempotency_key(body, None)
+        self.assertNotEqual(first, second)
+        self.assertNotEqual(first_client_key, second_client_key)
+        # An anonymous orderId does not identify a checkout either
+        self.assertIsNotNone(payments.idempotency_key(dict(body, orderId=12), None)[1])
+        # Resending the returned key finds the same intent
+        self.assertEqual(payments.idempotency_key(body, None, first_client_key), (first, first_client_key))
+
+    def test_client_keys_are_scoped_by_user(self):
+        body = {'amount': 100, 'currency': 'usd'}
+        key, client_key = payments.idempotency_key(body, 7, 'retry-1')
+        self.assertEqual(client_key, 'retry-1')
+        self.assertNotEqual(key, 'retry-1')
+        self.assertNotEqual(key, payments.idempotency_key(body, 8, 'retry-1')[0])
+        self.assertNotEqual(key, payments.idempotency_key(body, None, 'retry-1')[0])
+
+
+class CreatePaymentIntentTests(unittest.TestCase):
+
+    def test_duplicate_submits_share_one_call(self):
+        provider = SlowProvider(delay=0.2)
+        with patch('payments.provider', provider):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(
+                payments.create_payment_intent(100, 'usd', 'same-key'))) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(provider.calls, 1)
+        self.assertEqual(len(results), 5)
+
+    def test_timeout(self):
+        provider = SlowProvider(delay=5)
+        with patch('payments.provider', provider):
+            start = time.monotonic()
+            with self.assertRaises(payments.PaymentTimeoutError):
+                payments.create_payment_intent(100, 'usd', 'slow-key', timeout=0.05)
+            self.assertLess(time.monotonic() - start, 1)
+            provider.release.set()
+
+    def test_busy_when_too_many_pending(self):
+        provider = SlowProvider(delay=5)
+        with patch('payments.provider', provider), patch('payments._pending', threading.BoundedSemaphore(1)):
+            payments.submit(100, 'usd', 'first')
+            with self.assertRaises(payments.PaymentBusyError):
+                payments.submit(100, 'usd', 'second')
+            provider.release.set()
+
+    def test_stub_provider_is_deterministic(self):
+        provider = payments.StubPaymentProvider(latency=0)
+        self.assertEqual(provider.create_intent(100, 'usd', 'abc'), provider.create_intent(100, 'usd', 'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
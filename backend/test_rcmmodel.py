@@ -1,4 +1,8 @@
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
+import numpy as np
 import rcm_model as rcm
 
 class RecommendationModelTests(unittest.TestCase):
@@ -21,4 +25,220 @@ class RecommendationModelTests(unittest.TestCase):
 
         # Test with non-existing product name
         recommendations = rcm.get_related_products('NonexistentProduct')
-        self.assertEqual(len(recommendations), 0) # Expect an empty list for non-existing product
\ No newline at end of file
+        self.assertEqual(len(recommendations), 0) # Expect an empty list for non-existing product
+
+
+class TopKIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.matrices = [rng.random((rcm.batch_size, 60)) for _ in range(1)]
+
+    def _sorted_baseline(self, row, movie_id, k):
+        ranked = sorted(enumerate(row), key=lambda x: x[1], reverse=True)
+        return [i for i, _ in ranked if i != movie_id][:k]
+
+    def test_top_k_neighbours_matches_full_sort(self):
+        row = self.matrices[0][3]
+        ids, scores = rcm.top_k_neighbours(row, 10, exclude=3)
+        self.assertEqual(ids.tolist(), self._sorted_baseline(row, 3, 10))
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_build_topk_index_matches_full_sort(self):
+        ids, scores = rcm.build_topk_index(self.matrices, 10, rows_per_chunk=7)
+        self.assertEqual(ids.dtype, np.int32)
+        self.assertEqual(scores.dtype, np.float32)
+        self.assertEqual(ids.shape, (rcm.batch_size, 10))
+        for movie_id in (0, 5, 59):
+            self.assertEqual(ids[movie_id].tolist(), self._sorted_baseline(self.matrices[0][movie_id], movie_id, 10))
+
+
+class SimilarityStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.matrices = [rng.random((4, 12)), rng.random((3, 12))]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_npy_store_is_memory_mapped_and_lazy(self):
+        directory = os.path.join(self.tmp.name, 'similarity')
+        rcm.write_npy_store(self.matrices, directory)
+        store = rcm.open_store(directory)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.manifest['format'], 'npy')
+        self.assertEqual(store._batches, [None, None])
+        batch = store.batch(1)
+        self.assertIsInstance(batch, np.memmap)
+        np.testing.assert_array_equal(batch, self.matrices[1])
+        self.assertIsNone(store._batches[0])
+
+    def test_npz_store_matches_npy_store(self):
+        path = os.path.join(self.tmp.name, 'similarity_matrices.npz')
+        np.savez(path, *self.matrices)
+        store = rcm.open_store(path)
+        np.testing.assert_array_equal(store.batch(0), self.matrices[0])
+
+    def test_load_all_closes_the_npz_archive(self):
+        path = os.path.join(self.tmp.name, 'similarity_matrices.npz')
+        np.savez(path, *self.matrices)
+        store = rcm.open_store(path)
+        archive = store._archive
+        store.load_all()
+        self.assertIsNone(store._archive)
+        self.assertIsNone(archive.fid)
+        self.assertEqual(store.batch_rows(), [4, 3])
+        for batch, expected in zip(store, self.matrices):
+            np.testing.assert_array_equal(batch, expected)
+
+    def test_iteration_does_not_cache_batches(self):
+        path = os.path.join(self.tmp.name, 'similarity_matrices.npz')
+        np.savez(path, *self.matrices)
+        store = rcm.open_store(path)
+        for batch, expected in zip(store, self.matrices):
+            np.testing.assert_array_equal(batch, expected)
+        self.assertEqual(store._batches, [None, None])
+
+    def test_batch_rows_without_loading(self):
+        npz = os.path.join(self.tmp.name, 'similarity_matrices.npz')
+        np.savez(npz, *self.matrices)
+        npy = os.path.join(self.tmp.name, 'npy')
+        rcm.write_npy_store(self.matrices, npy)
+        for store in (rcm.open_store(npz), rcm.open_store(npy)):
+            self.assertEqual(store.batch_rows(), [4, 3])
+            self.assertEqual(store._batches, [None, None])
+        self.assertEqual(rcm.open_store(npy).manifest['rows'], [4, 3])
+
+    def test_sparse_store_serves_same_neighbours(self):
+        dense = os.path.join(self.tmp.name, 'dense')
+        sparse = os.path.join(self.tmp.name, 'sparse')
+        rcm.write_npy_store(self.matrices, dense)
+        rcm.write_sparse_store(self.matrices, sparse, k=5)
+        dense_store, sparse_store = rcm.open_store(dense), rcm.open_store(sparse)
+        self.assertEqual(sparse_store.manifest['format'], 'sparse')
+        for movie_id in (0, 3, rcm.batch_size + 2):
+            expected, _ = dense_store.neighbours(movie_id, 5)
+            actual, _ = sparse_store.neighbours(movie_id, 5)
+            self.assertEqual(actual.tolist(), expected.tolist())
+        row = sparse_store.batch(0)[1]
+        self.assertEqual(row.shape, (12,))
+        self.assertEqual(np.count_nonzero(row), 5)
+
+    def test_float16_store(self):
+        directory = os.path.join(self.tmp.name, 'half')
+        rcm.write_npy_store(self.matrices, directory, dtype=np.float16)
+        store = rcm.open_store(directory)
+        self.assertEqual(store.manifest['dtype'], 'float16')
+        self.assertEqual(store.batch(0).dtype, np.float16)
+
+
+class RecommendationBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.matrices = [rng.random((rcm.batch_size, 30)), rng.random((5, 30))]
+        patcher = patch.multiple(rcm, _assets=rcm.ModelAssets(self._store(), version=1),
+                                 _cache=rcm.LRUCache(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _store(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        rcm.write_npy_store(self.matrices, tmp.name)
+        return rcm.open_store(tmp.name)
+
+    def test_batch_matches_single_lookups(self):
+        ids = [0, 7, rcm.batch_size + 1, 3 * rcm.batch_size, -1]
+        result = rcm.get_recommendations_batch(ids, 5)
+        for movie_id in ids:
+            self.assertEqual(result[movie_id], rcm.get_recommendations(movie_id, 5))
+        self.assertEqual(result[3 * rcm.batch_size], [])
+
+    def test_batch_uses_topk_index(self):
+        ids, scores = rcm.build_topk_index(rcm.get_store(), 8)
+        with patch.object(rcm, '_assets', rcm.ModelAssets(rcm.get_store(), ids, scores, version=2)):
+            result = rcm.get_recommendations_batch([1, 2], 5)
+        self.assertEqual(result[1], ids[1, :5].tolist())
+        self.assertEqual(result[2], rcm.get_recommendations(2, 5))
+
+    def test_results_are_cached(self):
+        first = rcm.get_recommendations(4, 5)
+        self.assertEqual(rcm.get_recommendations(4, 5), first)
+        rcm.get_recommendations_batch([4, 6], 5)
+        stats = rcm.cache_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['size'], 2)
+        rcm.clear_cache()
+        self.assertEqual(rcm.cache_stats()['size'], 0)
+
+
+class LRUCacheTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = rcm.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_zero_capacity_disables_cache(self):
+        cache = rcm.LRUCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class AssetReloadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        rng = np.random.default_rng(3)
+        self.first = os.path.join(self.tmp.name, 'first')
+        self.second = os.path.join(self.tmp.name, 'second')
+        rcm.write_npy_store([rng.random((6, 6))], self.first)
+        rcm.write_npy_store([rng.random((6, 6))], self.second)
+        patcher = patch.multiple(rcm, _assets=rcm.ModelAssets.load(self.first, None, version=1),
+                                 _cache=rcm.LRUCache(100))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reload_swaps_assets_and_bumps_version(self):
+        before = rcm.get_recommendations(0, 3)
+        held = rcm.get_assets()
+        self.assertTrue(rcm.reload_assets(self.second, None, background=False))
+        self.assertEqual(rcm.assets_version(), 2)
+        self.assertEqual(rcm.cache_stats()['size'], 0)
+        self.assertEqual(rcm.get_recommendations(0, 3), rcm.get_store().neighbours(0, 3)[0].tolist())
+        # A reader holding the old set keeps a working reference
+        self.assertEqual(held.store.neighbours(0, 3)[0].tolist(), before)
+
+    def test_background_reload(self):
+        rcm.reload_assets(self.second, None).join()
+        self.assertEqual(rcm.get_store().path, rcm.resolve_store_path(self.second))
+
+    def test_rebuild_in_place_leaves_the_served_build_untouched(self):
+        held = rcm.get_assets()
+        before = held.store.path
+        signature = rcm._asset_signature(self.first, None)
+        with patch.object(rcm, 'KEPT_VERSIONS', 2):
+            for _ in range(3):
+                rcm.write_npy_store([np.eye(6)], self.first)
+        self.assertNotEqual(rcm.resolve_store_path(self.first), before)
+        self.assertNotEqual(rcm._asset_signature(self.first, None), signature)
+        self.assertEqual(len([name for name in os.listdir(self.first) if name.startswith('v')]), 2)
+        self.assertTrue(rcm.reload_assets(self.first, None, background=False))
+        np.testing.assert_array_equal(rcm.get_store().batch(0), np.eye(6))
+
+    def test_invalid_assets_are_rejected(self):
+        topk = os.path.join(self.tmp.name, 'topk.npz')
+        rcm.save_topk_index(topk, np.zeros((3, 2), dtype=np.int32), np.zeros((3, 2), dtype=np.float32))
+        self.assertFalse(rcm.reload_assets(self.second, topk, background=False))
+        self.assertEqual(rcm.get_store().path, rcm.resolve_store_path(self.first))
+        self.assertEqual(rcm.assets_version(), 1)
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+import database_module as dm
+from search_index import SearchIndex, tokenize
+
+
+class SearchIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.build([
+            (1, 'The Dark Knight', 9.0),
+            (2, 'The Dark Knight Rises', 8.4),
+            (3, 'Darkman', 6.4),
+            (4, 'Amélie', 8.3),
+        ])
+
+    def test_tokenize_folds_case_and_accents(self):
+        self.assertEqual(tokenize('Amélie, THE Movie!'), ['amelie', 'the', 'movie'])
+
+    def test_whole_words_rank_before_prefixes(self):
+        self.assertEqual(self.index.search('dark'), [1, 2, 3])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.index.search('dark ris'), [2])
+        self.assertEqual(self.index.search('dark amelie'), [])
+
+    def test_limit_and_accents(self):
+        self.assertEqual(self.index.search('the dark', limit=1), [1])
+        self.assertEqual(self.index.search('AMELIE'), [4])
+
+    def test_incremental_updates(self):
+        self.index.upsert(5, 'Dark City', 7.6)
+        self.index.upsert(3, 'Batman Begins', 8.2)
+        self.index.remove(1)
+        self.assertEqual(self.index.search('dark'), [2, 5])
+        self.assertEqual(self.index.search('darkm'), [])
+        self.assertEqual(self.index.max_key, 5)
+
+
+class SearchProductsTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.multiple(dm, _search_index=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('database_module._load_search_rows')
+    def test_index_is_built_once_and_refreshed_incrementally(self, mock_load_search_rows):
+        mock_load_search_rows.return_value = [(1, 'Apple', 4.0), (2, 'Pineapple', 3.0)]
+        self.assertEqual(dm.search_products_by_name('apple'), [1])
+        mock_load_search_rows.return_value = [(3, 'Apple Pie', 5.0)]
+        dm.refresh_search_index()
+        mock_load_search_rows.assert_called_with(after_key=2)
+        self.assertEqual(dm.search_products_by_name('apple'), [3, 1])
+        mock_load_search_rows.return_value = []
+        dm.refresh_search_index([3])
+        self.assertEqual(dm.search_products_by_name('apple'), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
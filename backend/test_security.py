@@ -0,0 +1,57 @@
+import datetime
+import unittest
+from unittest.mock import patch
+import jwt
+import security as sc
+
+
+def make_token(user_key, expires_in: datetime.timedelta, secret_key=sc.SECRET_KEY):
+    return jwt.encode({'userKey': user_key, 'exp': datetime.datetime.now() + expires_in}, secret_key, algorithm='HS256')
+
+
+class TokenCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        sc.clear_token_cache()
+
+    def test_verified_token_is_served_from_cache(self):
+        token = make_token(7, datetime.timedelta(minutes=5))
+        self.assertEqual(sc.decode_jwt_token(token), 7)
+        with patch('security.jwt.decode') as mock_decode:
+            self.assertEqual(sc.decode_jwt_token(token), 7)
+            mock_decode.assert_not_called()
+
+    def test_cached_token_expires_at_exp(self):
+        token = make_token(7, datetime.timedelta(minutes=5))
+        sc.decode_jwt_token(token)
+        with patch('security.time.time', return_value=datetime.datetime.now().timestamp() + 600):
+            with patch('security.jwt.decode', side_effect=jwt.exceptions.ExpiredSignatureError):
+                self.assertIsNone(sc.decode_jwt_token(token))
+
+    def test_invalid_token_is_not_cached(self):
+        token = make_token(7, datetime.timedelta(minutes=5), secret_key='other')
+        self.assertIsNone(sc.decode_jwt_token(token))
+        self.assertIsNone(sc.decode_jwt_token(token))
+        self.assertEqual(len(sc._token_cache), 0)
+
+    def test_cache_is_bounded(self):
+        with patch('security.TOKEN_CACHE_SIZE', 2):
+            for user_key in range(3):
+                sc.decode_jwt_token(make_token(user_key, datetime.timedelta(minutes=5)))
+        self.assertEqual(len(sc._token_cache), 2)
+
+
+class PasswordHashingTests(unittest.TestCase):
+
+    def test_hash_and_check_in_the_hashing_pool(self):
+        with patch('security.BCRYPT_ROUNDS', 4):
+            hashed_password = sc.generate_password_hash('secret')
+        self.assertTrue(hashed_password.startswith(b'$2b$04$'))
+        self.assertTrue(sc.check_password({'hashed_password': hashed_password}, 'secret'))
+        self.assertFalse(sc.check_password({'hashed_password': hashed_password}, 'wrong'))
+        self.assertFalse(sc.check_password(None, 'secret'))
+        self.assertGreaterEqual(sc.hashing_stats()['completed'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
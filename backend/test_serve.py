@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import MagicMock, call, patch
+import database_module as dm
+
+try:
+    import serve
+except ImportError:
+    serve = None
+
+
+@unittest.skipIf(serve is None, "gunicorn is not installed")
+class ServeTests(unittest.TestCase):
+
+    def test_server_options_default_workers(self):
+        with patch('serve.config.getint', side_effect=lambda section, option, fallback: fallback):
+            options = serve.server_options()
+        self.assertEqual(options['workers'], serve.default_workers())
+        self.assertEqual(options['threads'], 4)
+        self.assertTrue(options['preload_app'])
+
+    def test_server_options_overrides(self):
+        options = serve.server_options(bind='0.0.0.0:8000', workers=3, threads=2)
+        self.assertEqual((options['bind'], options['workers'], options['threads']), ('0.0.0.0:8000', 3, 2))
+
+    @patch('serve.gc.freeze')
+    @patch('database_module.get_autocomplete_index')
+    @patch('database_module.get_search_index')
+    @patch('rcm_model.get_assets')
+    def test_preload_closes_master_connections(self, mock_get_assets, mock_search, mock_autocomplete, mock_freeze):
+        pool = MagicMock()
+        with patch('database_module._pool', pool):
+            serve.preload()
+            self.assertIsNone(dm._pool)
+        mock_get_assets.assert_called_once()
+        mock_get_assets.return_value.store.load_all.assert_called_once()
+        mock_search.assert_called_once()
+        mock_autocomplete.assert_called_once()
+        pool.close_all.assert_called_once()
+        mock_freeze.assert_called_once()
+
+    @patch('serve.gc')
+    @patch('database_module.rebuild_autocomplete_index')
+    @patch('database_module.rebuild_search_index')
+    @patch('rcm_model.get_store')
+    @patch('rcm_model.reload_assets')
+    def test_preload_reload_replaces_data_and_refreezes(self, mock_reload_assets, mock_get_store, mock_search,
+                                                        mock_autocomplete, mock_gc):
+        with patch('database_module._pool', MagicMock()):
+            serve.preload(reload=True)
+        mock_reload_assets.assert_called_once_with(background=False)
+        mock_get_store.return_value.load_all.assert_called_once()
+        mock_search.assert_called_once()
+        mock_autocomplete.assert_called_once()
+        self.assertEqual([name for name, _, _ in mock_gc.method_calls], ['unfreeze', 'collect', 'freeze'])
+
+    @patch('serve.preload')
+    def test_reload_preloads_once(self, mock_preload):
+        application = serve.ProductionServer(serve.server_options(workers=1))
+        self.assertNotIn('on_reload', application.options)
+        application.wsgi()
+        application.reload()
+        application.wsgi()
+        self.assertEqual(mock_preload.call_args_list, [call(reload=False), call(reload=True)])
+
+    @patch('rcm_model.start_asset_watcher')
+    def test_post_fork_gives_the_worker_its_own_pool(self, mock_start_asset_watcher):
+        pool = MagicMock()
+        with patch('database_module._pool', pool), patch('serve.RCM_RELOAD_INTERVAL', 5):
+            serve.post_fork(None, None)
+            self.assertIsNone(dm._pool)
+        # The inherited connections belong to the master
+        pool.close_all.assert_not_called()
+        mock_start_asset_watcher.assert_called_once_with(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
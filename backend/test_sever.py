@@ -1,17 +1,21 @@
 import unittest
 from unittest.mock import patch
 from flask import json
+import server
 from server import app
 import security as sc
 import database_module as dm
+import catalog_cache as cc
 import rcm_model as rcm
 import stripe
+import payments
 
 
 class ServerTest(unittest.TestCase):
 
     def setUp(self):
         self.app = app.test_client()
+        cc.cache.clear()
 
     @patch('database_module.is_registered')
     def test_check_register(self, mock_is_registered):
@@ -54,6 +58,21 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(json.loads(response.data)['error'], 'Failed to create user')
 
+    @patch('database_module.get_user_for_login')
+    @patch('security.check_password')
+    def test_login_hashing_busy(self, mock_check_password, mock_get_user_for_login):
+        mock_get_user_for_login.return_value = {'_key': 'test_user_key'}
+        mock_check_password.side_effect = sc.HashingBusyError('busy')
+        response = self.app.post('/users/login', json={'userId': 'test@example.com', 'password': 'test'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    @patch('database_module.create_user')
+    def test_sign_up_hashing_busy(self, mock_create_user):
+        mock_create_user.side_effect = sc.HashingBusyError('busy')
+        response = self.app.post('/users/signup', json={'username': 'testuser', 'userId': 'test@example.com', 'password': 'test'})
+        self.assertEqual(response.status_code, 429)
+
     @patch('security.decode_jwt_token')
     @patch('database_module.get_user_by_key')
     def test_get_current_user_success(self, mock_get_user_by_key, mock_decode_jwt_token):
@@ -81,7 +100,7 @@ class ServerTest(unittest.TestCase):
 
     @patch('database_module.get_product_from_key')
     def test_get_product_by_keys_success(self, mock_get_product_from_key):
-        mock_get_product_from_key.return_value = [{'productDetails': {'name': 'Test Product'}}]
+        mock_get_product_from_key.return_value = [{'productDetails': {'_key': 1, 'name': 'Test Product'}}]
         response = self.app.get('/products/get-product-from-keys?key=1,2')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(json.loads(response.data)['result'][0]['productDetails']['name'], 'Test Product')
@@ -100,6 +119,22 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(json.loads(response.data)['error'], 'Products not found for the given category')
 
+    @patch('database_module.get_product_from_key')
+    @patch('database_module.get_category_page')
+    def test_get_products_by_category_page(self, mock_get_category_page, mock_get_product_from_key):
+        mock_get_category_page.return_value = {'productKeys': [2, 1], 'nextCursor': 'next'}
+        mock_get_product_from_key.return_value = [{'productDetails': {'_key': 1}}, {'productDetails': {'_key': 2}}]
+        response = self.app.get('/products/get-products-from-category?category=3&sort=rating&pageSize=2&hydrate=true')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([p['productDetails']['_key'] for p in data['result']], [2, 1])
+        self.assertEqual(data['nextCursor'], 'next')
+        mock_get_category_page.assert_called_once_with('3', 'rating', 2, None)
+
+        mock_get_category_page.side_effect = ValueError('Unknown sort: name')
+        response = self.app.get('/products/get-products-from-category?category=3&sort=name')
+        self.assertEqual(response.status_code, 400)
+
     @patch('database_module.get_categories')
     def test_get_all_categories_success(self, mock_get_categories):
         mock_get_categories.return_value = [{'category': 'test_category'}]
@@ -107,6 +142,36 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(json.loads(response.data)['result'][0]['category'], 'test_category')
 
+    @patch('database_module.get_categories')
+    def test_get_all_categories_not_modified(self, mock_get_categories):
+        mock_get_categories.return_value = [{'category': 'test_category'}]
+        response = self.app.get('/products/get-all-categories')
+        etag = response.headers['ETag']
+        self.assertIn('max-age', response.headers['Cache-Control'])
+
+        response = self.app.get('/products/get-all-categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+
+        # The ETag follows the data, not the invalidations
+        cc.invalidate_categories()
+        response = self.app.get('/products/get-all-categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        mock_get_categories.return_value = [{'category': 'renamed'}]
+        cc.cache.clear()
+        response = self.app.get('/products/get-all-categories', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    @patch('database_module.get_categories')
+    def test_pool_timeout_is_service_unavailable(self, mock_get_categories):
+        mock_get_categories.side_effect = server.PoolTimeoutError("No connection available")
+        response = self.app.get('/products/get-all-categories')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
     @patch('database_module.get_categories')
     def test_get_all_categories_not_found(self, mock_get_categories):
         mock_get_categories.return_value = None
@@ -128,6 +193,18 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(json.loads(response.data)['error'], 'Product not found')
 
+    @patch('database_module.autocomplete_products')
+    def test_autocomplete_product(self, mock_autocomplete_products):
+        mock_autocomplete_products.return_value = [{'_key': 1, 'productName': 'Test Product'}]
+        response = self.app.get('/products/autocomplete?prefix=te&limit=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['result'][0]['productName'], 'Test Product')
+        mock_autocomplete_products.assert_called_once_with('te', 3)
+        self.app.get('/products/autocomplete?prefix=te&limit=500')
+        mock_autocomplete_products.assert_called_with('te', server.AUTOCOMPLETE_LIMIT)
+        response = self.app.get('/products/autocomplete?prefix=%20')
+        self.assertEqual(response.status_code, 400)
+
     @patch('security.decode_jwt_token')
     @patch('database_module.add_to_cart')
     def test_add_to_cart_success(self, mock_add_to_cart, mock_decode_jwt_token):
@@ -189,21 +266,24 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(json.loads(response.data)['error'], 'Failure changing number of product in your cart')
 
     @patch('security.decode_jwt_token')
-    @patch('database_module.get_user_by_key')
-    @patch('database_module.get_product_from_key')
-    def test_get_cart_items_success(self, mock_get_product_from_key, mock_get_user_by_key, mock_decode_jwt_token):
+    @patch('database_module.get_cart_of_user')
+    def test_get_cart_items_success(self, mock_get_cart_of_user, mock_decode_jwt_token):
         mock_decode_jwt_token.return_value = 'test_user_key'
-        mock_get_user_by_key.return_value = {'_key': 'test_user_key', 'cartItems': [{'productKey': 1, 'noOfItems': 2}]}
-        mock_get_product_from_key.return_value = [{'productDetails': {'name': 'Test Product'}}]
+        mock_get_cart_of_user.return_value = {
+            'userDetails': {'_key': 'test_user_key', 'cartItems': [{'productKey': 1, 'noOfItems': 2}]},
+            'cartModels': [{'cartItemDetails': {'productKey': 1, 'noOfItems': 2},
+                            'productDetails': {'name': 'Test Product'}}]
+        }
         response = self.app.get('/users/get-cart-items', headers={'Authorization': 'Bearer test_token'})
         self.assertEqual(response.status_code, 200)
         self.assertEqual(json.loads(response.data)['result']['cartModels'][0]['productDetails']['name'], 'Test Product')
+        mock_get_cart_of_user.assert_called_once_with('test_user_key')
 
     @patch('security.decode_jwt_token')
-    @patch('database_module.get_user_by_key')
-    def test_get_cart_items_not_found(self, mock_get_user_by_key, mock_decode_jwt_token):
+    @patch('database_module.get_cart_of_user')
+    def test_get_cart_items_not_found(self, mock_get_cart_of_user, mock_decode_jwt_token):
         mock_decode_jwt_token.return_value = 'test_user_key'
-        mock_get_user_by_key.return_value = None
+        mock_get_cart_of_user.return_value = None
         response = self.app.get('/users/get-cart-items', headers={'Authorization': 'Bearer test_token'})
         self.assertEqual(response.status_code, 404)
         self.assertEqual(json.loads(response.data)['error'], 'Cart items not found')
@@ -229,17 +309,71 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(json.loads(response.data)['result'], 'Order failed')
 
     @patch('security.decode_jwt_token')
-    @patch('database_module.get_orders_of_user')
-    @patch('database_module.get_product_from_key')
-    def test_get_all_orders_success(self, mock_get_product_from_key, mock_get_orders_of_user, mock_decode_jwt_token):
+    @patch('database_module.place_order')
+    def test_place_order_out_of_stock(self, mock_place_order, mock_decode_jwt_token):
         mock_decode_jwt_token.return_value = 'test_user_key'
-        mock_get_orders_of_user.return_value = [{'_key': 'test_order_key', 'productKey': 1, 'noOfItems': 2,
-                                                 'orderedDate': '2023-12-12', 'paidPrice': 100, 'paymentStatus': 'paid',
-                                                 'deliveryStages': ['shipped'], 'deliveryAddress': 'test address'}]
-        mock_get_product_from_key.return_value = [{'productDetails': {'name': 'Test Product'}}]
+        failures = [{'line': 0, 'productKey': 1, 'variationQuantity': 5, 'requested': 2, 'available': 1}]
+        mock_place_order.return_value = {'result': False, 'message': 'Insufficient stock', 'failures': failures}
+        response = self.app.post('/orders/place-order', headers={'Authorization': 'Bearer test_token'},
+                                  json={'orders': []})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data)['failures'], failures)
+
+    @patch('security.decode_jwt_token')
+    @patch('database_module.get_orders_page')
+    def test_get_all_orders_success(self, mock_get_orders_page, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 'test_user_key'
+        mock_get_orders_page.return_value = {
+            'orders': [{'_key': 'test_order_key', 'productKey': 1, 'noOfItems': 2, 'variationQuantity': 0,
+                        'orderedDate': '2023-12-12', 'paidPrice': 100, 'paymentStatus': 'paid',
+                        'deliveryStages': ['shipped'], 'deliveryAddress': 'test address',
+                        'productDetails': {'name': 'Test Product'}}],
+            'nextCursor': 'next'
+        }
+        response = self.app.get('/users/get-all-orders?pageSize=10', headers={'Authorization': 'Bearer test_token'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['result'][0]['productDetails']['name'], 'Test Product')
+        self.assertEqual(data['result'][0]['orderModel']['productDetails']['productKey'], 1)
+        self.assertEqual(data['nextCursor'], 'next')
+        mock_get_orders_page.assert_called_once_with('test_user_key', 10, None)
+
+    @patch('security.decode_jwt_token')
+    @patch('database_module.get_orders_by_stage')
+    def test_get_all_orders_by_stage(self, mock_get_orders_by_stage, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 'test_user_key'
+        mock_get_orders_by_stage.return_value = {'orders': [], 'nextCursor': None}
+        response = self.app.get('/users/get-all-orders?stage=Shipped', headers={'Authorization': 'Bearer test_token'})
+        self.assertEqual(response.status_code, 200)
+        mock_get_orders_by_stage.assert_called_once_with('Shipped', None, None, userKey='test_user_key')
+
+    @patch('security.decode_jwt_token')
+    @patch('database_module.get_orders_page')
+    def test_get_all_orders_without_paging_lists_every_order(self, mock_get_orders_page, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 'test_user_key'
+        mock_get_orders_page.return_value = {'orders': [], 'nextCursor': None}
         response = self.app.get('/users/get-all-orders', headers={'Authorization': 'Bearer test_token'})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(json.loads(response.data)['result'][0]['orderModel']['productDetails']['name'], 'Test Product')
+        self.assertEqual(json.loads(response.data), {'result': []})
+        mock_get_orders_page.assert_called_once_with('test_user_key', None, None)
+
+    @patch('security.decode_jwt_token')
+    @patch('database_module.get_orders_page')
+    def test_get_all_orders_cursor_uses_default_page_size(self, mock_get_orders_page, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 'test_user_key'
+        mock_get_orders_page.return_value = {'orders': [], 'nextCursor': None}
+        response = self.app.get('/users/get-all-orders?cursor=next', headers={'Authorization': 'Bearer test_token'})
+        self.assertEqual(json.loads(response.data), {'result': [], 'nextCursor': None})
+        mock_get_orders_page.assert_called_once_with('test_user_key', 50, 'next')
+
+    @patch('security.decode_jwt_token')
+    @patch('database_module.get_orders_page')
+    def test_get_all_orders_invalid_cursor(self, mock_get_orders_page, mock_decode_jwt_token):
+        mock_decode_jwt_token.return_value = 'test_user_key'
+        mock_get_orders_page.side_effect = ValueError('Invalid page cursor')
+        response = self.app.get('/users/get-all-orders?cursor=bad', headers={'Authorization': 'Bearer test_token'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], 'Invalid page cursor')
 
     @patch('rcm_model.get_recommendations')
     def test_get_related_products_success(self, mock_get_recommendations):
@@ -248,6 +382,38 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(json.loads(response.data)['result'], [1, 2])
 
+    @patch('rcm_model.get_recommendations_batch')
+    def test_get_related_products_batch_success(self, mock_get_recommendations_batch):
+        mock_get_recommendations_batch.return_value = {1: [2, 3], 4: []}
+        response = self.app.get('/products/get-related-products-batch?productKeys=1,4&k=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['result'], {'1': [2, 3], '4': []})
+        mock_get_recommendations_batch.assert_called_once_with([1, 4], 2)
+
+    @patch('rcm_model.get_recommendations_batch')
+    @patch('database_module.get_product_from_key')
+    def test_get_related_products_batch_hydrated(self, mock_get_product_from_key, mock_get_recommendations_batch):
+        mock_get_recommendations_batch.return_value = {1: [2, 3], 4: [3]}
+        mock_get_product_from_key.return_value = [{'productDetails': {'_key': 2}}, {'productDetails': {'_key': 3}}]
+        response = self.app.get('/products/get-related-products-batch?productKeys=1,4&hydrate=true')
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)['result']
+        self.assertEqual([p['productDetails']['_key'] for p in result['1']], [2, 3])
+        self.assertEqual([p['productDetails']['_key'] for p in result['4']], [3])
+        mock_get_product_from_key.assert_called_once_with([2, 3])
+
+    @patch('rcm_model.get_recommendations_batch')
+    def test_get_related_products_batch_clamps_k(self, mock_get_recommendations_batch):
+        mock_get_recommendations_batch.return_value = {1: []}
+        self.app.get('/products/get-related-products-batch?productKeys=1&k=-3')
+        mock_get_recommendations_batch.assert_called_with([1], 1)
+        self.app.get('/products/get-related-products-batch?productKeys=1&k=100000')
+        mock_get_recommendations_batch.assert_called_with([1], server.MAX_RELATED_K)
+
+    def test_get_related_products_batch_missing_keys(self):
+        response = self.app.get('/products/get-related-products-batch')
+        self.assertEqual(response.status_code, 400)
+
     @patch('stripe.PaymentIntent.create')
     def test_create_payment_intent_success(self, mock_payment_intent_create):
         mock_payment_intent_create.return_value = {'status': 'succeeded'}
@@ -270,6 +436,40 @@ class ServerTest(unittest.TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertEqual(json.loads(response.data)['error'], 'Payment error')
 
+    @patch('payments.create_payment_intent')
+    def test_create_payment_intent_timeout(self, mock_create_payment_intent):
+        mock_create_payment_intent.side_effect = payments.PaymentTimeoutError('Payment provider did not answer')
+        response = self.app.post('/users/payment', json={'body': json.dumps({'amount': 100, 'currency': 'usd'})})
+        self.assertEqual(response.status_code, 504)
+
+    @patch('payments.create_payment_intent')
+    def test_create_payment_intent_returns_key_for_retries(self, mock_create_payment_intent):
+        mock_create_payment_intent.return_value = {'status': 'succeeded'}
+        data = {'body': json.dumps({'amount': 100, 'currency': 'usd'})}
+        first = json.loads(self.app.post('/users/payment', json=data).data)['idempotencyKey']
+        second = json.loads(self.app.post('/users/payment', json=data).data)['idempotencyKey']
+        self.assertNotEqual(first, second)
+        response = self.app.post('/users/payment', json=data, headers={'Idempotency-Key': first})
+        self.assertEqual(json.loads(response.data)['idempotencyKey'], first)
+        keys = [call[0][2] for call in mock_create_payment_intent.call_args_list]
+        self.assertEqual(keys[0], keys[2])
+        self.assertNotEqual(keys[0], keys[1])
+        # The client key is never sent to the provider as is
+        self.assertNotIn(first, keys)
+
+    @patch('security.decode_jwt_token')
+    @patch('payments.create_payment_intent')
+    def test_create_payment_intent_keys_orders_by_user(self, mock_create_payment_intent, mock_decode_jwt_token):
+        mock_create_payment_intent.return_value = {'status': 'succeeded'}
+        data = {'body': json.dumps({'amount': 100, 'currency': 'usd', 'orderId': 12})}
+        for userKey in (7, 7, 8):
+            mock_decode_jwt_token.return_value = userKey
+            response = self.app.post('/users/payment', json=data, headers={'Authorization': 'token'})
+            self.assertNotIn('idempotencyKey', json.loads(response.data))
+        keys = [call[0][2] for call in mock_create_payment_intent.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
     def tearDown(self):
         pass
 
@@ -24,6 +24,10 @@ class PaymentScreen extends StatefulWidget {
 
 class _PaymentScreenState extends State<PaymentScreen> {
   bool isLoading = false;
+  // Key of this checkout's payment, resent when the payment is retried
+  String? _idempotencyKey;
+  // Amount and currency the key was issued for
+  String? _idempotencyPayment;
   // Sample payment methods and card details
   List<Map<String, String>> paymentMethods = [
     {
@@ -136,17 +140,25 @@ class _PaymentScreenState extends State<PaymentScreen> {
     );
   }
 
-  dynamic createPaymentIntent(String amount, String currency) {
+  Future<Map<String, dynamic>> createPaymentIntent(String amount, String currency) async {
+    // A different amount is a different payment and needs a new key
+    if (_idempotencyPayment != '$amount $currency') {
+      _idempotencyKey = null;
+      _idempotencyPayment = '$amount $currency';
+    }
     Map<String, dynamic> paymentDetails = {
       'amount': amount,
       'currency': currency
     };
-    return ApiService().createPaymentIntentOnServer(paymentDetails); 
+    final paymentIntentData = await ApiService()
+        .createPaymentIntentOnServer(paymentDetails, idempotencyKey: _idempotencyKey);
+    _idempotencyKey = paymentIntentData['idempotencyKey'] ?? _idempotencyKey;
+    return paymentIntentData;
   }
 
   Future<void> makePayment(BuildContext context) async {
     try {
-      final paymentIntentData = await createPaymentIntent('100', 'USD') ?? {};
+      final paymentIntentData = await createPaymentIntent('100', 'USD');
 
       await Stripe.instance.initPaymentSheet(
         paymentSheetParameters: SetupPaymentSheetParameters(
@@ -166,6 +178,8 @@ class _PaymentScreenState extends State<PaymentScreen> {
   void displayPaymentSheet(BuildContext context) async {
     try {
       await Stripe.instance.presentPaymentSheet().then((value) {
+        // The payment is done: the next one must not reuse its intent
+        _idempotencyKey = null;
         ScaffoldMessenger.of(context).showSnackBar(
           const SnackBar(content: Text("Paid successfully!"))
         );
@@ -32,11 +32,17 @@ class ApiService {
   // final String productBaseUrl = "http://192.168.0.101:8080/products";
   // final String orderBaseUrl = "http://192.168.0.101:8080/orders";
 
-  Future<Map<String, dynamic>> createPaymentIntentOnServer(Map<String, dynamic> paymentDetails) async {
+  // Pass the idempotencyKey returned by a previous attempt of the same checkout
+  // so a retry cannot create a second payment
+  Future<Map<String, dynamic>> createPaymentIntentOnServer(Map<String, dynamic> paymentDetails,
+      {String? idempotencyKey}) async {
     try {
       Map<String, dynamic> data = {"body": jsonEncode(paymentDetails)};
       Response<Map<String, dynamic>> response = await _dio.post('$userBaseUrl/payment', 
-                                                      data:data);
+                                                      data:data,
+                                                      options: Options(headers: {
+                                                        if (idempotencyKey != null) "Idempotency-Key": idempotencyKey,
+                                                      }));
 
       if (response.statusCode == 200) {
         return response.data!;
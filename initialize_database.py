@@ -1,51 +1,205 @@
+import argparse
+import os
+import sys
+import time
 import mysql.connector
 import pandas as pd
 
-mydb = mysql.connector.connect(
-    host="localhost",
-    port=3307, 
-    user="root",
-    password="root", 
-    database="ali33_db"
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+from category_sort_keys import CATEGORY_SORT_KEYS_SQL
 
-mycursor = mydb.cursor()
 
+# table -> (csv file, columns in file order, pandas dtypes)
+TABLES = [
+    ('products', 'products.csv',
+     ['_key', 'productName', 'productDescription', 'productPicture', 'productRating'],
+     {'_key': 'int64', 'productName': 'string', 'productDescription': 'string',
+      'productPicture': 'string', 'productRating': 'float64'}),
+    ('categories', 'categories.csv',
+     ['_key', 'categoryName', 'categoryPicture'],
+     {'_key': 'int64', 'categoryName': 'string', 'categoryPicture': 'string'}),
+    ('product_categories', 'product_categories.csv',
+     ['productKey', 'categoryKey'],
+     {'productKey': 'int64', 'categoryKey': 'int64'}),
+    ('variations', 'variations.csv',
+     ['_key', 'productKey', 'quantity', 'sellingPrice', 'discountPrice', 'offerPrice', 'availabilityQuantity'],
+     {'_key': 'int64', 'productKey': 'int64', 'quantity': 'int64', 'sellingPrice': 'float64',
+      'discountPrice': 'float64', 'offerPrice': 'float64', 'availabilityQuantity': 'int64'}),
+]
 
-products = pd.read_csv('data/products.csv')
-categories = pd.read_csv('data/categories.csv')
-product_categories = pd.read_csv('data/product_categories.csv')
-variations = pd.read_csv('data/variations.csv')
+def chunk_rows(chunk: pd.DataFrame, columns: list) -> list:
+    """
+    Convert a DataFrame chunk to row tuples of plain Python values, column by
+    column, with missing values as None.
+    """
+    values = []
+    for column in columns:
+        series = chunk[column]
+        values.append(series.astype(object).where(series.notna(), None).tolist())
+    return list(zip(*values))
 
-product_data = []
-for index, row in products.iterrows():
-    product_data.append((row[0], row[1], row[2], row[3], row[4]))
 
-category_data = []
-for index, row in categories.iterrows():
-    category_data.append((row[0], row[1], row[2]))
-    
-prod_cat_data = []
-for index, row in product_categories.iterrows():
-    prod_cat_data.append((row[0], row[1]))
-    
-prod_cat_data_converted = [(int(row[0]), int(row[1])) for row in prod_cat_data]
+def secondary_indexes(cursor, table: str) -> dict:
+    """Return index name -> (unique, column list) for the non-primary indexes of a table."""
+    cursor.execute("""
+        SELECT index_name, non_unique, column_name, sub_part
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name <> 'PRIMARY'
+        ORDER BY index_name, seq_in_index
+    """, (table,))
+    indexes = {}
+    for name, non_unique, column, sub_part in cursor.fetchall():
+        unique, columns = indexes.setdefault(name, (not non_unique, []))
+        columns.append(f"`{column}`({sub_part})" if sub_part else f"`{column}`")
+    return indexes
 
-variation_data = []
-for index, row in variations.iterrows():
-    variation_data.append((row[0], row[1], row[2], row[3], row[4], row[5], row[6]))
 
-mycursor.executemany("""INSERT INTO products (_key, productName, productDescription, productPicture,
-       productRating) VALUES (%s, %s, %s, %s, %s);""", product_data)
+def drop_secondary_indexes(cursor, table: str) -> dict:
+    """
+    Drop the secondary indexes of a table so rows load without maintaining them.
 
-mycursor.executemany("""INSERT INTO categories (_key, categoryName, categoryPicture) 
-                     VALUES (%s, %s, %s);""", category_data)
+    Indexes that back a foreign key cannot be dropped and are kept.
 
-mycursor.executemany("""INSERT INTO product_categories (productKey, categoryKey) 
-                     VALUES (%s, %s);""", prod_cat_data_converted)
+    Returns:
+        dict: The dropped indexes, to pass to rebuild_indexes.
+    """
+    dropped = {}
+    for name, definition in secondary_indexes(cursor, table).items():
+        try:
+            cursor.execute(f"ALTER TABLE `{table}` DROP INDEX `{name}`")
+            dropped[name] = definition
+        except mysql.connector.Error:
+            pass
+    return dropped
 
-mycursor.executemany("""INSERT INTO variations (_key, productKey, quantity, sellingPrice, discountPrice,
-       offerPrice, availabilityQuantity) VALUES (%s, %s, %s, %s, %s, %s, %s);""", variation_data)
 
-mydb.commit()
-mydb.close()
\ No newline at end of file
+def rebuild_indexes_sql(table: str, indexes: dict) -> str:
+    """The single ALTER TABLE recreating dropped indexes, so the table is sorted once per index."""
+    clauses = [f"ADD {'UNIQUE ' if unique else ''}INDEX `{name}` ({', '.join(columns)})"
+               for name, (unique, columns) in indexes.items()]
+    return f"ALTER TABLE `{table}` {', '.join(clauses)}"
+
+
+def rebuild_indexes(cursor, table: str, indexes: dict):
+    """
+    Recreate dropped indexes. If that fails, print the statement that does it,
+    since the table would otherwise be left without them.
+    """
+    if not indexes:
+        return
+    statement = rebuild_indexes_sql(table, indexes)
+    try:
+        cursor.execute(statement)
+    except mysql.connector.Error:
+        print(f"{table}: failed to rebuild the dropped indexes, run:\n{statement};")
+        raise
+
+
+def insert_csv(connection, table: str, path: str, columns: list, dtypes: dict,
+               chunk_size: int, batch_size: int) -> int:
+    """Stream a CSV into a table in chunks, inserting ``batch_size`` rows per statement."""
+    cursor = connection.cursor()
+    query = (f"INSERT INTO `{table}` ({', '.join(columns)}) "
+             f"VALUES ({', '.join(['%s'] * len(columns))})")
+    rows_loaded = 0
+    try:
+        for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunk_size, keep_default_na=False,
+                                 na_values=['']):
+            rows = chunk_rows(chunk, columns)
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(query, rows[start:start + batch_size])
+            # One commit per chunk keeps the transaction and undo log small
+            connection.commit()
+            rows_loaded += len(rows)
+    finally:
+        cursor.close()
+    return rows_loaded
+
+
+def load_data_infile(connection, table: str, path: str, columns: list) -> int:
+    """Load a CSV with LOAD DATA LOCAL INFILE, letting the server parse it."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE `{table}`
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n'
+            IGNORE 1 LINES
+            ({', '.join(columns)})
+        """, (os.path.abspath(path),))
+        connection.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the catalog CSV files into the database.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3307)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='root')
+    parser.add_argument('--database', default='ali33_db')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--chunk-size', type=int, default=50000, help="CSV rows read and committed at a time.")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT statement.")
+    parser.add_argument('--load-data', action='store_true',
+                        help="Use LOAD DATA LOCAL INFILE (needs local_infile enabled on the server).")
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help="Maintain secondary indexes during the load instead of rebuilding them after.")
+    args = parser.parse_args()
+
+    mydb = mysql.connector.connect(
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        password=args.password,
+        database=args.database,
+        allow_local_infile=args.load_data
+    )
+    mycursor = mydb.cursor()
+    # Every row comes from a consistent export: skip per-row checks during the load
+    mycursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+
+    total_rows = 0
+    total_start = time.perf_counter()
+    try:
+        for table, file_name, columns, dtypes in TABLES:
+            path = os.path.join(args.data_dir, file_name)
+            if not os.path.exists(path):
+                print(f"{table}: skipped, {path} not found")
+                continue
+
+            start = time.perf_counter()
+            dropped = {} if args.keep_indexes else drop_secondary_indexes(mycursor, table)
+            try:
+                if args.load_data:
+                    rows = load_data_infile(mydb, table, path, columns)
+                else:
+                    rows = insert_csv(mydb, table, path, columns, dtypes, args.chunk_size, args.batch_size)
+                load_time = time.perf_counter() - start
+            finally:
+                # Also after a failed load: the indexes, UNIQUE ones included, must come back
+                rebuild_indexes(mycursor, table, dropped)
+            elapsed = time.perf_counter() - start
+
+            total_rows += rows
+            print(f"{table}: {rows} rows in {elapsed:.1f}s ({rows / max(load_time, 1e-9):,.0f} rows/s loading, "
+                  f"{elapsed - load_time:.1f}s rebuilding {len(dropped)} indexes)")
+
+        start = time.perf_counter()
+        mycursor.execute(CATEGORY_SORT_KEYS_SQL)
+        mydb.commit()
+        print(f"category sort keys: {time.perf_counter() - start:.1f}s")
+    finally:
+        mycursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+        mycursor.close()
+        mydb.close()
+
+    elapsed = time.perf_counter() - total_start
+    print(f"Loaded {total_rows} rows in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()